@@ -9,19 +9,97 @@ class Settings(BaseModel):
     aws_region: str = os.getenv("AWS_REGION", "us-east-1")
     s3_bucket: str = os.getenv("S3_BUCKET", "deepguard-ingestion")
     s3_preproc_prefix: str = os.getenv("S3_PREPROC_PREFIX", "preprocessed")
+    s3_endpoint_url: str | None = os.getenv("S3_ENDPOINT_URL")  # local S3 (minio, moto server) for dev/benchmarks
+    s3_upload_concurrency: int = int(os.getenv("S3_UPLOAD_CONCURRENCY", "16"))  # objects uploaded in parallel per process
+    s3_max_pool_connections: int = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "64"))
+    s3_transfer_concurrency: int = int(os.getenv("S3_TRANSFER_CONCURRENCY", "8"))  # parts in flight per multipart transfer
+    s3_multipart_threshold_mb: int = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16"))
+    s3_multipart_chunksize_mb: int = int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", "16"))
 
     # Kafka
     kafka_bootstrap: str = os.getenv("KAFKA_BOOTSTRAP", "kafka:9092")
-    topic_video_submitted: str = os.getenv("TOPIC_VIDEO_SUBMITTED", "video.submitted")
+    topic_video_submitted: str = os.getenv("TOPIC_VIDEO_SUBMITTED", "video.submitted")  # small lane
+    topic_video_submitted_large: str = os.getenv("TOPIC_VIDEO_SUBMITTED_LARGE", "video.submitted.large")  # large lane
     topic_video_preprocessed: str = os.getenv("TOPIC_VIDEO_PREPROCESSED", "video.preprocessed")
     consumer_group: str = os.getenv("KAFKA_CONSUMER_GROUP", "preprocessing-workers")
 
+    # Worker concurrency (1 = process one message at a time, as before)
+    worker_concurrency: int = int(os.getenv("WORKER_CONCURRENCY", "1"))  # jobs in flight / job processes
+    max_inflight_per_partition: int = int(os.getenv("MAX_INFLIGHT_PER_PARTITION", "4"))
+    worker_lanes: str = os.getenv("WORKER_LANES", "small:3,large:1")  # lane:weight consumed by this worker, first lane first (see lanes.py)
+    lane_reserved_slots: int = int(os.getenv("LANE_RESERVED_SLOTS", "1"))  # job slots only the first lane may use
+    metrics_port: int = int(os.getenv("METRICS_PORT", "9108"))  # Prometheus /metrics; 0 disables
+    metrics_lag_interval_s: float = float(os.getenv("METRICS_LAG_INTERVAL_S", "15"))
+    metadata_timing: bool = os.getenv("METADATA_TIMING", "false").lower() == "true"  # per-stage timing in metadata.json
+    job_state_flush_ms: int = int(os.getenv("JOB_STATE_FLUSH_MS", "20"))  # linger to batch status updates across jobs
+    job_state_max_batch: int = int(os.getenv("JOB_STATE_MAX_BATCH", "500"))
+    commit_interval_ms: int = int(os.getenv("COMMIT_INTERVAL_MS", "1000"))  # async offset commit batching
+
     # Processing controls
     frame_rate: float = float(os.getenv("FRAME_RATE", "1"))  # frames per second to extract
     max_frames: int = int(os.getenv("MAX_FRAMES", "120"))  # cap extraction cost
+    frame_sampling: str = os.getenv("FRAME_SAMPLING", "fps")  # fps | keyframes | scene | uniform (see processor.SAMPLING_MODES)
+    scene_threshold: float = float(os.getenv("SCENE_THRESHOLD", "0.3"))  # scene sampling: ffmpeg scene score (0-1) for a cut
+    scene_score_fps: float = float(os.getenv("SCENE_SCORE_FPS", "4"))  # scene sampling: frames/s scored for cuts
+    uniform_seek_min_interval_s: float = float(os.getenv("UNIFORM_SEEK_MIN_INTERVAL_S", "10"))  # uniform: seek per frame when this far apart, else decode through
+    frame_seek_concurrency: int = int(os.getenv("FRAME_SEEK_CONCURRENCY", "4"))  # uniform: seeks (ffmpeg processes) in parallel
     face_detect_sample: int = int(os.getenv("FACE_DETECT_SAMPLE", "30"))  # run face detection for N frames max
+    face_detect_batch: int = int(os.getenv("FACE_DETECT_BATCH", "16"))  # frames per detector call
+    face_detect_mode: str = os.getenv("FACE_DETECT_MODE", "sample")  # sample: first FACE_DETECT_SAMPLE frames; track: all frames, detect-then-track
+    face_track_interval: int = int(os.getenv("FACE_TRACK_INTERVAL", "5"))  # track: detector on every Nth frame
+    face_track_min_score: float = float(os.getenv("FACE_TRACK_MIN_SCORE", "0.6"))  # track: template match below this re-detects
+    face_track_iou: float = float(os.getenv("FACE_TRACK_IOU", "0.3"))  # track: min IoU to keep a track_id across detections
+    face_track_search: float = float(os.getenv("FACE_TRACK_SEARCH", "0.5"))  # track: search margin around a face, in face sizes
+    frame_transport: str = os.getenv("FRAME_TRANSPORT", "raw")  # raw: rgb24 over a pipe into memory; jpeg: files in WORK_DIR
+    frame_artifact_format: str = os.getenv("FRAME_ARTIFACT_FORMAT", "objects")  # objects: one JPEG per frame; raw / jpeg: single packed shard + index
+    fused_decode: bool = os.getenv("FUSED_DECODE", "true").lower() == "true"  # one ffmpeg decode for video/frames/audio
+    standardize_remux: bool = os.getenv("STANDARDIZE_REMUX", "true").lower() == "true"  # stream-copy sources that already meet the standard profile
+    remux_max_fps: float = float(os.getenv("REMUX_MAX_FPS", "30"))  # faster sources are transcoded to 30fps
+    segment_transcode: bool = os.getenv("SEGMENT_TRANSCODE", "false").lower() == "true"  # transcode long sources as parallel keyframe-aligned segments
+    segment_min_s: float = float(os.getenv("SEGMENT_MIN_S", "60"))  # shortest segment; shorter sources get fewer segments
+    segment_max_workers: int = int(os.getenv("SEGMENT_MAX_WORKERS", "0"))  # segments encoded at once; 0 = cores / WORKER_CONCURRENCY
+
+    # Face model (loaded once per worker process)
+    face_model_name: str = os.getenv("FACE_MODEL_NAME", "buffalo_l")
+    face_modules: str = os.getenv("FACE_MODULES", "detection")  # comma-separated insightface modules to load
+    face_det_size: int = int(os.getenv("FACE_DET_SIZE", "224"))
+    face_ctx_id: int = int(os.getenv("FACE_CTX_ID", "0"))  # -1 forces CPU
+    ort_providers: str = os.getenv("ORT_PROVIDERS", "")  # e.g. "CUDAExecutionProvider,CPUExecutionProvider"; empty = insightface default
+    ort_intra_op_threads: int = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))  # 0 = ONNX Runtime default
+    ort_inter_op_threads: int = int(os.getenv("ORT_INTER_OP_THREADS", "0"))
+
+    # Streaming source input (S3 -> ffmpeg stdin); only faststart mp4/mov streams, anything else is downloaded
+    stream_input: bool = os.getenv("STREAM_INPUT", "true").lower() == "true"
+    stream_input_min_mb: int = int(os.getenv("STREAM_INPUT_MIN_MB", "64"))  # smaller sources are downloaded
+    stream_part_mb: int = int(os.getenv("STREAM_PART_MB", "8"))  # ranged GET size
+    stream_readahead_parts: int = int(os.getenv("STREAM_READAHEAD_PARTS", "4"))  # parallel GETs / parts buffered
+    stream_probe_mb: int = int(os.getenv("STREAM_PROBE_MB", "4"))  # leading bytes handed to ffprobe
+
+    # Content-hash dedup cache (shared with ingestion)
+    content_cache_enabled: bool = os.getenv("CONTENT_CACHE_ENABLED", "true").lower() == "true"
+    content_cache_scope: str = os.getenv("CONTENT_CACHE_SCOPE", "user")  # user: entries shared by one submitter's jobs only; global: all (artifacts must be shareable)
+    content_cache_ttl_hours: int = int(os.getenv("CONTENT_CACHE_TTL_HOURS", str(30 * 24)))  # evict entries unused this long
+    content_cache_max_entries: int = int(os.getenv("CONTENT_CACHE_MAX_ENTRIES", "1000000"))  # LRU cap
+    content_cache_evict_interval_s: int = int(os.getenv("CONTENT_CACHE_EVICT_INTERVAL_S", "3600"))
+
+    # Near-duplicate index over frame pHashes
+    # reuse trusts frame pHashes, which do not see local edits such as a face swap: keep it off where sources are untrusted
+    near_dup_mode: str = os.getenv("NEAR_DUP_MODE", "annotate")  # off | annotate (record matches) | reuse (skip work, reuse artifacts); matches stay within CONTENT_CACHE_SCOPE
+    near_dup_radius: int = int(os.getenv("NEAR_DUP_RADIUS", "6"))  # max Hamming distance between matching frames
+    near_dup_min_ratio: float = float(os.getenv("NEAR_DUP_MIN_RATIO", "0.8"))  # share of frames that must match, on both sides
+    near_dup_reuse_max_duration_diff_s: float = float(os.getenv("NEAR_DUP_REUSE_MAX_DURATION_DIFF_S", "1"))  # reuse: durations must agree this closely
+    near_dup_probe_frames: int = int(os.getenv("NEAR_DUP_PROBE_FRAMES", "8"))  # query frames also probed within NEAR_DUP_RADIUS // 4 bits per chunk
+    near_dup_max_videos: int = int(os.getenv("NEAR_DUP_MAX_VIDEOS", "20"))  # candidate videos verified per lookup
 
     # Paths
-    work_dir: str = os.getenv("WORK_DIR", "/tmp/preproc")
+    work_dir: str = os.getenv("WORK_DIR", "/tmp/preproc")  # per worker; emptied at startup
+
+    # Scratch space (see scratch.py)
+    scratch_budget_mb: int = int(os.getenv("SCRATCH_BUDGET_MB", "0"))  # WORK_DIR space reserved by jobs at once; 0 = 90% of free space at startup
+    scratch_size_factor: float = float(os.getenv("SCRATCH_SIZE_FACTOR", "3"))  # reservation = source size x this + SCRATCH_JOB_OVERHEAD_MB
+    scratch_job_overhead_mb: int = int(os.getenv("SCRATCH_JOB_OVERHEAD_MB", "128"))  # audio, frames, shard
+    scratch_tmpfs_dir: str = os.getenv("SCRATCH_TMPFS_DIR", "")  # e.g. /dev/shm/preproc for small jobs; empty disables
+    scratch_tmpfs_budget_mb: int = int(os.getenv("SCRATCH_TMPFS_BUDGET_MB", "1024"))  # counts against memory
+    scratch_tmpfs_max_job_mb: int = int(os.getenv("SCRATCH_TMPFS_MAX_JOB_MB", "256"))  # larger reservations go to WORK_DIR
 
 settings = Settings()  # type: ignore
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from .config import settings
+from .models import ContentCache
+
+logger = logging.getLogger("preprocessing-worker")
+
+_evict_lock = threading.Lock()
+_last_evict = 0.0
+
+# Settings that change the published artifacts. Entries made under other
+# values are not served, and are replaced by the next job's artifacts.
+ARTIFACT_SETTINGS = (
+    "frame_rate",
+    "max_frames",
+    "frame_sampling",
+    "scene_threshold",
+    "scene_score_fps",
+    "face_detect_sample",
+    "face_detect_mode",
+    "face_track_interval",
+    "face_track_min_score",
+    "face_track_iou",
+    "face_track_search",
+    "frame_artifact_format",
+    "standardize_remux",
+    "remux_max_fps",
+    "face_model_name",
+    "face_modules",
+    "face_det_size",
+)
+
+
+def artifacts_version() -> str:
+    values = {name: getattr(settings, name) for name in ARTIFACT_SETTINGS}
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def cache_scope(user_id: Optional[int]) -> Optional[str]:
+    # Entries are shared only between jobs of the same submitter, unless
+    # CONTENT_CACHE_SCOPE=global declares all artifacts shareable.
+    # None: the job neither reads nor writes the cache (anonymous submissions).
+    if settings.content_cache_scope == "global":
+        return "global"
+    return f"user:{user_id}" if user_id else None
+
+
+def lookup_artifacts(db, scope: str, content_sha256: str) -> Optional[dict]:
+    # Artifacts of an earlier job in the scope with byte-identical input, made
+    # with the current artifact settings, if any
+    artifacts_json = db.execute(
+        select(ContentCache.artifacts_json).where(
+            ContentCache.scope == scope,
+            ContentCache.content_sha256 == content_sha256,
+            ContentCache.artifacts_json.is_not(None),
+            ContentCache.artifacts_version == artifacts_version(),
+        )
+    ).scalar_one_or_none()
+    if artifacts_json is None:
+        return None
+    db.execute(
+        update(ContentCache)
+        .where(ContentCache.scope == scope, ContentCache.content_sha256 == content_sha256)
+        .values(last_used_at=datetime.utcnow(), hit_count=ContentCache.hit_count + 1)
+    )
+    try:
+        return json.loads(artifacts_json)
+    except ValueError:
+        return None
+
+
+def store_artifacts(db, scope: str, content_sha256: str, s3_url: str, job_id: str, artifacts: dict) -> None:
+    # Identical jobs that ran concurrently both get here; the first one to
+    # store artifacts wins and later writers leave the entry alone, unless
+    # it was made with other artifact settings.
+    now = datetime.utcnow()
+    version = artifacts_version()
+    stmt = insert(ContentCache).values(
+        scope=scope,
+        content_sha256=content_sha256,
+        source_s3_url=s3_url,
+        job_id=job_id,
+        artifacts_json=json.dumps(artifacts),
+        artifacts_version=version,
+        hit_count=0,
+        created_at=now,
+        last_used_at=now,
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ContentCache.scope, ContentCache.content_sha256],
+            set_={
+                "job_id": stmt.excluded.job_id,
+                "artifacts_json": stmt.excluded.artifacts_json,
+                "artifacts_version": stmt.excluded.artifacts_version,
+                "last_used_at": stmt.excluded.last_used_at,
+            },
+            where=or_(
+                ContentCache.artifacts_json.is_(None),
+                ContentCache.artifacts_version.is_distinct_from(version),
+            ),
+        )
+    )
+
+
+def evict(db) -> int:
+    # Drop entries unused for longer than the TTL, then the least recently used
+    # ones beyond the size cap
+    removed = db.execute(
+        delete(ContentCache).where(
+            ContentCache.last_used_at < datetime.utcnow() - timedelta(hours=settings.content_cache_ttl_hours)
+        )
+    ).rowcount or 0
+    cutoff = db.execute(
+        select(ContentCache.last_used_at)
+        .order_by(ContentCache.last_used_at.desc())
+        .offset(settings.content_cache_max_entries)
+        .limit(1)
+    ).scalar_one_or_none()
+    if cutoff is not None:
+        removed += db.execute(delete(ContentCache).where(ContentCache.last_used_at <= cutoff)).rowcount or 0
+    return removed
+
+
+def maybe_evict(session_factory) -> None:
+    # At most one eviction pass per interval per process
+    global _last_evict
+    if time.monotonic() - _last_evict < settings.content_cache_evict_interval_s:
+        return
+    if not _evict_lock.acquire(blocking=False):
+        return
+    try:
+        _last_evict = time.monotonic()
+        db = session_factory()
+        try:
+            removed = evict(db)
+            db.commit()
+            if removed:
+                logger.info("Evicted %d content cache entries", removed)
+        except Exception:
+            db.rollback()
+            logger.exception("Content cache eviction failed")
+        finally:
+            db.close()
+    finally:
+        _evict_lock.release()
@@ -0,0 +1,218 @@
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import insightface  # uses RetinaFace by default in FaceAnalysis
+except Exception:  # pragma: no cover
+    insightface = None  # type: ignore
+
+try:
+    import onnxruntime as ort
+except Exception:  # pragma: no cover
+    ort = None  # type: ignore
+
+from .config import settings
+
+logger = logging.getLogger("preprocessing-worker")
+
+# One FaceAnalysis per worker process, shared by every job it runs
+_analyzer = None
+_lock = threading.Lock()
+
+
+def _split_csv(value: str) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def _providers() -> Optional[List[str]]:
+    requested = _split_csv(settings.ort_providers)
+    if not requested or ort is None:
+        return None  # insightface default
+    available = set(ort.get_available_providers())
+    providers = [p for p in requested if p in available]
+    missing = [p for p in requested if p not in available]
+    if missing:
+        logger.warning("ONNX Runtime providers not available, ignoring: %s", ",".join(missing))
+    return providers or ["CPUExecutionProvider"]
+
+
+def _session_options():
+    so = ort.SessionOptions()
+    if settings.ort_intra_op_threads > 0:
+        so.intra_op_num_threads = settings.ort_intra_op_threads
+    if settings.ort_inter_op_threads > 0:
+        so.inter_op_num_threads = settings.ort_inter_op_threads
+    return so
+
+
+def _pin_sessions(fa, providers: Optional[List[str]]) -> None:
+    # insightface 0.7 does not forward SessionOptions to ONNX Runtime, so rebuild
+    # each model's session with the pinned thread counts.
+    so = _session_options()
+    for model in fa.models.values():
+        model.session = ort.InferenceSession(
+            model.model_file,
+            sess_options=so,
+            providers=providers or model.session.get_providers(),
+        )
+
+
+def _load():
+    providers = _providers()
+    kwargs = {"providers": providers} if providers else {}
+    allowed = _split_csv(settings.face_modules) or None
+    fa = insightface.app.FaceAnalysis(name=settings.face_model_name, allowed_modules=allowed, **kwargs)
+    if ort is not None and (settings.ort_intra_op_threads > 0 or settings.ort_inter_op_threads > 0):
+        _pin_sessions(fa, providers)
+    size = settings.face_det_size
+    fa.prepare(ctx_id=settings.face_ctx_id, det_size=(size, size))
+    return fa
+
+
+def get_face_analyzer():
+    global _analyzer
+    if _analyzer is not None:
+        return _analyzer
+    if insightface is None:
+        return None
+    with _lock:
+        if _analyzer is None:
+            _analyzer = _load()
+            logger.info(
+                "Loaded face model %s (modules=%s providers=%s)",
+                settings.face_model_name,
+                ",".join(sorted(_analyzer.models)),
+                settings.ort_providers or "default",
+            )
+    return _analyzer
+
+
+def warmup() -> None:
+    # Load the model and run one inference so session setup and allocator
+    # growth happen before the first job is consumed.
+    try:
+        fa = get_face_analyzer()
+    except Exception:
+        logger.exception("Failed to load face model")
+        return
+    if fa is None:
+        logger.warning("insightface not installed, face detection disabled")
+        return
+    size = settings.face_det_size
+    fa.get(np.zeros((size, size, 3), dtype=np.uint8))
+
+
+# ---- Batched detection -------------------------------------------------------
+#
+# FaceAnalysis.get() runs one image per ONNX call and post-processes every face
+# with Python loops. For our fixed-size frames we can instead feed the RetinaFace
+# (SCRFD) detector a stacked (N, 3, H, W) blob and decode all anchors of the batch
+# with array ops.
+
+def _nms(dets: np.ndarray, thresh: float) -> np.ndarray:
+    x1, y1, x2, y2, scores = dets[:, 0], dets[:, 1], dets[:, 2], dets[:, 3], dets[:, 4]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+        inter = np.maximum(0.0, xx2 - xx1 + 1) * np.maximum(0.0, yy2 - yy1 + 1)
+        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+        order = order[np.where(ovr <= thresh)[0] + 1]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def _anchor_centers(det, height: int, width: int, stride: int) -> np.ndarray:
+    key = (height, width, stride)
+    centers = det.center_cache.get(key)
+    if centers is None:
+        centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
+        centers = (centers * stride).reshape((-1, 2))
+        if det._num_anchors > 1:
+            centers = np.stack([centers] * det._num_anchors, axis=1).reshape((-1, 2))
+        if len(det.center_cache) < 100:
+            det.center_cache[key] = centers
+    return centers
+
+
+def _letterbox(frames: np.ndarray, size: int) -> Tuple[np.ndarray, float]:
+    # Same aspect-preserving resize + top-left pad as SCRFD.detect; a no-op for
+    # frames that already match the detector input size.
+    n, h, w, _ = frames.shape
+    if h == size and w == size:
+        return frames, 1.0
+    import cv2
+
+    scale = min(size / h, size / w)
+    nh, nw = int(h * scale), int(w * scale)
+    canvas = np.zeros((n, size, size, 3), dtype=np.uint8)
+    for i in range(n):
+        canvas[i, :nh, :nw] = cv2.resize(frames[i], (nw, nh))
+    return canvas, scale
+
+
+def _run_detector(det, blob: np.ndarray) -> List[np.ndarray]:
+    # Models exported with a dynamic batch axis take the whole stack in one call;
+    # fixed batch-1 exports get one call per frame with the outputs stacked.
+    batch_dim = det.session.get_inputs()[0].shape[0]
+    n = blob.shape[0]
+    if not isinstance(batch_dim, int) or batch_dim == n:
+        outs = det.session.run(det.output_names, {det.input_name: blob})
+        return [o.reshape(n, -1, o.shape[-1]) for o in outs]
+    per_frame = [det.session.run(det.output_names, {det.input_name: blob[i:i + 1]}) for i in range(n)]
+    return [
+        np.stack([outs[k].reshape(-1, outs[k].shape[-1]) for outs in per_frame])
+        for k in range(len(det.output_names))
+    ]
+
+
+def detect_batch(det, frames: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    # frames: (N, H, W, 3) uint8 RGB. Returns one (bboxes (F, 4), scores (F,),
+    # kps (F, 5, 2)) tuple per frame, in frame coordinates.
+    size = det.input_size[0] if det.input_size else settings.face_det_size
+    det_img, det_scale = _letterbox(frames, size)
+    blob = np.ascontiguousarray(
+        ((det_img.astype(np.float32) - det.input_mean) / det.input_std).transpose(0, 3, 1, 2)
+    )
+    net_outs = _run_detector(det, blob)
+    n = blob.shape[0]
+    fmc = det.fmc
+
+    all_scores, all_boxes, all_kps = [], [], []
+    for idx, stride in enumerate(det._feat_stride_fpn):
+        scores = net_outs[idx][..., 0]  # (N, A)
+        dist = net_outs[idx + fmc] * stride  # (N, A, 4)
+        centers = _anchor_centers(det, blob.shape[2] // stride, blob.shape[3] // stride, stride)
+        boxes = np.concatenate([centers - dist[..., :2], centers + dist[..., 2:]], axis=-1)
+        all_scores.append(scores)
+        all_boxes.append(boxes)
+        if det.use_kps:
+            kdist = (net_outs[idx + fmc * 2] * stride).reshape(n, -1, 5, 2)
+            all_kps.append(centers[None, :, None, :] + kdist)
+
+    scores = np.concatenate(all_scores, axis=1)
+    boxes = np.concatenate(all_boxes, axis=1) / det_scale
+    kps = np.concatenate(all_kps, axis=1) / det_scale if all_kps else None
+
+    out = []
+    for i in range(n):
+        sel = np.flatnonzero(scores[i] >= det.det_thresh)
+        s = scores[i, sel]
+        b = boxes[i, sel]
+        keep = _nms(np.hstack([b, s[:, None]]).astype(np.float32, copy=False), det.nms_thresh)
+        k = kps[i, sel][keep] if kps is not None else np.zeros((len(keep), 5, 2), dtype=np.float32)
+        out.append((b[keep], s[keep], k))
+    return out
+
+
+def supports_batch(fa) -> bool:
+    det = getattr(fa, "det_model", None)
+    return det is not None and hasattr(det, "_feat_stride_fpn")
@@ -0,0 +1,158 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from .config import settings
+
+# Detect-then-track: the detector runs on every FACE_TRACK_INTERVAL-th frame and
+# faces are carried through the frames in between by template matching in a
+# window around their last position. Detections are associated with running
+# tracks by IoU so a face keeps its track_id across re-detections. A match
+# scoring under FACE_TRACK_MIN_SCORE (occlusion, cut, fast motion) ends the
+# track and the detector runs on that frame instead.
+
+# (boxes (F, 4), scores (F,), kps (F, 5, 2)) per frame, as from face_models.detect_batch
+Detection = Tuple[np.ndarray, np.ndarray, np.ndarray]
+Detect = Callable[[List[int]], List[Detection]]
+
+_MIN_TEMPLATE = 6  # px; smaller faces are detected but not tracked
+
+
+@dataclass
+class _Track:
+    track_id: int
+    bbox: np.ndarray  # (4,) x1, y1, x2, y2
+    kps: np.ndarray  # (5, 2)
+    det_score: float
+    template: np.ndarray  # grayscale patch at the last detection
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # (A, 4) x (B, 4) -> (A, B)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def _clip_box(bbox: np.ndarray, h: int, w: int) -> Tuple[int, int, int, int]:
+    x1, y1, x2, y2 = np.round(bbox).astype(int)
+    return max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+
+
+def _template(gray: np.ndarray, bbox: np.ndarray) -> np.ndarray:
+    x1, y1, x2, y2 = _clip_box(bbox, *gray.shape)
+    return gray[y1:y2, x1:x2].copy()
+
+
+def _follow(gray: np.ndarray, track: _Track) -> Tuple[float, float, float]:
+    # Best (dx, dy, score) for the track's template within a window around its box
+    th, tw = track.template.shape
+    if th < _MIN_TEMPLATE or tw < _MIN_TEMPLATE:
+        return 0.0, 0.0, 0.0
+    h, w = gray.shape
+    x1, y1, x2, y2 = _clip_box(track.bbox, h, w)
+    mx = int(tw * settings.face_track_search) + 1
+    my = int(th * settings.face_track_search) + 1
+    wx1, wy1 = max(x1 - mx, 0), max(y1 - my, 0)
+    wx2, wy2 = min(x1 + tw + mx, w), min(y1 + th + my, h)
+    window = gray[wy1:wy2, wx1:wx2]
+    if window.shape[0] < th or window.shape[1] < tw:
+        return 0.0, 0.0, 0.0
+    res = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+    _, score, _, (bx, by) = cv2.minMaxLoc(res)
+    return float(wx1 + bx - x1), float(wy1 + by - y1), float(score)
+
+
+def _associate(tracks: List[_Track], boxes: np.ndarray) -> Dict[int, int]:
+    # Greedy IoU matching, best pairs first: detection index -> track index
+    if not tracks or not len(boxes):
+        return {}
+    iou = _iou(boxes, np.stack([t.bbox for t in tracks]))
+    matches: Dict[int, int] = {}
+    used = set()
+    for d, t in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+        if iou[d, t] < settings.face_track_iou:
+            break
+        if d in matches or t in used:
+            continue
+        matches[int(d)] = int(t)
+        used.add(int(t))
+    return matches
+
+
+def track_faces(frames: np.ndarray, detect: Detect, interval: int) -> Tuple[List[List[Dict]], int]:
+    # frames: (N, H, W, 3) uint8 RGB. Returns the faces of every frame, and the
+    # number of frames the detector ran on. Items carry the face_models fields
+    # plus track_id, source ("detect" | "track") and, when tracked, track_score.
+    n = len(frames)
+    interval = max(1, interval)
+    scheduled = list(range(0, n, interval))
+    # Scheduled detections go through the detector in batches up front;
+    # re-detections after a lost track are one frame each.
+    detections: Dict[int, Detection] = {}
+    batch = max(1, settings.face_detect_batch)
+    for start in range(0, len(scheduled), batch):
+        idx = scheduled[start:start + batch]
+        detections.update(zip(idx, detect(idx)))
+
+    out: List[List[Dict]] = []
+    tracks: List[_Track] = []
+    next_id = 0
+    detected = len(scheduled)
+    for i in range(n):
+        gray = cv2.cvtColor(frames[i], cv2.COLOR_RGB2GRAY)
+        lost = False
+        if i not in detections:
+            moved = []
+            for t in tracks:
+                dx, dy, score = _follow(gray, t)
+                if score < settings.face_track_min_score:
+                    lost = True
+                    break
+                moved.append((t, dx, dy, score))
+            if not lost:
+                items = []
+                for t, dx, dy, score in moved:
+                    t.bbox = t.bbox + np.array([dx, dy, dx, dy], dtype=t.bbox.dtype)
+                    t.kps = t.kps + np.array([dx, dy], dtype=t.kps.dtype)
+                    items.append({
+                        "bbox": t.bbox.astype(float).tolist(),
+                        "kps": t.kps.astype(float).tolist(),
+                        "det_score": t.det_score,
+                        "track_id": t.track_id,
+                        "source": "track",
+                        "track_score": round(score, 4),
+                    })
+                out.append(items)
+                continue
+            detections[i] = detect([i])[0]
+            detected += 1
+
+        boxes, scores, kps = detections.pop(i)
+        matches = _associate(tracks, boxes)
+        new_tracks: List[_Track] = []
+        items = []
+        for d in range(len(boxes)):
+            if d in matches:
+                track_id = tracks[matches[d]].track_id
+            else:
+                track_id, next_id = next_id, next_id + 1
+            bbox = np.asarray(boxes[d], dtype=np.float32)
+            new_tracks.append(_Track(track_id, bbox, np.asarray(kps[d], dtype=np.float32), float(scores[d]), _template(gray, bbox)))
+            items.append({
+                "bbox": bbox.astype(float).tolist(),
+                "kps": np.asarray(kps[d]).astype(float).tolist(),
+                "det_score": float(scores[d]),
+                "track_id": track_id,
+                "source": "detect",
+            })
+        tracks = new_tracks
+        out.append(items)
+    return out, detected
@@ -0,0 +1,231 @@
+import json
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import case, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from .config import settings
+from .models import Job
+
+logger = logging.getLogger("preprocessing-worker")
+
+# Job status transitions from all in-flight jobs are queued and written by one
+# thread: every flush is a single transaction with at most one statement per
+# kind of transition, each an UPDATE ... WHERE job_id IN (...) guarded on the
+# current status, instead of a SELECT and a commit per step per job.
+#
+#   claim        -> "preprocessing"  unless already preprocessed/failed, or its
+#                                    message was reported to the client as
+#                                    publish_failed (a late delivery); a job
+#                                    with no row yet (ingestion creates it first)
+#                                    is inserted as "preprocessing"
+#   preprocessed -> "preprocessed"   unless already preprocessed/failed
+#   failed       -> "failed"         unless already failed
+#
+# A flush that fails is retried one transition per transaction, so a single
+# bad row fails only its own job.
+
+TERMINAL = ("preprocessed", "failed")
+UNCLAIMABLE = TERMINAL + ("publish_failed",)
+_CLAIM_COLUMNS = (Job.job_id, Job.content_sha256, Job.content_type, Job.user_id)
+
+
+class Claim(NamedTuple):
+    claimed: bool  # False: the job is already terminal (or publish_failed)
+    content_sha256: Optional[str] = None
+    content_type: Optional[str] = None
+    user_id: Optional[int] = None  # submitter; scopes the content cache
+
+
+@dataclass
+class _Op:
+    kind: str  # claim | preprocessed | failed
+    job_id: str
+    s3_url: Optional[str] = None
+    artifacts_json: Optional[str] = None
+    error: Optional[str] = None
+    future: Future = field(default_factory=Future)
+
+
+class JobStateWriter:
+    def __init__(self, session_factory, inflight: Optional[Callable[[], int]] = None):
+        # inflight: jobs in flight in this worker. Lingering for transitions of
+        # other jobs only pays off when there are any.
+        self._session_factory = session_factory
+        self._inflight = inflight
+        self._queue: "queue.Queue[Optional[_Op]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # -- callers (job threads); each blocks until its batch is committed --
+
+    def claim(self, job_id: str, s3_url: str) -> Claim:
+        return self._submit(_Op("claim", job_id, s3_url=s3_url))
+
+    def preprocessed(self, job_id: str, artifacts: dict) -> bool:
+        try:
+            artifacts_json = json.dumps(artifacts)
+        except Exception:
+            artifacts_json = None
+        return self._submit(_Op("preprocessed", job_id, artifacts_json=artifacts_json))
+
+    def failed(self, job_id: str, error: str) -> bool:
+        return self._submit(_Op("failed", job_id, error=error[:2000]))
+
+    def _submit(self, op: _Op):
+        self._ensure_started()
+        self._queue.put(op)
+        return op.future.result()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="job-state", daemon=True)
+                    self._thread.start()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    # -- writer thread --
+
+    def _run(self) -> None:
+        window = settings.job_state_flush_ms / 1000.0
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            batch = [op]
+            stop = False
+            # Linger briefly so transitions from other job threads share the
+            # flush; alone, only take what is already queued
+            linger = window if self._inflight is None or self._inflight() > 1 else 0
+            while len(batch) < settings.job_state_max_batch:
+                try:
+                    op = self._queue.get(timeout=linger) if linger else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: List[_Op]) -> None:
+        db = self._session_factory()
+        try:
+            results = self._write(db, batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            if len(batch) > 1:
+                logger.warning("Job state flush of %d transitions failed, retrying one by one: %s", len(batch), e)
+            else:
+                logger.warning("Job state transition %s of job %s failed: %s", batch[0].kind, batch[0].job_id, e)
+                batch[0].future.set_exception(e)
+                return
+        else:
+            for op in batch:
+                op.future.set_result(results[id(op)])
+            return
+        finally:
+            db.close()
+        for op in batch:
+            self._flush([op])
+
+    def _claim_existing(self, db, job_ids: List[str], now: datetime) -> Dict[str, object]:
+        return {
+            row.job_id: row
+            for row in db.execute(
+                update(Job)
+                .where(Job.job_id.in_(job_ids), Job.status.not_in(UNCLAIMABLE))
+                .values(status="preprocessing", updated_at=now)
+                .returning(*_CLAIM_COLUMNS)
+            )
+        }
+
+    def _write(self, db, batch: List[_Op]) -> Dict[int, object]:
+        now = datetime.utcnow()
+        results: Dict[int, object] = {}
+        by_kind: Dict[str, List[_Op]] = {"claim": [], "preprocessed": [], "failed": []}
+        for op in batch:
+            by_kind[op.kind].append(op)
+
+        claims = by_kind["claim"]
+        if claims:
+            s3_urls = {op.job_id: op.s3_url for op in claims}
+            claimed = self._claim_existing(db, list(s3_urls), now)
+            unmatched = [j for j in s3_urls if j not in claimed]
+            if unmatched:
+                # Not claimable: terminal, or no row at all (a producer that
+                # skipped ingestion). Only missing rows are inserted.
+                existing = set(db.execute(select(Job.job_id).where(Job.job_id.in_(unmatched))).scalars())
+                unmatched = [j for j in unmatched if j not in existing]
+            if unmatched:
+                inserted = {
+                    row.job_id: row
+                    for row in db.execute(
+                        insert(Job)
+                        .values([
+                            {"job_id": j, "status": "preprocessing", "s3_url": s3_urls[j], "created_at": now, "updated_at": now}
+                            for j in unmatched
+                        ])
+                        .on_conflict_do_nothing(index_elements=[Job.job_id])
+                        .returning(*_CLAIM_COLUMNS)
+                    )
+                }
+                claimed.update(inserted)
+                # A row created between the UPDATE and the INSERT: claim it now
+                raced = [j for j in unmatched if j not in inserted]
+                if raced:
+                    claimed.update(self._claim_existing(db, raced, now))
+            for op in claims:
+                row = claimed.get(op.job_id)
+                results[id(op)] = Claim(True, row.content_sha256, row.content_type, row.user_id) if row else Claim(False)
+
+        done = by_kind["preprocessed"]
+        if done:
+            artifacts = {op.job_id: op.artifacts_json for op in done}
+            values = {"status": "preprocessed", "updated_at": now}
+            with_artifacts = {j: a for j, a in artifacts.items() if a is not None}
+            if with_artifacts:
+                values["artifacts_json"] = case(
+                    with_artifacts, value=Job.job_id, else_=Job.artifacts_json
+                )
+            applied = set(db.execute(
+                update(Job)
+                .where(Job.job_id.in_(list(artifacts)), Job.status.not_in(TERMINAL))
+                .values(**values)
+                .returning(Job.job_id)
+            ).scalars())
+            for op in done:
+                results[id(op)] = op.job_id in applied
+
+        failed = by_kind["failed"]
+        if failed:
+            errors = {op.job_id: op.error for op in failed}
+            applied = set(db.execute(
+                update(Job)
+                .where(Job.job_id.in_(list(errors)), Job.status != "failed")
+                .values(
+                    status="failed",
+                    error_message=case(errors, value=Job.job_id, else_=Job.error_message),
+                    updated_at=now,
+                )
+                .returning(Job.job_id)
+            ).scalars())
+            for op in failed:
+                results[id(op)] = op.job_id in applied
+
+        return results
@@ -0,0 +1,33 @@
+from confluent_kafka import Consumer, Producer
+from typing import Any
+import json
+
+
+def create_consumer(bootstrap: str, group_id: str) -> Consumer:
+    # Offsets are committed explicitly by the worker once a job is done
+    return Consumer({
+        'bootstrap.servers': bootstrap,
+        'group.id': group_id,
+        'enable.auto.commit': False,
+        'auto.offset.reset': 'earliest',
+        'max.poll.interval.ms': 900000,  # serial mode polls once per job
+    })
+
+
+class KafkaProducer:
+    def __init__(self, bootstrap: str):
+        self._producer = Producer({
+            'bootstrap.servers': bootstrap,
+            'enable.idempotence': True,
+            'acks': 'all',
+            'linger.ms': 10,
+            'compression.type': 'zstd',
+        })
+
+    def publish(self, topic: str, value: dict[str, Any], key: str | None = None):
+        payload = json.dumps(value).encode('utf-8')
+        self._producer.produce(topic=topic, key=key, value=payload)
+        self._producer.poll(0)
+
+    def flush(self):
+        self._producer.flush()
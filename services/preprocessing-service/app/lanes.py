@@ -0,0 +1,106 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .config import settings
+from .offsets import PartitionKey
+
+# Ingestion routes submissions by size into lane topics, so a burst of huge
+# uploads queues apart from small jobs. A worker consumes the lanes listed in
+# WORKER_LANES, buffers a few messages per lane and starts jobs by smooth
+# weighted round-robin over the lanes that have work (serial mode: one slot).
+# LANE_RESERVED_SLOTS job slots are kept for the first lane listed, so small
+# jobs still start while every other slot runs a long job.
+
+
+def lane_topics() -> Dict[str, str]:
+    return {
+        "small": settings.topic_video_submitted,
+        "large": settings.topic_video_submitted_large,
+    }
+
+
+@dataclass
+class Lane:
+    name: str
+    topic: str
+    weight: int
+    pending: Deque[Tuple[Any, Optional[dict]]] = field(default_factory=deque)  # (kafka message, payload)
+    running: int = 0
+    credit: int = 0
+
+
+def parse_lanes(spec: str) -> List[Lane]:
+    # "small:3,large:1" -> lanes in priority order; a missing weight is 1
+    topics = lane_topics()
+    lanes = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, weight = entry.partition(":")
+        if name not in topics:
+            raise ValueError(f"Unknown lane {name!r} in WORKER_LANES (known: {', '.join(topics)})")
+        lanes.append(Lane(name, topics[name], max(1, int(weight or 1))))
+    if not lanes:
+        raise ValueError("WORKER_LANES lists no lanes")
+    return lanes
+
+
+class LaneScheduler:
+    # Used from the consumer loop thread only
+    def __init__(self, lanes: List[Lane], slots: int, reserved: int) -> None:
+        self.lanes = lanes
+        self._by_topic = {lane.topic: lane for lane in lanes}
+        self._slots = slots
+        # Slots the other lanes may fill between them
+        self._shared = max(1, slots - reserved) if len(lanes) > 1 else slots
+
+    def topics(self) -> List[str]:
+        return [lane.topic for lane in self.lanes]
+
+    def lane_for(self, topic: str) -> Lane:
+        return self._by_topic.get(topic, self.lanes[0])
+
+    def push(self, msg, payload: Optional[dict]) -> Lane:
+        lane = self.lane_for(msg.topic())
+        lane.pending.append((msg, payload))
+        return lane
+
+    def running(self) -> int:
+        return sum(lane.running for lane in self.lanes)
+
+    def pending(self) -> int:
+        return sum(len(lane.pending) for lane in self.lanes)
+
+    def next(self) -> Optional[Tuple[Lane, Any, Optional[dict]]]:
+        running = self.running()
+        if running >= self._slots:
+            return None
+        others = running - self.lanes[0].running
+        eligible = [
+            lane for i, lane in enumerate(self.lanes)
+            if lane.pending and (i == 0 or others < self._shared)
+        ]
+        if not eligible:
+            return None
+        total = sum(lane.weight for lane in eligible)
+        for lane in eligible:
+            lane.credit += lane.weight
+        lane = max(eligible, key=lambda l: l.credit)
+        lane.credit -= total
+        lane.running += 1
+        msg, payload = lane.pending.popleft()
+        return lane, msg, payload
+
+    def done(self, lane: Lane) -> None:
+        lane.running -= 1
+
+    def forget(self, keys: Iterable[PartitionKey]) -> None:
+        # Revoked partitions: drop their buffered messages, the new owner gets them
+        keys = set(keys)
+        for lane in self.lanes:
+            lane.pending = deque(
+                (msg, payload) for msg, payload in lane.pending
+                if (msg.topic(), msg.partition()) not in keys
+            )
@@ -0,0 +1,82 @@
+import logging
+import time
+from typing import Optional
+
+from confluent_kafka import TIMESTAMP_NOT_AVAILABLE, TopicPartition
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from .config import settings
+
+logger = logging.getLogger("preprocessing-worker")
+
+# Recorded in the worker process only. In concurrent mode process_job runs in
+# job processes, so stage timings and counts travel back in the job's
+# metadata["timing"] and are observed here.
+
+_STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram(
+    "preprocess_stage_seconds", "Wall time per process_job stage", ["stage"], buckets=_STAGE_BUCKETS
+)
+JOB_SECONDS = Histogram(
+    "preprocess_job_seconds", "Wall time per message, claim to publish", ["outcome"], buckets=_STAGE_BUCKETS
+)
+JOBS = Counter("preprocess_jobs_total", "Messages handled", ["outcome"])
+BYTES = Counter("preprocess_bytes_total", "Bytes moved to and from S3", ["direction"])
+FRAMES = Counter("preprocess_frames_total", "Frames sampled")
+FACES = Counter("preprocess_faces_total", "Faces detected")
+INFLIGHT = Gauge("preprocess_inflight_jobs", "Jobs being processed")
+QUEUE_SECONDS = Histogram(
+    "preprocess_queue_seconds",
+    "Time from publish to job start, per lane",
+    ["lane"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+LANE_PENDING = Gauge("preprocess_lane_pending", "Messages buffered in the worker, per lane", ["lane"])
+LANE_RUNNING = Gauge("preprocess_lane_running", "Jobs running, per lane", ["lane"])
+SCRATCH_BUDGET = Gauge("preprocess_scratch_budget_bytes", "Scratch space jobs may reserve", ["tier"])
+SCRATCH_RESERVED = Gauge("preprocess_scratch_reserved_bytes", "Scratch space reserved by running jobs", ["tier"])
+SCRATCH_WAIT_SECONDS = Histogram(
+    "preprocess_scratch_wait_seconds", "Wait for a scratch reservation before a job starts", buckets=_STAGE_BUCKETS
+)
+CONSUMER_LAG = Gauge("preprocess_consumer_lag", "High watermark minus position", ["topic", "partition"])
+
+
+def start_server() -> None:
+    if settings.metrics_port > 0:
+        start_http_server(settings.metrics_port)
+        logger.info("Serving /metrics on port %d", settings.metrics_port)
+
+
+def observe_timing(timing: Optional[dict]) -> None:
+    # timing is StageTimer.snapshot() as returned in the job's metadata
+    if not timing:
+        return
+    for stage, values in timing.get("stages", {}).items():
+        STAGE_SECONDS.labels(stage).observe(values["wall_s"])
+    counters = timing.get("counters", {})
+    BYTES.labels("download").inc(counters.get("bytes_downloaded", 0))
+    BYTES.labels("upload").inc(counters.get("bytes_uploaded", 0))
+    FRAMES.inc(counters.get("frames", 0))
+    FACES.inc(counters.get("faces", 0))
+
+
+def observe_queue_time(lane: str, msg) -> None:
+    # Kafka message timestamp (producer create time) to now
+    ts_type, ts_ms = msg.timestamp()
+    if ts_type != TIMESTAMP_NOT_AVAILABLE and ts_ms > 0:
+        QUEUE_SECONDS.labels(lane).observe(max(0.0, time.time() - ts_ms / 1000.0))
+
+
+def update_consumer_lag(consumer) -> None:
+    # Broker round-trips; called every METRICS_LAG_INTERVAL_S from the poll loop
+    try:
+        assignment = consumer.assignment()
+        if not assignment:
+            return
+        for tp in consumer.position(assignment):
+            _, high = consumer.get_watermark_offsets(TopicPartition(tp.topic, tp.partition), timeout=1.0)
+            if tp.offset >= 0 and high >= 0:
+                CONSUMER_LAG.labels(tp.topic, str(tp.partition)).set(max(0, high - tp.offset))
+    except Exception as e:
+        logger.debug("Consumer lag update failed: %s", e)
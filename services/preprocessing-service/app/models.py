@@ -1,4 +1,4 @@
-from sqlalchemy import String, Integer, Text, DateTime, BigInteger
+from sqlalchemy import String, Integer, Text, DateTime, BigInteger, Index, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from datetime import datetime
 import uuid
@@ -18,8 +18,69 @@ class Job(Base):
     s3_url: Mapped[str | None] = mapped_column(Text, nullable=True)
     file_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
     file_size_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    content_sha256: Mapped[str | None] = mapped_column(String(64), index=True, nullable=True)
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
     artifacts_json: Mapped[str | None] = mapped_column(Text, nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+# create_all only creates missing tables. Columns added to an existing table are
+# applied here, idempotently, on every startup (PostgreSQL DDL).
+SCHEMA_UPGRADES = (
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_content_sha256 ON jobs (content_sha256)",
+    "ALTER TABLE content_cache ADD COLUMN IF NOT EXISTS artifacts_version VARCHAR(16)",
+    # Near-duplicate lookups are scoped like the content cache; rows indexed
+    # before the scope existed have none and never match
+    "ALTER TABLE phash_frames ADD COLUMN IF NOT EXISTS scope VARCHAR(64)",
+    *(f"CREATE INDEX IF NOT EXISTS ix_phash_frames_c{i}_scope ON phash_frames (c{i}, scope)" for i in range(4)),
+    *(f"DROP INDEX IF EXISTS ix_phash_frames_c{i}" for i in range(4)),
+)
+
+
+def upgrade_schema(conn) -> None:
+    for statement in SCHEMA_UPGRADES:
+        conn.execute(text(statement))
+
+
+class ContentCache(Base):
+    # Content-addressed cache shared by ingestion and preprocessing: the stored
+    # source object for a SHA-256 and, once preprocessed, its artifacts, per
+    # scope (submitter)
+    __tablename__ = "content_cache"
+
+    scope: Mapped[str] = mapped_column(String(64), primary_key=True)  # content_cache.cache_scope: "user:<id>" or "global"
+    content_sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    source_s3_url: Mapped[str] = mapped_column(Text, nullable=False)
+    size_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    job_id: Mapped[str | None] = mapped_column(String(64), nullable=True)  # job whose artifacts are cached
+    artifacts_json: Mapped[str | None] = mapped_column(Text, nullable=True)
+    artifacts_version: Mapped[str | None] = mapped_column(String(16), nullable=True)  # settings the artifacts were made with (preprocessing content_cache.artifacts_version)
+    hit_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+
+
+class PhashFrame(Base):
+    # One row per indexed frame pHash. c0..c3 are the four 16-bit chunks of the
+    # hash (most significant first), each indexed within the scope: the
+    # multi-index hashing tables behind phash_index.query.
+    __tablename__ = "phash_frames"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    scope: Mapped[str | None] = mapped_column(String(64), nullable=True)  # content_cache.cache_scope of the job
+    job_id: Mapped[str] = mapped_column(String(64), index=True, nullable=False)
+    frame_idx: Mapped[int] = mapped_column(Integer, nullable=False)
+    hash: Mapped[int] = mapped_column(BigInteger, nullable=False)  # uint64 stored as signed int64
+    c0: Mapped[int] = mapped_column(Integer, nullable=False)
+    c1: Mapped[int] = mapped_column(Integer, nullable=False)
+    c2: Mapped[int] = mapped_column(Integer, nullable=False)
+    c3: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # Chunk first: a scope-first index is picked for scope alone and scans the scope
+    __table_args__ = tuple(Index(f"ix_phash_frames_c{i}_scope", f"c{i}", "scope") for i in range(4))
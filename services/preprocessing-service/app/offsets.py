@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+# (topic, partition)
+PartitionKey = Tuple[str, int]
+
+
+class OffsetTracker:
+    # Tracks in-flight offsets per partition when jobs finish out of order.
+    # An offset only becomes committable once every earlier offset of the same
+    # partition has completed, so a crash never skips unfinished work.
+
+    def __init__(self) -> None:
+        self._pending: Dict[PartitionKey, "OrderedDict[int, bool]"] = {}
+        self._committable: Dict[PartitionKey, int] = {}
+        self._committed: Dict[PartitionKey, int] = {}
+
+    def add(self, key: PartitionKey, offset: int) -> None:
+        self._pending.setdefault(key, OrderedDict())[offset] = False
+
+    def complete(self, key: PartitionKey, offset: int) -> None:
+        pending = self._pending.get(key)
+        if pending is None or offset not in pending:
+            return  # partition was revoked while the job ran
+        pending[offset] = True
+        while pending:
+            first, done = next(iter(pending.items()))
+            if not done:
+                break
+            pending.popitem(last=False)
+            self._committable[key] = first + 1
+
+    def inflight(self, key: PartitionKey | None = None) -> int:
+        if key is not None:
+            return len(self._pending.get(key, ()))
+        return sum(len(p) for p in self._pending.values())
+
+    def take_commits(self) -> List[Tuple[PartitionKey, int]]:
+        # Next offsets to commit (Kafka semantics: first unprocessed offset)
+        out = []
+        for key, offset in self._committable.items():
+            if self._committed.get(key, -1) < offset:
+                self._committed[key] = offset
+                out.append((key, offset))
+        return out
+
+    def forget(self, keys: Iterable[PartitionKey]) -> None:
+        for key in keys:
+            self._pending.pop(key, None)
+            self._committable.pop(key, None)
+            self._committed.pop(key, None)
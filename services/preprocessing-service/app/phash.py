@@ -0,0 +1,105 @@
+import math
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+import scipy.fftpack
+from PIL import Image
+
+# Batched pHash, bit-compatible with imagehash.phash (hash_size=8,
+# highfreq_factor=4): grayscale, 32x32 Lanczos resize, 2-D DCT-II, low 8x8
+# coefficients thresholded against their median, bits packed row-major MSB first.
+
+HASH_SIZE = 8
+_IMG_SIZE = HASH_SIZE * 4
+_RESIZE_CHUNK = 8  # frames per resize matmul, keeps the float64 scratch in cache
+
+# Pillow's 8-bit resampling works in fixed point with this many fractional bits
+_PRECISION_BITS = 32 - 8 - 2
+
+
+def _lanczos(x: float) -> float:
+    if not -3.0 <= x < 3.0:
+        return 0.0
+    if x == 0.0:
+        return 1.0
+    px = x * math.pi
+    return (math.sin(px) / px) * (math.sin(px / 3) / (px / 3))
+
+
+@lru_cache(maxsize=8)
+def _resample_weights(in_size: int, out_size: int) -> np.ndarray:
+    # Dense (out_size, in_size) matrix of Pillow's integer Lanczos coefficients
+    # (precompute_coeffs + normalize_coeffs_8bpc in Resample.c). Products and
+    # sums stay far below 2**53, so float64 matmuls over them are exact.
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = 3.0 * filterscale
+    weights = np.zeros((out_size, in_size), dtype=np.float64)
+    for xx in range(out_size):
+        center = (xx + 0.5) * scale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size)
+        w = [_lanczos((x - center + 0.5) / filterscale) for x in range(xmin, xmax)]
+        total = sum(w)
+        for i, v in enumerate(w):
+            v = v / total if total != 0.0 else v
+            weights[xx, xmin + i] = math.trunc((-0.5 if v < 0 else 0.5) + v * (1 << _PRECISION_BITS))
+    return weights
+
+
+def _clip8(acc: np.ndarray) -> np.ndarray:
+    return np.clip(np.floor_divide(acc + (1 << (_PRECISION_BITS - 1)), 1 << _PRECISION_BITS), 0, 255)
+
+
+def _grayscale(pixels: np.ndarray) -> np.ndarray:
+    # Pillow's RGB -> L (ITU-R 601-2, fixed point) into one preallocated stack
+    out = np.empty(pixels.shape[:3], dtype=np.uint8)
+    for i, frame in enumerate(pixels):
+        out[i] = np.asarray(Image.fromarray(frame).convert("L"))
+    return out
+
+
+def _resize(gray: np.ndarray) -> np.ndarray:
+    # Two-pass (horizontal, then vertical) Lanczos with 8-bit rounding between
+    # passes, matching Image.resize((32, 32), LANCZOS) exactly
+    n, h, w = gray.shape
+    if (h, w) == (_IMG_SIZE, _IMG_SIZE):
+        return gray
+    wh = _resample_weights(w, _IMG_SIZE).T
+    wv = _resample_weights(h, _IMG_SIZE)
+    out = np.empty((n, _IMG_SIZE, _IMG_SIZE), dtype=np.uint8)
+    scratch = np.empty((min(n, _RESIZE_CHUNK), h, w), dtype=np.float64)
+    for start in range(0, n, _RESIZE_CHUNK):
+        chunk = gray[start:start + _RESIZE_CHUNK]
+        buf = scratch[: len(chunk)]
+        buf[...] = chunk
+        horiz = _clip8(buf @ wh)
+        out[start:start + len(chunk)] = _clip8(wv @ horiz)
+    return out
+
+
+def phash_batch(pixels: np.ndarray) -> np.ndarray:
+    # pixels: (N, H, W, 3) uint8 RGB or (N, H, W) uint8 grayscale -> (N,) uint64
+    if len(pixels) == 0:
+        return np.empty((0,), dtype=np.uint64)
+    gray = _grayscale(pixels) if pixels.ndim == 4 else pixels
+    small = _resize(gray)
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(small, axis=1), axis=2)
+    low = dct[:, :HASH_SIZE, :HASH_SIZE].reshape(len(small), -1)
+    bits = low > np.median(low, axis=1, keepdims=True)
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def to_hex(hashes: np.ndarray) -> List[str]:
+    # Same text form as str(imagehash.ImageHash)
+    return [f"{h:016x}" for h in hashes.tolist()]
+
+
+def from_hex(values: List[str]) -> np.ndarray:
+    return np.array([int(v, 16) for v in values], dtype=np.uint64)
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # Broadcasting Hamming distance between packed hashes (vectorized popcount)
+    return np.bitwise_count(np.bitwise_xor(a, b))
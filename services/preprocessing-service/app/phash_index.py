@@ -0,0 +1,188 @@
+import json
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import Integer, any_, create_engine, func, insert, literal, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import sessionmaker
+
+from .config import settings
+from .models import Job, PhashFrame
+from .phash import hamming
+
+# Near-duplicate lookup over frame pHashes with multi-index hashing: each
+# 64-bit hash is split into four 16-bit chunks stored in indexed columns, and
+# candidate videos are found by B-tree lookups of chunk values.
+#
+# Every query frame is looked up by its exact chunk values: a stored frame
+# within distance 3 always shares a chunk (pigeonhole), one at distance 6
+# still does with probability ~0.6. A near-duplicate video matches most of
+# its frames, so it is found through one of them. To keep that a guarantee
+# for short queries, up to NEAR_DUP_PROBE_FRAMES evenly spaced query frames
+# are also probed with every chunk value within radius // 4 bits (17 values
+# per chunk up to radius 7), which finds every stored frame within the
+# radius of those frames. Probing all frames that way expands to thousands
+# of values per column and is slower than scanning; narrower chunks (8 x 8
+# bits) need no probes but each value then matches ~1/256 of the table.
+#
+# The candidate videos with the most chunk hits are then verified frame by
+# frame with an exact popcount at the radius.
+#
+# Frames are indexed and looked up per scope (content_cache.cache_scope: the
+# submitter, or "global"), so matches never name or reuse another tenant's job.
+
+CHUNKS = 4
+CHUNK_BITS = 16
+_CHUNK_COLS = [PhashFrame.c0, PhashFrame.c1, PhashFrame.c2, PhashFrame.c3]
+
+# Near-blank frames (black, white, flat colour) hash to a few bits set and
+# would match every video; they are neither indexed nor queried.
+_MIN_BITS = 8
+_MAX_BITS = 64 - _MIN_BITS
+
+_engine = None
+_session_factory = None
+_engine_lock = threading.Lock()
+
+
+def _session():
+    # Own engine so job processes can query without the worker's session
+    global _engine, _session_factory
+    if _session_factory is None:
+        with _engine_lock:
+            if _session_factory is None:
+                _engine = create_engine(settings.db_url, pool_pre_ping=True, pool_size=2)
+                _session_factory = sessionmaker(bind=_engine)
+    return _session_factory()
+
+
+def _informative(hashes: np.ndarray) -> np.ndarray:
+    bits = np.bitwise_count(hashes)
+    return (bits >= _MIN_BITS) & (bits <= _MAX_BITS)
+
+
+def _split(hashes: np.ndarray) -> np.ndarray:
+    # (N,) uint64 -> (N, 4) chunk values, most significant chunk first
+    shifts = np.array([CHUNK_BITS * (CHUNKS - 1 - i) for i in range(CHUNKS)], dtype=np.uint64)
+    return ((hashes[:, None] >> shifts) & np.uint64(0xFFFF)).astype(np.int64)
+
+
+def _probe_values(exact: np.ndarray, near: np.ndarray, bits: int) -> List[int]:
+    # The exact chunk values plus every 16-bit value within `bits` bits of the
+    # `near` ones
+    masks = np.arange(1 << CHUNK_BITS, dtype=np.int64)
+    masks = masks[np.bitwise_count(masks) <= bits]
+    return np.union1d(exact, (np.unique(near)[:, None] ^ masks[None, :]).ravel()).tolist()
+
+
+def _probe_frames(count: int) -> np.ndarray:
+    # Evenly spaced query frames that get the near probes
+    n = min(count, settings.near_dup_probe_frames)
+    return np.unique(np.linspace(0, count - 1, n).round().astype(np.int64)) if n > 0 else np.empty((0,), dtype=np.int64)
+
+
+def insert_hashes(db, scope: str, job_id: str, hashes: np.ndarray) -> int:
+    # Incremental insert of one job's frame hashes; caller commits
+    keep = np.flatnonzero(_informative(hashes))
+    if len(keep) == 0:
+        return 0
+    kept = hashes[keep]
+    chunks = _split(kept)
+    signed = kept.view(np.int64)
+    rows = [
+        {"scope": scope, "job_id": job_id, "frame_idx": int(i), "hash": int(h), "c0": int(c[0]), "c1": int(c[1]), "c2": int(c[2]), "c3": int(c[3])}
+        for i, h, c in zip(keep.tolist(), signed.tolist(), chunks)
+    ]
+    db.execute(insert(PhashFrame), rows)
+    return len(rows)
+
+
+def query(db, scope: str, hashes: np.ndarray, radius: int, exclude_job_id: Optional[str] = None) -> List[Dict]:
+    # Jobs of the scope with frames within `radius` bits of the query frames, best first.
+    # matched_frames counts query frames that have at least one such frame.
+    # query_coverage / candidate_coverage: share of each side's frames matched.
+    q = hashes[_informative(hashes)]
+    if len(q) == 0:
+        return []
+
+    # Stage 1: candidate videos by chunk hits, ranked by hit count in SQL.
+    # On PostgreSQL each column is probed with one array parameter (= ANY),
+    # which keeps long probe lists within the driver's parameter limit.
+    chunks = _split(q)
+    near = chunks[_probe_frames(len(q))]
+    bits = radius // CHUNKS
+    array_param = db.get_bind().dialect.name == "postgresql"
+    probes = []
+    for i, col in enumerate(_CHUNK_COLS):
+        values = _probe_values(chunks[:, i], near[:, i], bits)
+        probes.append(col == any_(literal(values, ARRAY(Integer))) if array_param else col.in_(values))
+    hits = func.count().label("hits")
+    stmt = select(PhashFrame.job_id, hits).where(PhashFrame.scope == scope, or_(*probes))
+    if exclude_job_id:
+        stmt = stmt.where(PhashFrame.job_id != exclude_job_id)
+    stmt = stmt.group_by(PhashFrame.job_id).order_by(hits.desc()).limit(settings.near_dup_max_videos)
+    candidates = [job_id for job_id, _ in db.execute(stmt)]
+    if not candidates:
+        return []
+
+    # Stage 2: exact frame-level verification against the candidates' hashes
+    rows = db.execute(
+        select(PhashFrame.job_id, PhashFrame.hash).where(PhashFrame.scope == scope, PhashFrame.job_id.in_(candidates))
+    ).all()
+    job_ids = np.array([r[0] for r in rows], dtype=object)
+    stored = np.array([r[1] for r in rows], dtype=np.int64).view(np.uint64)
+    close = hamming(q[:, None], stored[None, :]) <= radius  # (Q, rows)
+    # Coverage is measured both ways: a short clip cut from a long indexed
+    # video covers all of its own frames but few of the video's, and the
+    # ratio is the smaller of the two.
+    out = []
+    for job_id in candidates:
+        pairs = close[:, job_ids == job_id]  # (Q, candidate frames)
+        matched = int(pairs.any(axis=1).sum())
+        if not matched:
+            continue
+        query_coverage = matched / len(q)
+        candidate_coverage = int(pairs.any(axis=0).sum()) / pairs.shape[1]
+        out.append({
+            "job_id": job_id,
+            "matched_frames": matched,
+            "query_coverage": query_coverage,
+            "candidate_coverage": candidate_coverage,
+            "ratio": min(query_coverage, candidate_coverage),
+        })
+    out.sort(key=lambda m: m["ratio"], reverse=True)
+    return out
+
+
+def find_near_duplicates(scope: str, job_id: str, hashes: np.ndarray) -> List[Dict]:
+    # Earlier preprocessed jobs of the scope sharing at least NEAR_DUP_MIN_RATIO
+    # of their frames with this job, in both directions, with their artifacts
+    # attached
+    db = _session()
+    try:
+        matches = [
+            m for m in query(db, scope, hashes, settings.near_dup_radius, exclude_job_id=job_id)
+            if m["ratio"] >= settings.near_dup_min_ratio
+        ]
+        if not matches:
+            return []
+        jobs = {
+            j.job_id: j
+            for j in db.execute(
+                select(Job).where(Job.job_id.in_([m["job_id"] for m in matches]), Job.status == "preprocessed")
+            ).scalars()
+        }
+        out = []
+        for m in matches:
+            job = jobs.get(m["job_id"])
+            if job is None:
+                continue
+            try:
+                m["artifacts"] = json.loads(job.artifacts_json) if job.artifacts_json else None
+            except ValueError:
+                m["artifacts"] = None
+            out.append(m)
+        return out
+    finally:
+        db.close()
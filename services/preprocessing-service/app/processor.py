@@ -1,189 +1,999 @@
+import csv
+import functools
+import io
+import math
 import os
 import json
 import shutil
 import subprocess
-from dataclasses import dataclass
-from typing import Dict, List, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import IO, Callable, Dict, List, Optional, Tuple
 
-from PIL import Image
-import imagehash
+from PIL import Image, ImageOps
 import numpy as np
 
-try:
-    import insightface  # uses RetinaFace by default in FaceAnalysis
-except Exception:  # pragma: no cover
-    insightface = None  # type: ignore
-
 from .config import settings
-from .s3_utils import download_to_path, upload_file, make_key
+from .face_models import get_face_analyzer, detect_batch, supports_batch
+from .face_tracking import Detection, track_faces
+from .phash import phash_batch, to_hex
+from .stream_input import plan_stream
+from .phash_index import find_near_duplicates
+from .shards import FORMAT_JPEG, FORMAT_RAW, shard_filename, write_index, write_jpeg_shard, write_raw_shard
+from .s3_utils import UploadSource, download_to_path, read_object, upload_many_sized, make_key
+from .timing import StageTimer
+
+
+FRAME_SIZE = 224
+
+
+@dataclass
+class FrameSet:
+    names: List[str]  # frame_00001.jpg, ... (also the keys used in metadata)
+    pixels: np.ndarray  # (N, FRAME_SIZE, FRAME_SIZE, 3) uint8 RGB
+    paths: Optional[List[str]] = None  # JPEGs on disk when ffmpeg wrote them
+    sampling: Dict = field(default_factory=dict)  # how the frames were picked (recorded in metadata)
 
 
 @dataclass
 class Artifacts:
-    video_s3: str
-    audio_s3: str
-    frames_s3: List[str]
     metadata_s3: str
+    frames_s3: List[str] = field(default_factory=list)
+    video_s3: Optional[str] = None  # not for image jobs
+    audio_s3: Optional[str] = None  # not for image jobs
+    frames_shard_s3: Optional[str] = None
+    frames_index_s3: Optional[str] = None
+    bytes_uploaded: int = 0
+
 
+# Writes the source into ffmpeg's stdin (see stream_input.StreamPlan.feed)
+Feed = Callable[[IO[bytes]], None]
 
-def _run_ffmpeg(args: List[str]) -> None:
+
+def _start_feed(proc: subprocess.Popen, feed: Optional[Feed]) -> Optional[threading.Thread]:
+    if feed is None:
+        return None
+    errors: List[BaseException] = []
+
+    def pump() -> None:
+        try:
+            feed(proc.stdin)  # type: ignore[arg-type]
+        except BrokenPipeError:
+            pass  # ffmpeg finished (or failed) before reading everything
+        except BaseException as e:
+            errors.append(e)
+            proc.kill()
+        finally:
+            try:
+                proc.stdin.close()  # type: ignore[union-attr]
+            except OSError:
+                pass
+
+    t = threading.Thread(target=pump, name="ffmpeg-feed", daemon=True)
+    t.errors = errors  # type: ignore[attr-defined]
+    t.start()
+    return t
+
+
+def _finish_feed(t: Optional[threading.Thread]) -> None:
+    if t is None:
+        return
+    t.join()
+    if t.errors:  # type: ignore[attr-defined]
+        raise t.errors[0]  # type: ignore[attr-defined]
+
+
+def _run_ffmpeg(args: List[str], feed: Optional[Feed] = None) -> None:
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"] + args
+    if feed is None:
+        subprocess.run(cmd, check=True)
+        return
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    t = _start_feed(proc, feed)
+    rc = proc.wait()
+    _finish_feed(t)
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd)
+
+
+def _run_ffmpeg_raw(args: List[str], max_frames: int, feed: Optional[Feed] = None) -> np.ndarray:
+    # Read rgb24 frames from ffmpeg's stdout straight into one preallocated buffer
     cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"] + args
-    subprocess.run(cmd, check=True)
-
-
-def standardize_video(src_path: str, dst_path: str) -> None:
-    # H.264 mp4, 30fps, yuv420p, limit bitrate to keep size reasonable
-    _run_ffmpeg([
-        "-i", src_path,
-        "-vf", "scale='min(1280,iw)':-2",  # cap width at 1280, keep aspect
-        "-r", "30",
-        "-c:v", "libx264",
-        "-preset", "veryfast",
-        "-profile:v", "baseline",
-        "-pix_fmt", "yuv420p",
-        "-b:v", "2000k",
-        "-movflags", "+faststart",
-        "-an",
-        dst_path,
-    ])
-
-
-def extract_frames(src_path: str, frames_dir: str, fps: float, max_frames: int) -> List[str]:
+    buf = np.empty((max_frames, FRAME_SIZE, FRAME_SIZE, 3), dtype=np.uint8)
+    view = memoryview(buf).cast("B")
+    filled = 0
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stdin=subprocess.PIPE if feed else None)
+    t = _start_feed(proc, feed)
+    try:
+        while filled < len(view):
+            n = proc.stdout.readinto(view[filled:])  # type: ignore[union-attr]
+            if not n:
+                break
+            filled += n
+        proc.stdout.read()  # type: ignore[union-attr]  # never block ffmpeg on a full pipe
+    finally:
+        proc.stdout.close()  # type: ignore[union-attr]
+        rc = proc.wait()
+        _finish_feed(t)
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd)
+    return buf[: filled // (FRAME_SIZE * FRAME_SIZE * 3)]
+
+
+def probe_media(src_path: str, data: Optional[bytes] = None) -> dict:
+    # With data, probe those bytes over stdin instead of the path
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-print_format", "json",
+        "-show_streams", "-show_format",
+        "pipe:0" if data is not None else src_path,
+    ]
+    if data is not None:
+        # A truncated head makes ffprobe complain about the tail; the stream
+        # info it prints is still complete
+        out = subprocess.run(cmd, input=data, capture_output=True)
+    else:
+        out = subprocess.run(cmd, check=True, capture_output=True)
+    return json.loads(out.stdout or b"{}")
+
+
+def _has_stream(probe: dict, codec_type: str) -> bool:
+    return any(s.get("codec_type") == codec_type for s in probe.get("streams", []))
+
+
+def _probe_duration(probe: dict) -> float:
+    try:
+        return float(probe.get("format", {}).get("duration") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    # "30000/1001" -> 29.97; "0/0" and garbage -> 0
+    try:
+        num, _, den = (rate or "").partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _rotation(stream: dict) -> int:
+    for side in stream.get("side_data_list") or []:
+        if "rotation" in side:
+            return int(side["rotation"])
+    try:
+        return int((stream.get("tags") or {}).get("rotate", 0))
+    except ValueError:
+        return 0
+
+
+def summarize_probe(probe: dict) -> dict:
+    # What later stages (and consumers, via metadata) need from ffprobe's output
+    video = next((s for s in probe.get("streams", []) if s.get("codec_type") == "video"), {})
+    audio = next((s for s in probe.get("streams", []) if s.get("codec_type") == "audio"), None)
+    width, height = int(video.get("width") or 0), int(video.get("height") or 0)
+    if _rotation(video) % 180:
+        width, height = height, width  # displayed size, as ffmpeg autorotates on decode
+    fps = _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate"))
+    return {
+        "video_codec": video.get("codec_name"),
+        "pix_fmt": video.get("pix_fmt"),
+        "width": width,
+        "height": height,
+        "fps": round(fps, 3),
+        "duration": round(_probe_duration(probe), 3),
+        "audio_codec": audio.get("codec_name") if audio else None,
+    }
+
+
+def should_remux(info: dict) -> bool:
+    # The source video stream already is what the standard encode would produce
+    # (H.264, yuv420p, at most STD_MAX_WIDTH wide, at most REMUX_MAX_FPS), so
+    # it can be stream-copied
+    return (
+        settings.standardize_remux
+        and info.get("video_codec") == "h264"
+        and info.get("pix_fmt") == "yuv420p"
+        and 0 < info.get("width", 0) <= STD_MAX_WIDTH
+        and 0 < info.get("fps", 0) <= settings.remux_max_fps + 0.01
+    )
+
+
+# H.264 mp4, 30fps, yuv420p, limit bitrate to keep size reasonable
+STD_MAX_WIDTH = 1280
+_STD_SCALE = f"scale='min({STD_MAX_WIDTH},iw)':-2"  # cap width, keep aspect
+_STD_ENCODE_ARGS = [
+    "-r", "30",
+    "-c:v", "libx264",
+    "-preset", "veryfast",
+    "-profile:v", "baseline",
+    "-pix_fmt", "yuv420p",
+    "-b:v", "2000k",
+    "-movflags", "+faststart",
+    "-an",
+]
+# Remux: video stream copied as is, moov up front, no audio (like the encode)
+_STD_COPY_ARGS = ["-c:v", "copy", "-movflags", "+faststart", "-an"]
+_FRAME_FILTER = f"fps={{fps}},scale={FRAME_SIZE}:{FRAME_SIZE}:flags=lanczos"
+_AUDIO_ARGS = ["-ac", "1", "-ar", "16000", "-f", "wav"]
+# Input option: the video decoder drops non-key frames (stream copies are unaffected)
+_SKIP_NONKEY = ["-skip_frame:v", "nokey"]
+
+
+def standardize_video(src_path: str, dst_path: str, feed: Optional[Feed] = None, remux: bool = False) -> None:
+    if remux:
+        _run_ffmpeg(["-i", src_path, "-map", "0:v:0"] + _STD_COPY_ARGS + [dst_path], feed=feed)
+        return
+    _run_ffmpeg(["-i", src_path, "-vf", _STD_SCALE] + _STD_ENCODE_ARGS + [dst_path], feed=feed)
+
+
+def _list_frames(frames_dir: str) -> List[str]:
+    return sorted([os.path.join(frames_dir, f) for f in os.listdir(frames_dir) if f.endswith(".jpg")])
+
+
+def frame_names(count: int) -> List[str]:
+    return [f"frame_{i:05d}.jpg" for i in range(1, count + 1)]
+
+
+def _frame_output_args(frames_dir: Optional[str], max_frames: int) -> List[str]:
+    # frames_dir=None streams rawvideo over stdout instead of writing JPEGs.
+    # Passthrough: select-based samplers emit irregular timestamps that must
+    # not be padded back to a constant rate.
+    args = ["-frames:v", str(max_frames), "-fps_mode", "passthrough"]
+    if frames_dir is None:
+        return args + ["-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
     os.makedirs(frames_dir, exist_ok=True)
-    pattern = os.path.join(frames_dir, "frame_%05d.jpg")
-    # Use fps filter and cap number of frames with -frames:v
-    _run_ffmpeg([
-        "-i", src_path,
-        "-vf", f"fps={fps},scale=224:224:flags=lanczos",
-        "-frames:v", str(max_frames),
-        "-q:v", "2",
-        pattern,
-    ])
-    files = sorted([os.path.join(frames_dir, f) for f in os.listdir(frames_dir) if f.endswith(".jpg")])
-    return files
-
-
-def extract_audio(src_path: str, audio_path: str) -> None:
-    _run_ffmpeg([
-        "-i", src_path,
-        "-vn",
-        "-ac", "1",
-        "-ar", "16000",
-        "-f", "wav",
-        audio_path,
-    ])
-
-
-def detect_faces(frames: List[str], max_samples: int) -> Dict[str, List[Dict]]:
-    results: Dict[str, List[Dict]] = {}
-    if not frames:
-        return results
-    if insightface is None:
-        return results
-    fa = insightface.app.FaceAnalysis(name="buffalo_l")
-    fa.prepare(ctx_id=0, det_size=(224, 224))
-    sample_frames = frames[:max_samples]
-    for fp in sample_frames:
-        img = np.array(Image.open(fp).convert("RGB"))
-        faces = fa.get(img)
-        items = []
-        for f in faces:
-            box = f.bbox.astype(float).tolist()
-            kps = f.kps.astype(float).tolist() if hasattr(f, "kps") else []
-            items.append({"bbox": box, "kps": kps, "det_score": float(getattr(f, "det_score", 0))})
-        results[os.path.basename(fp)] = items
-    return results
-
-
-def compute_phash(frames: List[str]) -> Dict[str, str]:
-    out: Dict[str, str] = {}
+    return args + ["-q:v", "2", os.path.join(frames_dir, "frame_%05d.jpg")]
+
+
+def _collect_frames(args: List[str], frames_dir: Optional[str], max_frames: int, feed: Optional[Feed] = None) -> FrameSet:
+    if frames_dir is None:
+        pixels = _run_ffmpeg_raw(args, max_frames, feed=feed)
+        return FrameSet(names=frame_names(len(pixels)), pixels=pixels)
+    _run_ffmpeg(args, feed=feed)
+    paths = _list_frames(frames_dir)
+    return FrameSet(names=[os.path.basename(p) for p in paths], pixels=load_frames(paths), paths=paths)
+
+
+# Frame sampling strategies (FRAME_SAMPLING):
+#   fps        FRAME_RATE frames/s from the start, up to MAX_FRAMES
+#   keyframes  source key frames only, at most FRAME_RATE/s; non-key frames are not
+#              decoded (-skip_frame nokey) unless a transcode in the same
+#              ffmpeg needs every frame anyway (fused or segmented transcode)
+#   scene      first frame plus scene changes (score > SCENE_THRESHOLD), at most FRAME_RATE/s;
+#              still decodes every frame
+#   uniform    FRAME_RATE density spread over the whole duration once MAX_FRAMES caps it;
+#              one seek per frame when they are far enough apart
+SAMPLING_MODES = ("fps", "keyframes", "scene", "uniform")
+
+
+def _sample_count(duration: float, fps: float, max_frames: int) -> int:
+    return max(1, min(max_frames, math.ceil(duration * fps)))
+
+
+def _sampler_filter(sampling: str, fps: float, duration: float, max_frames: int) -> Tuple[str, Dict]:
+    # Filter chain picking frames out of a fully decoded stream, and its metadata
+    scale = f"scale={FRAME_SIZE}:{FRAME_SIZE}:flags=lanczos"
+    min_gap = f"gte(t-prev_selected_t,{1.0 / fps:.6g})"
+    if sampling == "keyframes":
+        return f"select='key*(isnan(prev_selected_t)+{min_gap})',{scale}", {"mode": "keyframes", "method": "select"}
+    if sampling == "scene":
+        # Scores compare consecutive frames thinned to SCENE_SCORE_FPS and
+        # downscaled: cuts still stand out, at a fraction of the filter work
+        threshold = settings.scene_threshold
+        expr = f"isnan(prev_selected_t)+gt(scene,{threshold})*{min_gap}"
+        graph = f"fps={settings.scene_score_fps:.6g},{scale},select='{expr}'"
+        return graph, {"mode": "scene", "scene_threshold": threshold}
+    if sampling == "uniform" and duration > 0:
+        count = _sample_count(duration, fps, max_frames)
+        meta = {"mode": "uniform", "method": "fps", "interval_s": round(duration / count, 3)}
+        return f"fps={count / duration:.6g},{scale}", meta
+    # fps, or uniform without a known duration
+    return _FRAME_FILTER.format(fps=fps), {"mode": "fps"}
+
+
+def _seek_frame(src_path: str, t: float, out_path: Optional[str]) -> Optional[bytes]:
+    # Decode one frame at t: input seek to the preceding key frame, then up to t
+    args = ["-ss", f"{t:.3f}", "-i", src_path, "-vf", f"scale={FRAME_SIZE}:{FRAME_SIZE}:flags=lanczos", "-frames:v", "1"]
+    if out_path is not None:
+        _run_ffmpeg(args + ["-q:v", "2", out_path])
+        return None
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"] + args + ["-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+    return subprocess.run(cmd, check=True, capture_output=True).stdout
+
+
+def _extract_uniform_seek(src_path: str, frames_dir: Optional[str], duration: float, count: int) -> FrameSet:
+    # Frame k from the middle of the k-th of count equal slices
+    times = [(k + 0.5) * duration / count for k in range(count)]
+    names = frame_names(count)
+    paths = None
+    if frames_dir is not None:
+        os.makedirs(frames_dir, exist_ok=True)
+        paths = [os.path.join(frames_dir, n) for n in names]
+    with ThreadPoolExecutor(max_workers=max(1, settings.frame_seek_concurrency)) as pool:
+        outs = list(pool.map(_seek_frame, [src_path] * count, times, paths or [None] * count))
+    frame_bytes = FRAME_SIZE * FRAME_SIZE * 3
+    # A seek past the last decodable frame yields nothing
+    if paths is not None:
+        paths = [p for p in paths if os.path.exists(p)]
+        pixels = load_frames(paths)
+        names = [os.path.basename(p) for p in paths]
+    else:
+        raw = [o[:frame_bytes] for o in outs if o and len(o) >= frame_bytes]
+        pixels = np.frombuffer(b"".join(raw), dtype=np.uint8).reshape(len(raw), FRAME_SIZE, FRAME_SIZE, 3).copy()
+        names = frame_names(len(raw))
+    meta = {"mode": "uniform", "method": "seek", "interval_s": round(duration / count, 3)}
+    return FrameSet(names=names, pixels=pixels, paths=paths, sampling=meta)
+
+
+def extract_frames(
+    src_path: str,
+    frames_dir: Optional[str],
+    fps: float,
+    max_frames: int,
+    sampling: str = "fps",
+    duration: float = 0.0,
+) -> FrameSet:
+    # Cap the number of frames with -frames:v; see SAMPLING_MODES
+    if sampling == "uniform" and duration <= 0:
+        duration = _probe_duration(probe_media(src_path))
+    if sampling == "uniform" and duration > 0:
+        count = _sample_count(duration, fps, max_frames)
+        if duration / count >= settings.uniform_seek_min_interval_s:
+            return _extract_uniform_seek(src_path, frames_dir, duration, count)
+    graph, meta = _sampler_filter(sampling, fps, duration, max_frames)
+    args = []
+    if sampling == "keyframes":
+        args += _SKIP_NONKEY
+        meta["method"] = "skip_frame"
+    args += ["-i", src_path, "-vf", graph]
+    frames = _collect_frames(args + _frame_output_args(frames_dir, max_frames), frames_dir, max_frames)
+    frames.sampling = meta
+    return frames
+
+
+def extract_audio(src_path: str, audio_path: str, probe: Optional[dict] = None) -> None:
+    # Resamples the source's audio track, or writes silence for its duration
+    # when it has none
+    if probe is None:
+        probe = probe_media(src_path)
+    if _has_stream(probe, "audio"):
+        _run_ffmpeg(["-i", src_path, "-vn"] + _AUDIO_ARGS + [audio_path])
+    else:
+        write_silence(audio_path, _probe_duration(probe))
+
+
+def write_silence(audio_path: str, duration: float) -> None:
+    _run_ffmpeg(["-f", "lavfi", "-i", "anullsrc=r=16000:cl=mono", "-t", f"{max(duration, 0.1):.3f}"] + _AUDIO_ARGS + [audio_path])
+
+
+def decode_fused(
+    src_path: str,
+    std_path: str,
+    frames_dir: Optional[str],
+    audio_path: str,
+    fps: float,
+    max_frames: int,
+    probe: Optional[dict] = None,
+    feed: Optional[Feed] = None,
+    sampling: str = "fps",
+    remux: bool = False,
+) -> FrameSet:
+    # One ffmpeg process, one decode of the source: the video stream is split in the
+    # filter graph into the standardized encode and the 224x224 frame sampler, and the
+    # audio stream is resampled straight from the source. The standardized encode
+    # needs every frame, so samplers here select from the shared decode rather than
+    # skipping or seeking. With remux the standardized output is a stream copy of
+    # the source packets and only the sampler decodes, so keyframes sampling
+    # skips non-key frames in the decoder.
+    if probe is None:
+        probe = probe_media(src_path)
+    sampler, sampling_meta = _sampler_filter(sampling, fps, _probe_duration(probe), max_frames)
+    if remux:
+        args = []
+        if sampling == "keyframes":
+            args += _SKIP_NONKEY
+            sampling_meta["method"] = "skip_frame"
+        args += ["-i", src_path, "-filter_complex", f"[0:v:0]{sampler}[vfr]"]
+        args += ["-map", "0:v:0"] + _STD_COPY_ARGS + [std_path]
+    else:
+        graph = (
+            f"[0:v:0]split=2[std][smp];"
+            f"[std]{_STD_SCALE}[vstd];"
+            f"[smp]{sampler}[vfr]"
+        )
+        args = ["-i", src_path, "-filter_complex", graph]
+        args += ["-map", "[vstd]"] + _STD_ENCODE_ARGS + [std_path]
+    has_audio = _has_stream(probe, "audio")
+    if has_audio:
+        args += ["-map", "0:a:0"] + _AUDIO_ARGS + [audio_path]
+    args += ["-map", "[vfr]"] + _frame_output_args(frames_dir, max_frames)
+    frames = _collect_frames(args, frames_dir, max_frames, feed=feed)
+    frames.sampling = sampling_meta
+    if not has_audio:
+        # No audio track: emit silence for the video duration so downstream
+        # consumers always get a WAV artifact.
+        duration = _probe_duration(probe) or _probe_duration(probe_media(std_path))
+        write_silence(audio_path, duration)
+    return frames
+
+
+# Segment-parallel transcode (SEGMENT_TRANSCODE): long sources are split at key
+# frames by a stream copy (audio is resampled in the same pass), each segment is
+# encoded and frame-sampled by its own ffmpeg process, and the encoded segments
+# are joined with the concat demuxer. Sampler timestamps are shifted to source
+# time and each segment keeps only the samples inside its own span, so frames
+# line up with what a single pass would sample.
+
+
+def _segment_cores() -> int:
+    if settings.segment_max_workers > 0:
+        return settings.segment_max_workers
+    return max(1, (os.cpu_count() or 1) // max(1, settings.worker_concurrency))
+
+
+def segment_count(duration: float) -> int:
+    # 1 means: do not segment
+    if not settings.segment_transcode or duration <= 0:
+        return 1
+    return max(1, min(_segment_cores(), int(duration // settings.segment_min_s)))
+
+
+def split_segments(
+    src_path: str,
+    seg_dir: str,
+    audio_path: str,
+    duration: float,
+    count: int,
+    probe: dict,
+    feed: Optional[Feed] = None,
+) -> List[Tuple[str, float]]:
+    # (segment path, start time in the source) per segment
+    os.makedirs(seg_dir, exist_ok=True)
+    list_path = os.path.join(seg_dir, "segments.csv")
+    args = [
+        "-i", src_path, "-map", "0:v:0", "-c:v", "copy",
+        "-f", "segment", "-segment_time", f"{duration / count:.3f}", "-reset_timestamps", "1",
+        "-segment_list", list_path, "-segment_list_type", "csv",
+        os.path.join(seg_dir, "seg_%03d.mkv"),
+    ]
+    has_audio = _has_stream(probe, "audio")
+    if has_audio:
+        args += ["-map", "0:a:0"] + _AUDIO_ARGS + [audio_path]
+    _run_ffmpeg(args, feed=feed)
+    if not has_audio:
+        write_silence(audio_path, duration)
+    with open(list_path, newline="") as f:
+        return [(os.path.join(seg_dir, row[0]), float(row[1])) for row in csv.reader(f) if row]
+
+
+def _decode_segment(
+    seg_path: str,
+    std_path: str,
+    frames_dir: Optional[str],
+    start: float,
+    end: Optional[float],
+    sampler: Optional[str],
+    max_frames: int,
+    threads: int,
+) -> Optional[FrameSet]:
+    encode = ["-threads", str(threads)] + _STD_ENCODE_ARGS + [std_path]
+    if sampler is None:
+        # Past the frame cap: transcode only
+        _run_ffmpeg(["-i", seg_path, "-vf", _STD_SCALE] + encode)
+        return None
+    span = f"trim=start={start:.6f}" + (f":end={end:.6f}" if end is not None else "")
+    graph = (
+        f"[0:v:0]split=2[std][smp];"
+        f"[std]{_STD_SCALE}[vstd];"
+        f"[smp]setpts=PTS-STARTPTS+{start:.6f}/TB,{sampler},{span}[vfr]"
+    )
+    args = ["-i", seg_path, "-filter_complex", graph, "-map", "[vstd]"] + encode
+    args += ["-map", "[vfr]"] + _frame_output_args(frames_dir, max_frames)
+    return _collect_frames(args, frames_dir, max_frames)
+
+
+def concat_videos(parts: List[str], dst_path: str) -> None:
+    list_path = dst_path + ".txt"
+    with open(list_path, "w") as f:
+        f.writelines(f"file '{p}'\n" for p in parts)
+    _run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", "-movflags", "+faststart", dst_path])
+    os.remove(list_path)
+
+
+def _merge_frames(parts: List[Optional[FrameSet]], frames_dir: Optional[str], max_frames: int) -> FrameSet:
+    # Segment frames in order, renumbered from 1 and capped at max_frames
+    parts = [p for p in parts if p is not None and len(p.names)]
+    if not parts:
+        return FrameSet(names=[], pixels=np.empty((0, FRAME_SIZE, FRAME_SIZE, 3), dtype=np.uint8))
+    pixels = np.concatenate([p.pixels for p in parts])[:max_frames]
+    names = frame_names(len(pixels))
+    paths = None
+    if frames_dir is not None:
+        os.makedirs(frames_dir, exist_ok=True)
+        paths = [os.path.join(frames_dir, n) for n in names]
+        for src, dst in zip([fp for p in parts for fp in p.paths or []], paths):
+            os.replace(src, dst)
+    return FrameSet(names=names, pixels=pixels, paths=paths)
+
+
+def decode_segmented(
+    src_path: str,
+    std_path: str,
+    frames_dir: Optional[str],
+    audio_path: str,
+    fps: float,
+    max_frames: int,
+    probe: dict,
+    count: int,
+    feed: Optional[Feed] = None,
+    sampling: str = "fps",
+) -> FrameSet:
+    # Same outputs as decode_fused (transcode), with the encode split across count processes
+    duration = _probe_duration(probe)
+    seg_dir = os.path.join(os.path.dirname(std_path), "segments")
+    segments = split_segments(src_path, seg_dir, audio_path, duration, count, probe, feed=feed)
+    sampler, sampling_meta = _sampler_filter(sampling, fps, duration, max_frames)
+    threads = max(1, _segment_cores() // len(segments))
+    std_parts = [os.path.join(seg_dir, f"std_{k:03d}.mp4") for k in range(len(segments))]
+    with ThreadPoolExecutor(max_workers=len(segments)) as pool:
+        futures = []
+        for k, (seg_path, start) in enumerate(segments):
+            end = segments[k + 1][1] if k + 1 < len(segments) else None
+            # fps samples from the start: segments beyond the cap add no frames
+            past_cap = sampling_meta["mode"] == "fps" and start * fps >= max_frames
+            part_frames = os.path.join(seg_dir, f"frames_{k:03d}") if frames_dir is not None else None
+            futures.append(pool.submit(
+                _decode_segment, seg_path, std_parts[k], part_frames, start, end,
+                None if past_cap else sampler, max_frames, threads,
+            ))
+        parts = [f.result() for f in futures]
+    concat_videos(std_parts, std_path)
+    frames = _merge_frames(parts, frames_dir, max_frames)
+    frames.sampling = dict(sampling_meta, segments=len(segments))
+    shutil.rmtree(seg_dir, ignore_errors=True)
+    return frames
+
+
+def load_frames(frames: List[str]) -> np.ndarray:
+    # Decode JPEG frames into one contiguous (N, H, W, 3) uint8 stack
+    arrays = []
     for fp in frames:
-        try:
-            with Image.open(fp) as im:
-                im = im.convert("RGB")
-                h = imagehash.phash(im)
-                out[os.path.basename(fp)] = str(h)
-        except Exception:
-            continue
+        with Image.open(fp) as im:
+            arrays.append(np.asarray(im.convert("RGB")))
+    if not arrays:
+        return np.empty((0, FRAME_SIZE, FRAME_SIZE, 3), dtype=np.uint8)
+    return np.ascontiguousarray(np.stack(arrays))
+
+
+def _faces_to_items(boxes: np.ndarray, scores: np.ndarray, kps: np.ndarray) -> List[Dict]:
+    # One tolist() per array per frame instead of per face
+    return [
+        {"bbox": b, "kps": k, "det_score": s}
+        for b, k, s in zip(
+            boxes.astype(float).tolist(),
+            kps.astype(float).tolist(),
+            scores.astype(float).tolist(),
+        )
+    ]
+
+
+def _detect_frames(fa, pixels: np.ndarray, indices: List[int]) -> List[Detection]:
+    # One (boxes, scores, kps) per frame index; batched when the detector allows
+    stack = pixels[indices]
+    if supports_batch(fa):
+        return detect_batch(fa.det_model, stack)
+    out = []
+    for img in stack:
+        faces = fa.get(np.ascontiguousarray(img[..., ::-1]))  # FaceAnalysis expects BGR
+        out.append((
+            np.array([f.bbox for f in faces]).reshape(-1, 4),
+            np.array([getattr(f, "det_score", 0) for f in faces]),
+            np.array([getattr(f, "kps", np.zeros((5, 2))) for f in faces]).reshape(-1, 5, 2),
+        ))
     return out
 
 
+def detect_faces(frames: FrameSet, max_samples: int) -> Tuple[Dict[str, List[Dict]], Dict]:
+    # FACE_DETECT_MODE=sample: detector on the first max_samples frames only.
+    # track: detector every FACE_TRACK_INTERVAL frames, faces tracked in between
+    # (see face_tracking), so every frame gets face data.
+    results: Dict[str, List[Dict]] = {}
+    info: Dict = {"mode": settings.face_detect_mode, "detector_frames": 0}
+    if not frames.names:
+        return results, info
+    fa = get_face_analyzer()
+    if fa is None:
+        return results, info
+    detect = functools.partial(_detect_frames, fa, frames.pixels)
+    if settings.face_detect_mode == "track":
+        faces, info["detector_frames"] = track_faces(frames.pixels, detect, settings.face_track_interval)
+        info["interval"] = settings.face_track_interval
+        return dict(zip(frames.names, faces)), info
+    names = frames.names[:max_samples]
+    batch = max(1, settings.face_detect_batch)
+    for start in range(0, len(names), batch):
+        idx = list(range(start, min(start + batch, len(names))))
+        for i, (boxes, scores, kps) in zip(idx, detect(idx)):
+            results[names[i]] = _faces_to_items(boxes, scores, kps)
+    info["detector_frames"] = len(names)
+    return results, info
+
+
+def compute_phash(frames: FrameSet) -> Tuple[Dict[str, str], np.ndarray]:
+    # Hex strings for metadata.json plus the packed uint64 hashes for
+    # vectorized Hamming distance (phash.hamming)
+    packed = phash_batch(frames.pixels)
+    return dict(zip(frames.names, to_hex(packed))), packed
+
+
+def encode_jpeg(pixels: np.ndarray, quality: int = 95) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
 def write_json(path: str, data: dict) -> None:
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
-def upload_artifacts(job_id: str, local_video: str, local_audio: str, local_frames: List[str], local_meta: str) -> Artifacts:
-    video_key = make_key(job_id, "video", "standard.mp4")
-    audio_key = make_key(job_id, "audio", "audio.wav")
-    frames_keys = [make_key(job_id, "frames", os.path.basename(p)) for p in local_frames]
-    meta_key = make_key(job_id, "metadata", "metadata.json")
-
-    video_s3 = upload_file(local_video, settings.s3_bucket, video_key, "video/mp4")
-    audio_s3 = upload_file(local_audio, settings.s3_bucket, audio_key, "audio/wav")
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _jpeg_sources(frames: FrameSet) -> List[UploadSource]:
+    if frames.paths is not None:
+        return list(frames.paths)
+    # In-memory frames are encoded exactly once, where they are consumed
+    return [functools.partial(encode_jpeg, pixels) for pixels in frames.pixels]
+
+
+def write_frame_shard(frames: FrameSet, shard_dir: str, fmt: str) -> Tuple[str, str, dict]:
+    shard_path = os.path.join(shard_dir, shard_filename(fmt))
+    index_path = os.path.join(shard_dir, "index.json")
+    if fmt == FORMAT_RAW:
+        index = write_raw_shard(shard_path, frames.names, frames.pixels)
+    else:
+        producers = [
+            functools.partial(_read_bytes, src) if isinstance(src, str) else src
+            for src in _jpeg_sources(frames)
+        ]
+        index = write_jpeg_shard(shard_path, frames.names, producers)  # type: ignore[arg-type]
+    write_index(index_path, index)
+    return shard_path, index_path, index
+
+
+def upload_artifacts(
+    job_id: str,
+    local_video: Optional[str],
+    local_audio: Optional[str],
+    frames: Optional[FrameSet],
+    local_meta: str,
+    shard: Optional[Tuple[str, str]] = None,
+) -> Artifacts:
+    # Artifacts a job does not have (video/audio for images, frames for audio) are None
+    items: List[Tuple[UploadSource, str, Optional[str]]] = []
+    fields: List[str] = []  # Artifacts field per item
+
+    def add(name: str, source: UploadSource, key: str, content_type: str) -> None:
+        items.append((source, key, content_type))
+        fields.append(name)
+
+    if local_video is not None:
+        add("video_s3", local_video, make_key(job_id, "video", "standard.mp4"), "video/mp4")
+    if local_audio is not None:
+        add("audio_s3", local_audio, make_key(job_id, "audio", "audio.wav"), "audio/wav")
+    if shard is not None:
+        # One shard object plus its index instead of one object per frame
+        shard_path, index_path = shard
+        add("frames_shard_s3", shard_path, make_key(job_id, "frames", os.path.basename(shard_path)), "application/octet-stream")
+        add("frames_index_s3", index_path, make_key(job_id, "frames", "index.json"), "application/json")
+    elif frames is not None:
+        for src, name in zip(_jpeg_sources(frames), frames.names):
+            add("frames_s3", src, make_key(job_id, "frames", name), "image/jpeg")
+    add("metadata_s3", local_meta, make_key(job_id, "metadata", "metadata.json"), "application/json")
+
+    urls, sent = upload_many_sized(items, settings.s3_bucket)
+    out: Dict = {"frames_s3": []}
+    for name, url in zip(fields, urls):
+        if name == "frames_s3":
+            out[name].append(url)
+        else:
+            out[name] = url
+    return Artifacts(bytes_uploaded=sent, **out)
+
+
+def _prepare_job_dir(job_id: str, job_dir: Optional[str] = None) -> str:
+    # job_dir comes from the worker's ScratchManager; callers without one use WORK_DIR
+    job_dir = job_dir or os.path.join(settings.work_dir, job_id)
+    if os.path.isdir(job_dir):
+        shutil.rmtree(job_dir, ignore_errors=True)
+    os.makedirs(job_dir, exist_ok=True)
+    return job_dir
+
+
+def _finish(
+    job_id: str,
+    job_dir: str,
+    metadata: dict,
+    timer: StageTimer,
+    frames: Optional[FrameSet],
+    local_video: Optional[str],
+    local_audio: Optional[str],
+) -> Tuple[Artifacts, dict]:
+    # Optional packed frame shard, metadata.json, upload
+    shard = None
+    if frames is not None and settings.frame_artifact_format in (FORMAT_RAW, FORMAT_JPEG):
+        with timer.stage("shard"):
+            shard_path, index_path, _ = write_frame_shard(frames, os.path.join(job_dir, "shard"), settings.frame_artifact_format)
+        shard = (shard_path, index_path)
+        metadata["frames"].update({
+            "format": settings.frame_artifact_format,
+            "shard": os.path.basename(shard_path),
+            "index": "index.json",
+        })
+
+    # Stages up to here; the upload that follows is only in the returned copy
+    meta_path = os.path.join(job_dir, "metadata.json")
+    write_json(meta_path, dict(metadata, timing=timer.snapshot()) if settings.metadata_timing else metadata)
 
-    frames_s3: List[str] = []
-    for lp, key in zip(local_frames, frames_keys):
-        frames_s3.append(upload_file(lp, settings.s3_bucket, key, "image/jpeg"))
+    with timer.stage("upload"):
+        artifacts = upload_artifacts(job_id, local_video, local_audio, frames, meta_path, shard=shard)
+    timer.add("bytes_uploaded", artifacts.bytes_uploaded)
 
-    metadata_s3 = upload_file(local_meta, settings.s3_bucket, meta_key, "application/json")
+    metadata["timing"] = timer.snapshot()
+    return artifacts, metadata
 
-    return Artifacts(video_s3=video_s3, audio_s3=audio_s3, frames_s3=frames_s3, metadata_s3=metadata_s3)
 
+def _reusable(match: dict, duration: float, frame_count: int) -> bool:
+    # Beyond two-way frame coverage, the earlier job must be the same length:
+    # its metadata.json has to agree on duration and sampled frame count
+    artifacts = match.get("artifacts")
+    if not artifacts or not artifacts.get("metadata") or duration <= 0:
+        return False
+    try:
+        earlier = json.loads(read_object(artifacts["metadata"]))
+    except Exception:
+        return False
+    earlier_duration = (earlier.get("source") or {}).get("duration") or 0
+    return (
+        earlier.get("frames", {}).get("count") == frame_count
+        and abs(earlier_duration - duration) <= settings.near_dup_reuse_max_duration_diff_s
+    )
+
+
+def process_job(
+    job_id: str,
+    s3_url: str,
+    timer: Optional[StageTimer] = None,
+    content_type: Optional[str] = None,
+    job_dir: Optional[str] = None,
+    near_dup_scope: Optional[str] = None,
+) -> Tuple[Optional[Artifacts], dict]:
+    # content_type as recorded by ingestion; anything but image/audio is a video.
+    # near_dup_scope: whose videos near-duplicates are looked up among; None skips the lookup
+    timer = timer or StageTimer()
+    if content_type == "image":
+        return process_image_job(job_id, s3_url, timer, job_dir)
+    if content_type == "audio":
+        return process_audio_job(job_id, s3_url, timer, job_dir)
 
-def process_job(job_id: str, s3_url: str) -> Tuple[Artifacts, dict]:
     # Prepare workspace
-    job_dir = os.path.join(settings.work_dir, job_id)
-    if os.path.isdir(job_dir):
-        shutil.rmtree(job_dir, ignore_errors=True)
-    os.makedirs(job_dir, exist_ok=True)
-
+    job_dir = _prepare_job_dir(job_id, job_dir)
     src_video = os.path.join(job_dir, "input")
     std_video = os.path.join(job_dir, "standard.mp4")
     audio_path = os.path.join(job_dir, "audio.wav")
-    frames_dir = os.path.join(job_dir, "frames")
-    meta_path = os.path.join(job_dir, "metadata.json")
-
-    # Download source video from S3
-    download_to_path(s3_url, src_video)
-
-    # Standardize
-    standardize_video(src_video, std_video)
+    # Raw transport keeps frames in memory; JPEG transport has ffmpeg write them here
+    frames_dir = os.path.join(job_dir, "frames") if settings.frame_transport == "jpeg" else None
+
+    # Source: stream large objects from S3 into ffmpeg while they download,
+    # otherwise download to disk first. The separate-pass pipeline reads the
+    # source twice (video, then audio), so it always downloads.
+    with timer.stage("download"):
+        plan = plan_stream(s3_url) if settings.stream_input and settings.fused_decode else None
+        if plan is not None:
+            src_input, feed, probe = "pipe:0", plan.feed, probe_media("pipe:0", data=plan.head)
+            timer.add("bytes_downloaded", plan.size)
+        else:
+            download_to_path(s3_url, src_video)
+            src_input, feed = src_video, None
+            timer.add("bytes_downloaded", os.path.getsize(src_video))
+
+    # One probe per job: it picks remux vs transcode, feeds every later stage
+    # and goes into the metadata
+    with timer.stage("probe"):
+        if plan is None:
+            probe = probe_media(src_video)
+        source = summarize_probe(probe)
+        remux = should_remux(source)
+
+    # Long transcodes run as parallel segments (scene sampling needs the whole
+    # stream in one filter, remux has nothing to parallelize)
+    segments = 1
+    if settings.fused_decode and not remux and settings.frame_sampling != "scene":
+        segments = segment_count(source["duration"])
+
+    if segments > 1:
+        with timer.stage("decode"):
+            frames = decode_segmented(
+                src_input, std_video, frames_dir, audio_path,
+                fps=settings.frame_rate, max_frames=settings.max_frames,
+                probe=probe, count=segments, feed=feed, sampling=settings.frame_sampling,
+            )
+    elif settings.fused_decode:
+        # Standardize, extract frames and audio from a single decode
+        with timer.stage("decode"):
+            frames = decode_fused(
+                src_input, std_video, frames_dir, audio_path,
+                fps=settings.frame_rate, max_frames=settings.max_frames,
+                probe=probe, feed=feed, sampling=settings.frame_sampling, remux=remux,
+            )
+    else:
+        # Standardize
+        with timer.stage("standardize"):
+            standardize_video(src_input, std_video, remux=remux)
+
+        # Extract frames and audio (audio from the source: the standardized
+        # output drops it)
+        # Keyframes are the source's, as in the fused path (a transcode places its own)
+        with timer.stage("frames"):
+            frames = extract_frames(
+                src_video if settings.frame_sampling == "keyframes" else std_video,
+                frames_dir, fps=settings.frame_rate, max_frames=settings.max_frames,
+                sampling=settings.frame_sampling, duration=source["duration"],
+            )
+        with timer.stage("audio"):
+            extract_audio(src_video, audio_path, probe=probe)
 
-    # Extract frames and audio
-    frames = extract_frames(std_video, frames_dir, fps=settings.frame_rate, max_frames=settings.max_frames)
-    extract_audio(std_video, audio_path)
+    # Perceptual hashes
+    with timer.stage("phash"):
+        phashes, packed = compute_phash(frames)
+    timer.add("frames", len(frames.names))
+
+    # Videos already known to be near-identical (re-encodes, crops, re-uploads)
+    near_dups: List[dict] = []
+    if settings.near_dup_mode != "off" and near_dup_scope:
+        with timer.stage("near_dup"):
+            near_dups = find_near_duplicates(near_dup_scope, job_id, packed)
+    reuse = None
+    if settings.near_dup_mode == "reuse":
+        reuse = next((m for m in near_dups if _reusable(m, source["duration"], len(frames.names))), None)
+    near_dups_meta = [
+        {k: m[k] for k in ("job_id", "matched_frames", "query_coverage", "candidate_coverage", "ratio")}
+        for m in near_dups
+    ]
+    if reuse is not None:
+        # Short-circuit: skip face detection and uploads, the worker publishes
+        # the earlier job's artifacts
+        metadata = {
+            "job_id": job_id,
+            "source_s3": s3_url,
+            "phash": phashes,
+            "near_duplicates": near_dups_meta,
+            "reused": {"job_id": reuse["job_id"], "artifacts": reuse["artifacts"]},
+            "timing": timer.snapshot(),
+        }
+        return None, metadata
 
     # Face detection (sampled)
-    faces = detect_faces(frames, settings.face_detect_sample)
-
-    # Perceptual hashes
-    phashes = compute_phash(frames)
+    with timer.stage("faces"):
+        faces, face_detection = detect_faces(frames, settings.face_detect_sample)
+    timer.add("faces", sum(len(v) for v in faces.values()))
+
+    frames_meta = {
+        "count": len(frames.names),
+        "size": [FRAME_SIZE, FRAME_SIZE],
+        "fps": settings.frame_rate,
+        "sampling": frames.sampling,
+    }
 
     # Metadata bundle
     metadata = {
         "job_id": job_id,
         "source_s3": s3_url,
+        "content_type": "video",
+        "source": source,
         "video": {
             "standardized": "standard.mp4",
+            "standardize": "remux" if remux else "transcode",
+            "segments": segments,
         },
         "audio": {
             "path": "audio.wav",
             "sample_rate": 16000,
             "channels": 1,
         },
-        "frames": {
-            "count": len(frames),
-            "size": [224, 224],
-            "fps": settings.frame_rate,
-        },
+        "frames": frames_meta,
+        "faces": faces,
+        "face_detection": face_detection,
+        "phash": phashes,
+        "near_duplicates": near_dups_meta,
+    }
+    return _finish(job_id, job_dir, metadata, timer, frames, std_video, audio_path)
+
+
+def decode_image(path: str) -> Tuple[np.ndarray, dict]:
+    # (1, FRAME_SIZE, FRAME_SIZE, 3) RGB, same stretch-to-square as the video
+    # frame filter, plus what the source was. Only the first frame of animations.
+    with Image.open(path) as im:
+        info = {"format": im.format, "width": im.width, "height": im.height}
+        # JPEG: let libjpeg scale down while decoding (DCT scaling) when the
+        # image is much larger than the target; lanczos does the rest
+        im.draft("RGB", (FRAME_SIZE, FRAME_SIZE))
+        im = ImageOps.exif_transpose(im).convert("RGB")
+        im = im.resize((FRAME_SIZE, FRAME_SIZE), Image.Resampling.LANCZOS)
+        return np.asarray(im)[None, ...].copy(), info
+
+
+def process_image_job(job_id: str, s3_url: str, timer: StageTimer, job_dir: Optional[str] = None) -> Tuple[Artifacts, dict]:
+    # Decode and resize once in-process: no ffmpeg, no transcode, no audio.
+    # Single frames stay out of the near-duplicate index, whose ratios are per video.
+    job_dir = _prepare_job_dir(job_id, job_dir)
+    src = os.path.join(job_dir, "input")
+    with timer.stage("download"):
+        download_to_path(s3_url, src)
+        timer.add("bytes_downloaded", os.path.getsize(src))
+
+    with timer.stage("decode"):
+        pixels, image_info = decode_image(src)
+        frames = FrameSet(names=frame_names(1), pixels=pixels, sampling={"mode": "image"})
+
+    with timer.stage("phash"):
+        phashes, _ = compute_phash(frames)
+    timer.add("frames", 1)
+
+    with timer.stage("faces"):
+        faces, face_detection = detect_faces(frames, settings.face_detect_sample)
+    timer.add("faces", sum(len(v) for v in faces.values()))
+
+    metadata = {
+        "job_id": job_id,
+        "source_s3": s3_url,
+        "content_type": "image",
+        "image": image_info,
+        "frames": {"count": 1, "size": [FRAME_SIZE, FRAME_SIZE], "sampling": frames.sampling},
         "faces": faces,
+        "face_detection": face_detection,
         "phash": phashes,
+        "near_duplicates": [],
     }
-    write_json(meta_path, metadata)
+    return _finish(job_id, job_dir, metadata, timer, frames, None, None)
 
-    # Upload artifacts
-    artifacts = upload_artifacts(job_id, std_video, audio_path, frames, meta_path)
 
-    return artifacts, metadata
+def process_audio_job(job_id: str, s3_url: str, timer: StageTimer, job_dir: Optional[str] = None) -> Tuple[Artifacts, dict]:
+    # Resample only
+    job_dir = _prepare_job_dir(job_id, job_dir)
+    src = os.path.join(job_dir, "input")
+    audio_path = os.path.join(job_dir, "audio.wav")
+    with timer.stage("download"):
+        plan = plan_stream(s3_url, needs_duration=False) if settings.stream_input else None
+        if plan is not None:
+            src_input, feed = "pipe:0", plan.feed
+            timer.add("bytes_downloaded", plan.size)
+        else:
+            download_to_path(s3_url, src)
+            src_input, feed = src, None
+            timer.add("bytes_downloaded", os.path.getsize(src))
+
+    with timer.stage("audio"):
+        _run_ffmpeg(["-i", src_input, "-vn"] + _AUDIO_ARGS + [audio_path], feed=feed)
+
+    metadata = {
+        "job_id": job_id,
+        "source_s3": s3_url,
+        "content_type": "audio",
+        "audio": {
+            "path": "audio.wav",
+            "sample_rate": 16000,
+            "channels": 1,
+        },
+        "frames": {"count": 0},
+        "faces": {},
+        "phash": {},
+        "near_duplicates": [],
+    }
+    return _finish(job_id, job_dir, metadata, timer, None, None, audio_path)
@@ -1,11 +1,43 @@
 import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple, Union
+
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
 from urllib.parse import urlparse
 from .config import settings
 
+_MB = 1024 * 1024
+
 _session = boto3.session.Session(region_name=settings.aws_region)
-s3 = _session.client("s3", config=Config(s3={"addressing_style": "path"}))
+s3 = _session.client(
+    "s3",
+    endpoint_url=settings.s3_endpoint_url,
+    config=Config(
+        s3={"addressing_style": "path"},
+        max_pool_connections=settings.s3_max_pool_connections,
+        retries={"max_attempts": 5, "mode": "adaptive"},
+    ),
+)
+
+# Shared by every transfer in the process; upload_file/download_file split large
+# objects into parts and move them on the transfer manager's own threads.
+transfer_config = TransferConfig(
+    multipart_threshold=settings.s3_multipart_threshold_mb * _MB,
+    multipart_chunksize=settings.s3_multipart_chunksize_mb * _MB,
+    max_concurrency=settings.s3_transfer_concurrency,
+    use_threads=True,
+)
+
+# A path on disk, an in-memory body, or a callable producing one (run on the
+# upload thread, e.g. JPEG encoding)
+UploadSource = Union[str, bytes, Callable[[], bytes]]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
 
 def parse_s3_url(s3_url: str) -> tuple[str, str]:
     if not s3_url.startswith("s3://"):
@@ -21,15 +53,111 @@ def parse_s3_url(s3_url: str) -> tuple[str, str]:
 def download_to_path(s3_url: str, dest_path: str):
     bucket, key = parse_s3_url(s3_url)
     os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-    s3.download_file(bucket, key, dest_path)
+    s3.download_file(bucket, key, dest_path, Config=transfer_config)
+
+
+def head_object(s3_url: str) -> Tuple[int, str]:
+    bucket, key = parse_s3_url(s3_url)
+    resp = s3.head_object(Bucket=bucket, Key=key)
+    return int(resp["ContentLength"]), resp.get("ETag", "")
+
+
+def iter_object(s3_url: str, size: int, part_size: int, readahead: int, etag: str = "") -> Iterator[bytes]:
+    # Yield the object in order while up to `readahead` ranged GETs run ahead of
+    # the consumer; memory is bounded by readahead * part_size. IfMatch pins
+    # every part to the same object version.
+    bucket, key = parse_s3_url(s3_url)
+    extra = {"IfMatch": etag} if etag else {}
+
+    def fetch(start: int) -> bytes:
+        end = min(start + part_size, size) - 1
+        resp = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", **extra)
+        return resp["Body"].read()
+
+    starts = iter(range(0, size, part_size))
+    pool = ThreadPoolExecutor(max_workers=max(1, readahead), thread_name_prefix="s3-read")
+    pending: deque = deque()
+    try:
+        for start in starts:
+            pending.append(pool.submit(fetch, start))
+            if len(pending) >= readahead:
+                break
+        while pending:
+            data = pending.popleft().result()
+            nxt = next(starts, None)
+            if nxt is not None:
+                pending.append(pool.submit(fetch, nxt))
+            yield data
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_range(s3_url: str, start: int, end: int) -> bytes:
+    # Inclusive byte range, as in the HTTP Range header
+    bucket, key = parse_s3_url(s3_url)
+    resp = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")
+    return resp["Body"].read()
+
+
+def read_object(s3_url: str) -> bytes:
+    bucket, key = parse_s3_url(s3_url)
+    return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
 
 
 def upload_file(local_path: str, bucket: str, key: str, content_type: str | None = None) -> str:
     extra = {"ContentType": content_type} if content_type else {}
-    s3.upload_file(local_path, bucket, key, ExtraArgs=extra)  # type: ignore
+    s3.upload_file(local_path, bucket, key, ExtraArgs=extra, Config=transfer_config)  # type: ignore
+    return f"s3://{bucket}/{key}"
+
+
+def upload_bytes(data: bytes, bucket: str, key: str, content_type: str | None = None) -> str:
+    extra = {"ContentType": content_type} if content_type else {}
+    s3.put_object(Bucket=bucket, Key=key, Body=data, **extra)
     return f"s3://{bucket}/{key}"
 
 
 def make_key(job_id: str, *parts: str) -> str:
     safe_parts = [p.strip("/") for p in parts if p]
     return f"{settings.s3_preproc_prefix}/{job_id}/" + "/".join(safe_parts)
+
+
+def _upload_executor() -> ThreadPoolExecutor:
+    # Created lazily so forked worker processes get their own pool
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.s3_upload_concurrency,
+                    thread_name_prefix="s3-upload",
+                )
+    return _executor
+
+
+def _upload_one(source: UploadSource, bucket: str, key: str, content_type: str | None) -> Tuple[str, int]:
+    if isinstance(source, str):
+        return upload_file(source, bucket, key, content_type), os.path.getsize(source)
+    body = source() if callable(source) else source
+    return upload_bytes(body, bucket, key, content_type), len(body)
+
+
+def upload_many(items: Sequence[Tuple[UploadSource, str, Optional[str]]], bucket: str) -> List[str]:
+    return upload_many_sized(items, bucket)[0]
+
+
+def upload_many_sized(items: Sequence[Tuple[UploadSource, str, Optional[str]]], bucket: str) -> Tuple[List[str], int]:
+    # Upload (source, key, content_type) items concurrently on the shared pool.
+    # URLs come back in input order, with the total bytes sent; the first
+    # failure cancels whatever has not started yet and is re-raised.
+    if not items:
+        return [], 0
+    pool = _upload_executor()
+    futures = [pool.submit(_upload_one, src, bucket, key, ct) for src, key, ct in items]
+    done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+    for fut in futures:
+        if fut in done and fut.exception() is not None:
+            for p in pending:
+                p.cancel()
+            raise fut.exception()  # type: ignore[misc]
+    results = [fut.result() for fut in futures]
+    return [url for url, _ in results], sum(size for _, size in results)
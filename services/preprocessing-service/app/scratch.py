@@ -0,0 +1,129 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+from .config import settings
+from . import metrics
+
+logger = logging.getLogger("preprocessing-worker")
+
+# Job workspaces (source, standard.mp4, audio.wav, frames, segments, shard)
+# live under WORK_DIR, or under SCRATCH_TMPFS_DIR for small jobs. Each job
+# reserves an estimate of its peak usage before it starts; a job that does not
+# fit the budget waits for running jobs to release theirs. A job is always
+# admitted when nothing else holds a reservation, so an oversized source still
+# runs, alone. The directory is removed when the job ends, however it ends, and
+# start() clears whatever a previous run left behind.
+#
+# Reservations are per worker process: WORK_DIR must not be shared between
+# workers, as start() empties it.
+
+_MB = 1024 * 1024
+
+
+@dataclass
+class _Tier:
+    name: str
+    root: str
+    budget: int
+    max_job: int  # larger jobs go to the next tier
+    reserved: int = 0
+    jobs: int = 0
+
+
+class ScratchManager:
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._tiers: Optional[List[_Tier]] = None
+
+    def start(self) -> None:
+        # Worker startup: remove job dirs of a previous run (crash, kill -9)
+        with self._cond:
+            self._tiers = self._make_tiers(purge=True)
+
+    def estimate(self, source_bytes: Optional[int]) -> int:
+        # Peak usage: the source, its transcode and segments scale with its size;
+        # audio, frames and shard are covered by the fixed overhead
+        source = max(0, source_bytes or 0)
+        return int(source * settings.scratch_size_factor) + settings.scratch_job_overhead_mb * _MB
+
+    @contextmanager
+    def job_dir(self, job_id: str, source_bytes: Optional[int]) -> Iterator[str]:
+        need = self.estimate(source_bytes)
+        tier = self._acquire(need)
+        path = os.path.join(tier.root, job_id)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            self._release(tier, need)
+
+    def _make_tiers(self, purge: bool) -> List[_Tier]:
+        tiers = []
+        if settings.scratch_tmpfs_dir:
+            tiers.append(_Tier(
+                "tmpfs",
+                settings.scratch_tmpfs_dir,
+                settings.scratch_tmpfs_budget_mb * _MB,
+                settings.scratch_tmpfs_max_job_mb * _MB,
+            ))
+        tiers.append(_Tier("disk", settings.work_dir, 0, 0))
+        for tier in tiers:
+            if purge and os.path.isdir(tier.root):
+                stale = os.listdir(tier.root)
+                for name in stale:
+                    path = os.path.join(tier.root, name)
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.unlink(path)
+                if stale:
+                    logger.info("Removed %d stale entries from %s", len(stale), tier.root)
+            os.makedirs(tier.root, exist_ok=True)
+        disk = tiers[-1]
+        # 0 = 90% of what is free now, with nothing of ours left on it
+        disk.budget = settings.scratch_budget_mb * _MB or int(shutil.disk_usage(disk.root).free * 0.9)
+        for tier in tiers:
+            metrics.SCRATCH_BUDGET.labels(tier.name).set(tier.budget)
+        logger.info(
+            "Scratch budget: %s",
+            ", ".join(f"{t.name} {t.root} {t.budget // _MB} MB" for t in tiers),
+        )
+        return tiers
+
+    def _fit(self, need: int) -> Optional[_Tier]:
+        tiers = self._tiers
+        for tier in tiers[:-1]:
+            if need <= tier.max_job and tier.reserved + need <= tier.budget:
+                return tier
+        disk = tiers[-1]
+        if disk.jobs == 0 or disk.reserved + need <= disk.budget:
+            return disk
+        return None
+
+    def _acquire(self, need: int) -> _Tier:
+        t0 = time.monotonic()
+        with self._cond:
+            if self._tiers is None:
+                self._tiers = self._make_tiers(purge=False)
+            tier = self._fit(need)
+            while tier is None:
+                self._cond.wait()
+                tier = self._fit(need)
+            tier.reserved += need
+            tier.jobs += 1
+            metrics.SCRATCH_RESERVED.labels(tier.name).set(tier.reserved)
+        metrics.SCRATCH_WAIT_SECONDS.observe(time.monotonic() - t0)
+        return tier
+
+    def _release(self, tier: _Tier, need: int) -> None:
+        with self._cond:
+            tier.reserved -= need
+            tier.jobs -= 1
+            metrics.SCRATCH_RESERVED.labels(tier.name).set(tier.reserved)
+            self._cond.notify_all()
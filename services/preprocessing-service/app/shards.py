@@ -0,0 +1,130 @@
+import io
+import json
+import os
+import struct
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+# Packed frame shards: every sampled frame of a job in a single object, plus a
+# small JSON index, instead of one S3 object per frame.
+#
+#   raw   fixed-stride uint8 tensor behind a 64-byte header. Frame i starts at
+#         header_bytes + i * stride, so readers can np.memmap the file or fetch
+#         one frame with a ranged GET without consulting the index.
+#   jpeg  JPEG files concatenated back to back; the index carries each frame's
+#         byte offset and length.
+
+FORMAT_RAW = "raw"
+FORMAT_JPEG = "jpeg"
+# FRAME_ARTIFACT_FORMAT values; "objects" uploads one JPEG per frame, no shard
+ARTIFACT_FORMATS = ("objects", FORMAT_RAW, FORMAT_JPEG)
+
+RAW_MAGIC = b"DGFR"
+RAW_VERSION = 1
+RAW_HEADER_BYTES = 64
+# magic, version, count, height, width, channels (uint8 pixels, RGB)
+_RAW_HEADER = struct.Struct("<4sHIHHH")
+
+
+def check_artifact_format(fmt: str) -> str:
+    # Worker startup: a typo must not silently fall back to one object per frame
+    if fmt not in ARTIFACT_FORMATS:
+        raise ValueError(f"Unknown FRAME_ARTIFACT_FORMAT {fmt!r} (known: {', '.join(ARTIFACT_FORMATS)})")
+    return fmt
+
+
+def shard_filename(fmt: str) -> str:
+    return "frames.raw" if fmt == FORMAT_RAW else "frames.jpgs"
+
+
+def write_raw_shard(path: str, names: List[str], pixels: np.ndarray) -> Dict:
+    count, height, width, channels = pixels.shape
+    header = _RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, count, height, width, channels)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(header.ljust(RAW_HEADER_BYTES, b"\0"))
+        f.write(memoryview(np.ascontiguousarray(pixels)).cast("B"))
+    return {
+        "format": FORMAT_RAW,
+        "count": count,
+        "names": names,
+        "shape": [height, width, channels],
+        "dtype": "uint8",
+        "header_bytes": RAW_HEADER_BYTES,
+        "stride": height * width * channels,
+    }
+
+
+def write_jpeg_shard(path: str, names: List[str], encoded: List[Callable[[], bytes]]) -> Dict:
+    offsets: List[int] = []
+    lengths: List[int] = []
+    pos = 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        for produce in encoded:
+            data = produce()
+            f.write(data)
+            offsets.append(pos)
+            lengths.append(len(data))
+            pos += len(data)
+    return {
+        "format": FORMAT_JPEG,
+        "count": len(names),
+        "names": names,
+        "offsets": offsets,
+        "lengths": lengths,
+    }
+
+
+def write_index(path: str, index: Dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+
+
+def frame_range(index: Dict, i: int) -> tuple[int, int]:
+    # Inclusive byte range of frame i, as used in an HTTP Range header
+    if not 0 <= i < index["count"]:
+        raise IndexError(i)
+    if index["format"] == FORMAT_RAW:
+        start = index["header_bytes"] + i * index["stride"]
+        return start, start + index["stride"] - 1
+    start = index["offsets"][i]
+    return start, start + index["lengths"][i] - 1
+
+
+def open_raw_shard(path: str) -> np.memmap:
+    # Memory-map a local raw shard as (count, height, width, channels)
+    with open(path, "rb") as f:
+        magic, version, count, height, width, channels = _RAW_HEADER.unpack(f.read(_RAW_HEADER.size))
+    if magic != RAW_MAGIC or version != RAW_VERSION:
+        raise ValueError("not a raw frame shard")
+    return np.memmap(path, dtype=np.uint8, mode="r", offset=RAW_HEADER_BYTES, shape=(count, height, width, channels))
+
+
+def read_frame(path: str, index: Dict, i: int) -> np.ndarray:
+    # Decode one frame of a local shard of either format
+    if index["format"] == FORMAT_RAW:
+        return np.asarray(open_raw_shard(path)[i])
+    start, end = frame_range(index, i)
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start + 1)
+    return decode_frame(index, data)
+
+
+def decode_frame(index: Dict, data: bytes) -> np.ndarray:
+    # Turn the bytes of one frame (e.g. from a ranged GET) into an RGB array
+    if index["format"] == FORMAT_RAW:
+        return np.frombuffer(data, dtype=np.uint8).reshape(index["shape"])
+    with Image.open(io.BytesIO(data)) as im:
+        return np.asarray(im.convert("RGB"))
+
+
+def fetch_frame(s3_url: str, index: Dict, i: int, get_range: Optional[Callable[[str, int, int], bytes]] = None) -> np.ndarray:
+    # Fetch a single frame from a shard in S3 with one ranged GET
+    if get_range is None:
+        from .s3_utils import get_range
+    start, end = frame_range(index, i)
+    return decode_frame(index, get_range(s3_url, start, end))
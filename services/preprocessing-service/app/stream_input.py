@@ -0,0 +1,85 @@
+import struct
+from dataclasses import dataclass
+from typing import IO, Optional
+
+from .config import settings
+from .s3_utils import get_range, head_object, iter_object
+
+# Streaming source input: instead of downloading the whole upload to WORK_DIR
+# before ffmpeg starts, parallel ranged GETs are piped into ffmpeg's stdin so
+# network transfer overlaps decode.
+#
+# Pipes cannot seek, and ffprobe only sees the head of the object, while the
+# probed duration drives segmenting, uniform sampling, silent audio and the
+# metadata. Only ISO BMFF files (mp4/mov/m4v/3gp) with the moov atom ahead of
+# mdat are streamed: moov carries the duration and the sample tables. Anything
+# else (moov behind mdat, MPEG-TS, mkv/webm, ...) is downloaded to disk and
+# probed whole. Callers that never use the duration (audio-only jobs) may
+# stream other containers too.
+
+_MB = 1024 * 1024
+
+
+@dataclass
+class StreamPlan:
+    s3_url: str
+    size: int
+    etag: str
+    head: bytes  # leading bytes of the object, enough for ffprobe
+
+    def feed(self, pipe: IO[bytes]) -> None:
+        for chunk in iter_object(
+            self.s3_url,
+            self.size,
+            part_size=settings.stream_part_mb * _MB,
+            readahead=settings.stream_readahead_parts,
+            etag=self.etag,
+        ):
+            pipe.write(chunk)
+
+
+def _box_at(s3_url: str, head: bytes, offset: int, size: int) -> tuple[bytes, int]:
+    hdr = head[offset:offset + 16]
+    if len(hdr) < 16 and offset + len(hdr) < size:
+        hdr = get_range(s3_url, offset, min(offset + 15, size - 1))
+    if len(hdr) < 8:
+        return b"", 0
+    box_size, box_type = struct.unpack(">I4s", hdr[:8])
+    if box_size == 1 and len(hdr) >= 16:
+        box_size = struct.unpack(">Q", hdr[8:16])[0]
+    elif box_size == 0:
+        box_size = size - offset  # box runs to end of file
+    return box_type, box_size
+
+
+def _moov_end(s3_url: str, head: bytes, size: int) -> Optional[int]:
+    # Walk top-level boxes; returns the end offset of moov if it precedes mdat
+    offset = 0
+    while offset + 8 <= size:
+        box_type, box_size = _box_at(s3_url, head, offset, size)
+        if box_size < 8:
+            return None
+        if box_type == b"moov":
+            return offset + box_size
+        if box_type == b"mdat":
+            return None
+        offset += box_size
+    return None
+
+
+def plan_stream(s3_url: str, needs_duration: bool = True) -> Optional[StreamPlan]:
+    # None means: download to disk first
+    size, etag = head_object(s3_url)
+    if size < settings.stream_input_min_mb * _MB:
+        return None  # small objects download faster than a pipe warms up
+    probe_bytes = min(size, settings.stream_probe_mb * _MB)
+    head = get_range(s3_url, 0, probe_bytes - 1)
+    if head[4:8] != b"ftyp":
+        return None if needs_duration else StreamPlan(s3_url=s3_url, size=size, etag=etag, head=head)
+    moov_end = _moov_end(s3_url, head, size)
+    if moov_end is None:
+        return None
+    if moov_end > len(head):
+        # ffprobe needs the whole moov to report streams and duration
+        head += get_range(s3_url, len(head), moov_end - 1)
+    return StreamPlan(s3_url=s3_url, size=size, etag=etag, head=head)
@@ -0,0 +1,49 @@
+import resource
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+def _usage() -> tuple:
+    # CPU seconds and peak RSS (KiB on Linux) for this process and for its
+    # finished children (ffmpeg/ffprobe runs are waited for inside a stage)
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return me.ru_utime + me.ru_stime, kids.ru_utime + kids.ru_stime, me.ru_maxrss, kids.ru_maxrss
+
+
+class StageTimer:
+    # Wall time, CPU time and peak RSS per named stage of one job. Peak RSS is
+    # a high-water mark: a stage reports the largest footprint reached by the
+    # end of it, not its own increment.
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}  # bytes moved, frames, faces
+
+    def add(self, counter: str, amount: float) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        wall0 = time.perf_counter()
+        cpu0, child_cpu0, _, _ = _usage()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall0
+            cpu, child_cpu, rss, child_rss = _usage()
+            s = self.stages.setdefault(name, {
+                "wall_s": 0.0, "cpu_s": 0.0, "child_cpu_s": 0.0, "peak_rss_mb": 0.0, "child_peak_rss_mb": 0.0,
+            })
+            s["wall_s"] += wall
+            s["cpu_s"] += cpu - cpu0
+            s["child_cpu_s"] += child_cpu - child_cpu0
+            s["peak_rss_mb"] = max(s["peak_rss_mb"], rss / 1024.0)
+            s["child_peak_rss_mb"] = max(s["child_peak_rss_mb"], child_rss / 1024.0)
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return {name: {k: round(v, 4) for k, v in s.items()} for name, s in self.stages.items()}
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {"stages": self.as_dict(), "counters": dict(self.counters)}
@@ -4,17 +4,32 @@ import sys
 import time
 import json
 import logging
-from datetime import datetime
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import Optional
 
-from sqlalchemy import create_engine, select
+from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from confluent_kafka import KafkaError
+from confluent_kafka import KafkaError, TopicPartition
 
 from .config import settings
-from .models import Base, Job
+from .models import Base, upgrade_schema
 from .kafka_utils import create_consumer, KafkaProducer
+from .offsets import OffsetTracker
+from .lanes import LaneScheduler, parse_lanes
+from .job_state import JobStateWriter
+from . import metrics
+from .content_cache import cache_scope, lookup_artifacts, maybe_evict, store_artifacts
+from .phash import from_hex
+from .phash_index import insert_hashes
 from .processor import process_job
+from .shards import check_artifact_format
+from .s3_utils import head_object
+from .scratch import ScratchManager
+from .face_models import warmup as warmup_face_model
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,12 +41,17 @@ logger = logging.getLogger("preprocessing-worker")
 # Database setup
 engine = create_engine(settings.db_url, pool_pre_ping=True)
 SessionLocal = sessionmaker(bind=engine)
-Base.metadata.create_all(bind=engine)
+# Messages being handled; the job-state writer lingers for batches only when > 1
+_active_jobs = 0
+_active_lock = threading.Lock()
 
-# Kafka setup
-consumer = create_consumer(settings.kafka_bootstrap, settings.consumer_group)
-consumer.subscribe([settings.topic_video_submitted])
-producer = KafkaProducer(settings.kafka_bootstrap)
+job_states = JobStateWriter(SessionLocal, inflight=lambda: _active_jobs)
+scratch = ScratchManager()
+
+# Kafka clients are created in main() so that job processes, which import
+# this module under the spawn start method, never open connections
+consumer = None
+producer = None
 
 _running = True
 
@@ -40,59 +60,149 @@ def handle_signal(signum, frame):
     logger.info("Received signal %s, shutting down...", signum)
     _running = False
 
-signal.signal(signal.SIGINT, handle_signal)
-signal.signal(signal.SIGTERM, handle_signal)
 
+# Process pool for the CPU-heavy stages (concurrent mode only)
+_job_pool: Optional[ProcessPoolExecutor] = None
+_job_pool_lock = threading.Lock()
+
+
+def _init_job_process():
+    # The parent drains in-flight jobs on SIGINT/SIGTERM; children must not die first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    warmup_face_model()
+
+
+def _get_job_pool() -> ProcessPoolExecutor:
+    global _job_pool
+    with _job_pool_lock:
+        if _job_pool is None:
+            _job_pool = ProcessPoolExecutor(
+                max_workers=settings.worker_concurrency,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_job_process,
+            )
+        return _job_pool
+
+
+def _reset_job_pool(broken: ProcessPoolExecutor) -> None:
+    global _job_pool
+    with _job_pool_lock:
+        if _job_pool is broken:
+            _job_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
 
-def update_job_status(db, job: Job, status: str, error: Optional[str] = None, artifacts: Optional[dict] = None):
-    job.status = status
-    if error:
-        job.error_message = (error[:2000] if error else None)
-    if artifacts:
-        try:
-            job.artifacts_json = json.dumps(artifacts)
-        except Exception:
-            pass
-    job.updated_at = datetime.utcnow()
-    db.add(job)
-    db.commit()
+
+def run_job(job_id: str, s3_url: str, content_type: Optional[str] = None, job_dir: Optional[str] = None,
+            near_dup_scope: Optional[str] = None):
+    kwargs = {"content_type": content_type, "job_dir": job_dir, "near_dup_scope": near_dup_scope}
+    if settings.worker_concurrency <= 1:
+        return process_job(job_id, s3_url, **kwargs)
+    pool = _get_job_pool()
+    try:
+        return pool.submit(process_job, job_id, s3_url, **kwargs).result()
+    except BrokenProcessPool:
+        # A job process died (OOM, segfault in a native lib); start a fresh pool
+        _reset_job_pool(pool)
+        raise
 
 
 def process_message(payload: dict):
+    global _active_jobs
+    with _active_lock:
+        _active_jobs += 1
+    metrics.INFLIGHT.inc()
+    t0 = time.monotonic()
+    outcome = "failed"
+    try:
+        outcome = _handle_message(payload)
+    finally:
+        with _active_lock:
+            _active_jobs -= 1
+        metrics.INFLIGHT.dec()
+        metrics.JOBS.labels(outcome).inc()
+        metrics.JOB_SECONDS.labels(outcome).observe(time.monotonic() - t0)
+    if settings.content_cache_enabled:
+        maybe_evict(SessionLocal)
+
+
+def _handle_message(payload: dict) -> str:
+    # Returns the outcome label for metrics
     job_id = payload.get("job_id")
     s3_url = payload.get("s3_url")
     if not job_id or not s3_url:
         logger.warning("Invalid message payload: %s", payload)
-        return
+        return "invalid"
 
-    db = SessionLocal()
+    db = None
     try:
-        job: Job | None = db.execute(select(Job).where(Job.job_id == job_id)).scalar_one_or_none()
-        if not job:
-            # Create a minimal placeholder if job table not written yet (shouldn't happen)
-            job = Job(job_id=job_id, status="submitted", s3_url=s3_url)
-            db.add(job)
+        claim = job_states.claim(job_id, s3_url)
+        if not claim.claimed:
+            logger.info("Job %s is terminal or publish_failed, skipping", job_id)
+            return "skipped"
+
+        # Byte-identical input the same submitter already had preprocessed: reuse its artifacts
+        content_sha256 = payload.get("content_sha256") or claim.content_sha256
+        scope = cache_scope(claim.user_id) if settings.content_cache_enabled else None
+        if content_sha256 and scope:
+            db = SessionLocal()
+            cached = lookup_artifacts(db, scope, content_sha256)
             db.commit()
-            db.refresh(job)
+            if cached is not None:
+                artifacts_dict = dict(cached, job_id=job_id, dedup_of=cached.get("job_id"))
+                job_states.preprocessed(job_id, artifacts_dict)
+                producer.publish(settings.topic_video_preprocessed, {"job_id": job_id, "artifacts": artifacts_dict}, key=job_id)
+                logger.info("Job %s reused artifacts of job %s", job_id, artifacts_dict["dedup_of"])
+                return "cached"
 
-        if job.status in ("preprocessed", "failed"):
-            logger.info("Job %s already in terminal state %s, skipping", job_id, job.status)
-            return
+        # Messages from older producers carry no content_type; the job row has it
+        content_type = payload.get("content_type") or claim.content_type or "video"
+        logger.info("Preprocessing %s job %s from %s", content_type, job_id, s3_url)
 
-        update_job_status(db, job, "preprocessing")
-        logger.info("Preprocessing job %s from %s", job_id, s3_url)
+        # Near-duplicates are only looked up among, and indexed for, the same scope
+        dup_scope = cache_scope(claim.user_id) if settings.near_dup_mode != "off" else None
 
-        artifacts, metadata = process_job(job_id, s3_url)
+        # Scratch space is reserved before any work and freed once the artifacts are uploaded
+        file_size = payload.get("file_size_bytes") or head_object(s3_url)[0]
+        with scratch.job_dir(job_id, file_size) as job_dir:
+            artifacts, metadata = run_job(job_id, s3_url, content_type, job_dir, near_dup_scope=dup_scope)
+        metrics.observe_timing(metadata.get("timing"))
+        outcome = "preprocessed"
 
-        artifacts_dict = {
-            "job_id": job_id,
-            "video": artifacts.video_s3,
-            "audio": artifacts.audio_s3,
-            "frames": artifacts.frames_s3,
-            "metadata": artifacts.metadata_s3,
-        }
+        if artifacts is None:
+            # Near-duplicate of an earlier video: its artifacts stand in
+            reused = metadata["reused"]
+            artifacts_dict = dict(reused["artifacts"], job_id=job_id, near_duplicate_of=reused["job_id"])
+            logger.info("Job %s is a near-duplicate of job %s", job_id, reused["job_id"])
+            outcome = "near_duplicate"
+        else:
+            artifacts_dict = {
+                "job_id": job_id,
+                "content_type": content_type,
+                "frames": artifacts.frames_s3,
+                "metadata": artifacts.metadata_s3,
+            }
+            # Images have no video or audio track
+            if artifacts.video_s3:
+                artifacts_dict["video"] = artifacts.video_s3
+            if artifacts.audio_s3:
+                artifacts_dict["audio"] = artifacts.audio_s3
+            if artifacts.frames_shard_s3:
+                artifacts_dict["frames_shard"] = artifacts.frames_shard_s3
+                artifacts_dict["frames_index"] = artifacts.frames_index_s3
+            if metadata.get("near_duplicates"):
+                artifacts_dict["near_duplicates"] = metadata["near_duplicates"]
 
-        update_job_status(db, job, "preprocessed", artifacts=artifacts_dict)
+            # Only videos go into the near-duplicate index (match ratios are per video)
+            index_hashes = dup_scope is not None and content_type == "video"
+            if (content_sha256 and scope) or index_hashes:
+                db = db or SessionLocal()
+                if content_sha256 and scope:
+                    store_artifacts(db, scope, content_sha256, s3_url, job_id, artifacts_dict)
+                if index_hashes:
+                    insert_hashes(db, dup_scope, job_id, from_hex(list(metadata["phash"].values())))
+                db.commit()
+        job_states.preprocessed(job_id, artifacts_dict)
 
         out_msg = {
             "job_id": job_id,
@@ -100,30 +210,182 @@ def process_message(payload: dict):
         }
         producer.publish(settings.topic_video_preprocessed, out_msg, key=job_id)
         logger.info("Job %s preprocessed successfully", job_id)
+        return outcome
 
     except Exception as e:
         logger.exception("Failed to preprocess job %s: %s", job_id, e)
+        if db is not None:
+            db.rollback()
         try:
             # Best-effort update
-            job = db.execute(select(Job).where(Job.job_id == job_id)).scalar_one_or_none()
-            if job:
-                update_job_status(db, job, "failed", error=str(e))
+            job_states.failed(job_id, str(e))
         except Exception:
-            db.rollback()
+            pass
+        return "failed"
     finally:
-        db.close()
+        if db is not None:
+            db.close()
 
 
-def main():
-    logger.info(
-        "Starting preprocessing worker. bootstrap=%s topic=%s group=%s",
-        settings.kafka_bootstrap,
-        settings.topic_video_submitted,
-        settings.consumer_group,
-    )
+def _decode(msg) -> Optional[dict]:
+    try:
+        return json.loads(msg.value().decode("utf-8"))
+    except Exception:
+        logger.error("Invalid JSON payload: %r", msg.value())
+        return None
+
+
+def run_serial(lanes: LaneScheduler):
+    # One job at a time, picked by the same weighted round-robin as concurrent
+    # mode (the scheduler has a single slot). Each lane buffers one polled
+    # message and its partitions are paused while it does; lanes keep arrival
+    # order, so committing a processed message never skips a buffered one.
+    paused: set = set()
     poll_timeout = 1.0
+    last_lag = 0.0
+
+    def on_revoke(c, partitions):
+        keys = [(tp.topic, tp.partition) for tp in partitions]
+        lanes.forget(keys)
+        paused.difference_update(keys)
+
+    def apply_backpressure():
+        assignment = consumer.assignment()
+        want = {(tp.topic, tp.partition) for tp in assignment if lanes.lane_for(tp.topic).pending}
+        to_pause = [tp for tp in assignment if (tp.topic, tp.partition) in want - paused]
+        to_resume = [tp for tp in assignment if (tp.topic, tp.partition) in paused - want]
+        if to_pause:
+            consumer.pause(to_pause)
+        if to_resume:
+            consumer.resume(to_resume)
+        paused.clear()
+        paused.update(want)
+
+    consumer.subscribe(lanes.topics(), on_revoke=on_revoke)
+
+    while _running:
+        if time.monotonic() - last_lag >= settings.metrics_lag_interval_s:
+            metrics.update_consumer_lag(consumer)
+            last_lag = time.monotonic()
+        apply_backpressure()
+
+        # Top up the other lanes before picking; block only when all are empty
+        msg = consumer.poll(0 if lanes.pending() else poll_timeout)
+        if msg is not None:
+            if msg.error():
+                if msg.error().code() != KafkaError._PARTITION_EOF:
+                    logger.error("Kafka consumer error: %s", msg.error())
+                continue
+            # Invalid payloads are buffered too and only committed in turn
+            lanes.push(msg, _decode(msg))
+            continue
+
+        picked = lanes.next()
+        if picked is None:
+            continue
+        lane, msg, payload = picked
+        try:
+            if payload is not None:
+                metrics.observe_queue_time(lane.name, msg)
+                process_message(payload)
+        finally:
+            lanes.done(lane)
+        # Commit after processing to avoid reprocessing
+        consumer.commit(message=msg, asynchronous=False)
+
+
+def run_concurrent(lanes: LaneScheduler):
+    # Jobs run on a bounded thread pool (DB, Kafka) that hands the CPU stages to
+    # a process pool. Polled messages wait in per-lane buffers until the lane
+    # scheduler gives them a job slot. Partitions are paused while they have
+    # too many jobs in flight or their lane's buffer is full, completions may
+    # arrive in any order, and offsets are committed asynchronously in batches
+    # once every earlier offset has finished.
+    tracker = OffsetTracker()
+    completions: "queue.Queue[tuple]" = queue.Queue()
+    jobs = ThreadPoolExecutor(max_workers=settings.worker_concurrency, thread_name_prefix="job")
+    paused: set = set()
+    commit_interval = settings.commit_interval_ms / 1000.0
+    last_commit = time.monotonic()
+    last_lag = 0.0
+
+    def drain_completions():
+        while True:
+            try:
+                topic, partition, offset, lane = completions.get_nowait()
+            except queue.Empty:
+                return
+            tracker.complete((topic, partition), offset)
+            lanes.done(lane)
+
+    def commit(asynchronous: bool):
+        offsets = [TopicPartition(t, p, off) for (t, p), off in tracker.take_commits()]
+        if not offsets:
+            return
+        try:
+            consumer.commit(offsets=offsets, asynchronous=asynchronous)
+        except Exception as e:
+            logger.warning("Offset commit failed: %s", e)
+
+    def on_revoke(c, partitions):
+        # Commit what has finished; jobs still running for these partitions
+        # complete but are not committed here and may be redelivered to the new
+        # owner, which skips jobs already in a terminal state.
+        drain_completions()
+        commit(asynchronous=False)
+        keys = [(tp.topic, tp.partition) for tp in partitions]
+        tracker.forget(keys)
+        lanes.forget(keys)
+        paused.difference_update(keys)
+
+    def apply_backpressure():
+        # A lane buffers at most WORKER_CONCURRENCY messages, so a backlog of
+        # large jobs never stops the small lane from being fetched
+        assignment = consumer.assignment()
+        want = {
+            (tp.topic, tp.partition)
+            for tp in assignment
+            if len(lanes.lane_for(tp.topic).pending) >= settings.worker_concurrency
+            or tracker.inflight((tp.topic, tp.partition)) >= settings.max_inflight_per_partition
+        }
+        to_pause = [tp for tp in assignment if (tp.topic, tp.partition) in want - paused]
+        to_resume = [tp for tp in assignment if (tp.topic, tp.partition) in paused - want]
+        if to_pause:
+            consumer.pause(to_pause)
+        if to_resume:
+            consumer.resume(to_resume)
+        paused.clear()
+        paused.update(want)
+
+    def dispatch():
+        while True:
+            picked = lanes.next()
+            if picked is None:
+                break
+            lane, msg, payload = picked
+            metrics.observe_queue_time(lane.name, msg)
+            fut = jobs.submit(process_message, payload)
+            fut.add_done_callback(
+                lambda _f, k=(msg.topic(), msg.partition(), msg.offset(), lane): completions.put(k)
+            )
+        for lane in lanes.lanes:
+            metrics.LANE_PENDING.labels(lane.name).set(len(lane.pending))
+            metrics.LANE_RUNNING.labels(lane.name).set(lane.running)
+
+    consumer.subscribe(lanes.topics(), on_revoke=on_revoke)
+
     while _running:
-        msg = consumer.poll(poll_timeout)
+        drain_completions()
+        dispatch()
+        apply_backpressure()
+        if time.monotonic() - last_commit >= commit_interval:
+            commit(asynchronous=True)
+            last_commit = time.monotonic()
+        if time.monotonic() - last_lag >= settings.metrics_lag_interval_s:
+            metrics.update_consumer_lag(consumer)
+            last_lag = time.monotonic()
+
+        msg = consumer.poll(0.1)
         if msg is None:
             continue
         if msg.error():
@@ -131,17 +393,66 @@ def main():
                 continue
             logger.error("Kafka consumer error: %s", msg.error())
             continue
-        try:
-            payload = json.loads(msg.value().decode("utf-8"))
-        except Exception:
-            logger.error("Invalid JSON payload: %r", msg.value())
-            consumer.commit(message=msg, asynchronous=False)
+
+        key = (msg.topic(), msg.partition())
+        tracker.add(key, msg.offset())
+        payload = _decode(msg)
+        if payload is None:
+            tracker.complete(key, msg.offset())
             continue
+        lanes.push(msg, payload)
+        dispatch()
 
-        process_message(payload)
-        # Commit after processing to avoid reprocessing
-        consumer.commit(message=msg, asynchronous=False)
+    # Graceful drain: stop fetching, let running jobs finish, commit. Buffered
+    # messages are not started; their offsets stay uncommitted and are redelivered.
+    logger.info("Draining %d running jobs...", lanes.running())
+    try:
+        consumer.pause(consumer.assignment())
+    except Exception:
+        pass
+    while lanes.running():
+        consumer.poll(0.2)  # keeps group membership alive while paused
+        drain_completions()
+    commit(asynchronous=False)
+    jobs.shutdown(wait=True)
+    if _job_pool is not None:
+        _job_pool.shutdown(wait=True)
+
+
+def main():
+    global consumer, producer
+    logger.info(
+        "Starting preprocessing worker. bootstrap=%s topic=%s group=%s concurrency=%d",
+        settings.kafka_bootstrap,
+        settings.topic_video_submitted,
+        settings.consumer_group,
+        settings.worker_concurrency,
+    )
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    check_artifact_format(settings.frame_artifact_format)
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        upgrade_schema(conn)
+    metrics.start_server()
+    scratch.start()
+
+    # Kafka setup
+    consumer = create_consumer(settings.kafka_bootstrap, settings.consumer_group)
+    producer = KafkaProducer(settings.kafka_bootstrap)
+
+    slots = max(1, settings.worker_concurrency)
+    lanes = LaneScheduler(parse_lanes(settings.worker_lanes), slots, settings.lane_reserved_slots)
+    logger.info("Lanes: %s", ", ".join(f"{l.name}={l.topic} (weight {l.weight})" for l in lanes.lanes))
+    if settings.worker_concurrency <= 1:
+        warmup_face_model()
+        run_serial(lanes)
+    else:
+        _get_job_pool()
+        run_concurrent(lanes)
 
+    job_states.close()
     logger.info("Flushing producer and closing consumer...")
     try:
         producer.flush()
@@ -0,0 +1,179 @@
+"""End-to-end process_job benchmark on synthetic inputs.
+
+Generates test videos with ffmpeg's testsrc (video) and sine (audio) sources,
+uploads them to a local S3 stand-in (moto in-process by default) and runs
+the full pipeline on each, followed by a publish through a stub producer.
+It reports per-stage wall time, CPU time (worker and ffmpeg children) and
+peak RSS, plus jobs/hour: per core from total CPU seconds, and per worker
+from wall time.
+
+The output is one JSON document (stdout or --out) so runs can be diffed:
+
+    python -m benchmarks.bench_pipeline --inputs 10x640x360,30x1280x720 --repeat 3 --out base.json
+    FUSED_DECODE=false python -m benchmarks.bench_pipeline --out legacy.json
+    S3_ENDPOINT_URL=http://localhost:9000 python -m benchmarks.bench_pipeline --endpoint-url
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+
+_BUCKET = "bench-pipeline"
+
+
+def _parse_inputs(spec: str) -> list:
+    # "10x640x360,30x1280x720" -> [(10.0, 640, 360), (30.0, 1280, 720)]
+    out = []
+    for item in spec.split(","):
+        seconds, width, height = item.strip().split("x")
+        out.append((float(seconds), int(width), int(height)))
+    return out
+
+
+def _make_input(tmp: str, seconds: float, width: int, height: int) -> str:
+    path = os.path.join(tmp, f"testsrc_{int(seconds)}s_{width}x{height}.mp4")
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"testsrc=size={width}x{height}:rate=30:duration={seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={seconds}",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-shortest", path,
+        ],
+        check=True,
+    )
+    return path
+
+
+class _StubProducer:
+    # Stands in for KafkaProducer.publish: serializes like the real one
+    def __init__(self) -> None:
+        self.bytes = 0
+
+    def publish(self, topic: str, value: dict, key: str = None) -> None:
+        self.bytes += len(json.dumps(value).encode("utf-8"))
+
+
+def _ffmpeg_version() -> str:
+    try:
+        out = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, check=True).stdout
+        return out.splitlines()[0]
+    except Exception:
+        return "unknown"
+
+
+def _summarize(runs: list) -> dict:
+    # Median over repeats, per stage and for the whole job
+    stages = {}
+    for name in runs[0]["stages"]:
+        stages[name] = {
+            metric: round(statistics.median(r["stages"][name][metric] for r in runs if name in r["stages"]), 4)
+            for metric in runs[0]["stages"][name]
+        }
+    wall = statistics.median(r["wall_s"] for r in runs)
+    cpu = statistics.median(r["cpu_s"] for r in runs)
+    return {
+        "stages": stages,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "peak_rss_mb": round(max(r["peak_rss_mb"] for r in runs), 1),
+        "jobs_per_hour_per_core": round(3600.0 / cpu, 1) if cpu > 0 else None,
+        "jobs_per_hour_per_worker": round(3600.0 / wall, 1) if wall > 0 else None,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--inputs", default="10x640x360,30x1280x720,60x1920x1080", help="SECONDSxWIDTHxHEIGHT,...")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--endpoint-url", action="store_true", help="use S3_ENDPOINT_URL instead of moto")
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    args = ap.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    if args.endpoint_url:
+        ctx = contextlib.nullcontext()
+    else:
+        from moto import mock_aws
+        ctx = mock_aws()
+
+    with ctx, tempfile.TemporaryDirectory(prefix="bench-pipeline-") as tmp:
+        from app.config import settings
+        from app.face_models import get_face_analyzer, warmup
+        from app.processor import process_job
+        from app.s3_utils import s3
+        from app.timing import StageTimer
+
+        settings.s3_bucket = _BUCKET
+        settings.work_dir = os.path.join(tmp, "work")
+        settings.near_dup_mode = "off"  # needs the jobs database
+        with contextlib.suppress(Exception):
+            s3.create_bucket(Bucket=_BUCKET)
+        warmup()
+        producer = _StubProducer()
+
+        results = []
+        for seconds, width, height in _parse_inputs(args.inputs):
+            src = _make_input(tmp, seconds, width, height)
+            key = f"bench/{os.path.basename(src)}"
+            s3.upload_file(src, _BUCKET, key)
+            s3_url = f"s3://{_BUCKET}/{key}"
+
+            runs = []
+            for _ in range(args.repeat):
+                timer = StageTimer()
+                job_id = f"bench-{uuid.uuid4()}"
+                t0 = time.perf_counter()
+                artifacts, metadata = process_job(job_id, s3_url, timer=timer)
+                with timer.stage("publish"):
+                    producer.publish("video.preprocessed", {"job_id": job_id, "artifacts": artifacts.__dict__}, key=job_id)
+                wall = time.perf_counter() - t0
+                stages = timer.as_dict()
+                runs.append({
+                    "stages": stages,
+                    "wall_s": wall,
+                    "cpu_s": sum(s["cpu_s"] + s["child_cpu_s"] for s in stages.values()),
+                    "peak_rss_mb": max(max(s["peak_rss_mb"], s["child_peak_rss_mb"]) for s in stages.values()),
+                    "frames": metadata["frames"]["count"],
+                })
+            results.append({
+                "input": {"seconds": seconds, "width": width, "height": height, "bytes": os.path.getsize(src)},
+                "frames": runs[0]["frames"],
+                **_summarize(runs),
+            })
+
+    report = {
+        "env": {
+            "python": platform.python_version(),
+            "ffmpeg": _ffmpeg_version(),
+            "cpus": os.cpu_count(),
+            "s3": "endpoint" if args.endpoint_url else "moto",
+            "face_model": get_face_analyzer() is not None,
+        },
+        "settings": {
+            k: getattr(settings, k)
+            for k in (
+                "fused_decode", "standardize_remux", "segment_transcode", "segment_max_workers", "frame_transport", "frame_artifact_format", "stream_input",
+                "frame_rate", "max_frames", "frame_sampling", "face_detect_sample", "face_detect_batch", "face_detect_mode",
+            )
+        },
+        "repeat": args.repeat,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Artifact upload wall time: serial upload_file loop vs s3_utils.upload_many.
+
+Uploads one job's worth of objects (video, audio, N frame JPEGs, metadata).
+By default S3 is moto's in-process mock with an artificial per-request
+round-trip delay; pass --endpoint-url to hit a real local S3 (minio, moto
+server) instead.
+
+    python -m benchmarks.bench_s3_upload --frames 120 --latency-ms 20
+    S3_ENDPOINT_URL=http://localhost:9000 python -m benchmarks.bench_s3_upload --endpoint-url
+"""
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+
+
+def _make_files(tmp: str, frames: int) -> tuple[list, list]:
+    def blob(name: str, size: int) -> str:
+        path = os.path.join(tmp, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    items = [(blob("standard.mp4", 8 * 1024 * 1024), "video/mp4"), (blob("audio.wav", 1024 * 1024), "audio/wav")]
+    items += [(blob(f"frame_{i:05d}.jpg", 20 * 1024), "image/jpeg") for i in range(1, frames + 1)]
+    items.append((blob("metadata.json", 64 * 1024), "application/json"))
+    return [p for p, _ in items], [ct for _, ct in items]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=120)
+    ap.add_argument("--latency-ms", type=float, default=20.0, help="simulated per-request RTT (moto only)")
+    ap.add_argument("--endpoint-url", action="store_true", help="use S3_ENDPOINT_URL instead of moto")
+    args = ap.parse_args()
+
+    if args.endpoint_url:
+        ctx = contextlib.nullcontext()
+    else:
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+        from moto import mock_aws
+
+        ctx = mock_aws()
+
+    with ctx, tempfile.TemporaryDirectory() as tmp:
+        from app.config import settings
+        from app import s3_utils
+
+        if not args.endpoint_url and args.latency_ms > 0:
+            delay = args.latency_ms / 1000.0
+            s3_utils.s3.meta.events.register("before-sign.s3.*", lambda **_: time.sleep(delay))
+        with contextlib.suppress(Exception):
+            s3_utils.s3.create_bucket(Bucket=settings.s3_bucket)
+
+        paths, cts = _make_files(tmp, args.frames)
+        keys = [f"bench/{os.path.basename(p)}" for p in paths]
+
+        t0 = time.perf_counter()
+        for p, k, ct in zip(paths, keys, cts):
+            s3_utils.upload_file(p, settings.s3_bucket, k, ct)
+        serial = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        s3_utils.upload_many(list(zip(paths, keys, cts)), settings.s3_bucket)
+        pooled = time.perf_counter() - t0
+
+    print(f"objects={len(paths)} concurrency={settings.s3_upload_concurrency} latency_ms={args.latency_ms}")
+    print(f"serial  {serial * 1000:8.1f} ms")
+    print(f"pooled  {pooled * 1000:8.1f} ms  x{serial / pooled:.2f}")
+
+
+if __name__ == "__main__":
+    main()
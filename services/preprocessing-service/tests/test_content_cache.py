@@ -0,0 +1,63 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.content_cache import ARTIFACT_SETTINGS, artifacts_version, lookup_artifacts
+from app.models import Base, ContentCache
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+def _entry(db, version, scope="user:1"):
+    db.add(ContentCache(
+        scope=scope, content_sha256="ab" * 32, source_s3_url="s3://bkt/src",
+        job_id="job-1", artifacts_json=json.dumps({"job_id": "job-1"}), artifacts_version=version,
+    ))
+    db.commit()
+
+
+@pytest.mark.parametrize("name, value", [
+    ("frame_sampling", "keyframes"),
+    ("frame_rate", 2.0),
+    ("max_frames", 60),
+    ("face_detect_mode", "track"),
+    ("frame_artifact_format", "raw"),
+])
+def test_version_follows_output_settings(monkeypatch, name, value):
+    assert name in ARTIFACT_SETTINGS
+    before = artifacts_version()
+    monkeypatch.setattr(settings, name, value)
+    assert artifacts_version() != before
+
+
+def test_version_ignores_other_settings(monkeypatch):
+    before = artifacts_version()
+    monkeypatch.setattr(settings, "worker_concurrency", 8)
+    monkeypatch.setattr(settings, "frame_transport", "jpeg")
+    assert artifacts_version() == before
+
+
+def test_lookup_serves_current_version(db):
+    _entry(db, artifacts_version())
+    assert lookup_artifacts(db, "user:1", "ab" * 32) == {"job_id": "job-1"}
+    assert lookup_artifacts(db, "user:2", "ab" * 32) is None
+
+
+def test_lookup_skips_entries_made_with_other_settings(db, monkeypatch):
+    _entry(db, artifacts_version())
+    monkeypatch.setattr(settings, "frame_sampling", "scene")
+    assert lookup_artifacts(db, "user:1", "ab" * 32) is None
+
+
+def test_lookup_skips_entries_without_version(db):
+    _entry(db, None)
+    assert lookup_artifacts(db, "user:1", "ab" * 32) is None
@@ -0,0 +1,115 @@
+import pytest
+
+from app.lanes import LaneScheduler, parse_lanes
+
+
+class _Message:
+    def __init__(self, topic, partition=0, offset=0):
+        self._topic, self._partition, self._offset = topic, partition, offset
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+
+def _scheduler(spec="small:3,large:1", slots=1, reserved=1, backlog=20):
+    lanes = LaneScheduler(parse_lanes(spec), slots, reserved)
+    for lane in lanes.lanes:
+        for offset in range(backlog):
+            lanes.push(_Message(lane.topic, offset=offset), {"job_id": f"{lane.name}-{offset}"})
+    return lanes
+
+
+def _run_one(lanes):
+    lane, msg, payload = lanes.next()
+    lanes.done(lane)
+    return lane.name
+
+
+def test_parse_lanes():
+    small, large = parse_lanes(" small:3, large ")
+    assert (small.name, small.weight) == ("small", 3)
+    assert (large.name, large.weight) == ("large", 1)
+    with pytest.raises(ValueError):
+        parse_lanes("small,huge")
+    with pytest.raises(ValueError):
+        parse_lanes(" , ")
+
+
+def test_smooth_weighted_round_robin():
+    lanes = _scheduler()
+    picks = [_run_one(lanes) for _ in range(8)]
+    # 3:1, interleaved rather than in runs
+    assert picks == ["small", "small", "large", "small"] * 2
+
+
+def test_lanes_keep_arrival_order():
+    lanes = _scheduler()
+    offsets = {"small": [], "large": []}
+    for _ in range(12):
+        lane, msg, payload = lanes.next()
+        lanes.done(lane)
+        offsets[lane.name].append(msg.offset())
+    assert offsets == {"small": list(range(9)), "large": list(range(3))}
+
+
+def test_idle_lane_does_not_bank_credit():
+    lanes = _scheduler(backlog=0)
+    large = lanes.lanes[1]
+    for offset in range(3):
+        lanes.push(_Message(large.topic, offset=offset), {})
+    assert [_run_one(lanes) for _ in range(3)] == ["large"] * 3
+    small = lanes.lanes[0]
+    for offset in range(4):
+        lanes.push(_Message(small.topic, offset=offset), {})
+        lanes.push(_Message(large.topic, offset=3 + offset), {})
+    # large ran alone, yet gets no head start once small has work
+    assert [_run_one(lanes) for _ in range(4)] == ["small", "small", "large", "small"]
+
+
+def test_slots_limit_running_jobs():
+    lanes = _scheduler(slots=2, reserved=0)
+    assert lanes.next() is not None
+    assert lanes.next() is not None
+    assert lanes.next() is None
+    assert lanes.running() == 2
+
+
+def test_reserved_slot_is_kept_for_the_first_lane():
+    lanes = _scheduler(slots=3, reserved=1, backlog=0)
+    small, large = lanes.lanes
+    for offset in range(5):
+        lanes.push(_Message(large.topic, offset=offset), {})
+    assert lanes.next()[0] is large
+    assert lanes.next()[0] is large
+    assert lanes.next() is None  # the last slot waits for small jobs
+    lanes.push(_Message(small.topic), {})
+    assert lanes.next()[0] is small
+
+
+def test_single_slot_serves_every_lane():
+    # Serial mode: one slot, one reserved; the other lanes still get it
+    lanes = _scheduler(spec="small:1,large:1", slots=1, reserved=1, backlog=0)
+    lanes.push(_Message(lanes.lanes[1].topic), {})
+    lane, msg, payload = lanes.next()
+    assert lane.name == "large"
+    assert lanes.next() is None
+    lanes.done(lane)
+    assert lanes.running() == 0
+
+
+def test_forget_drops_revoked_partitions():
+    lanes = LaneScheduler(parse_lanes("small:1,large:1"), 1, 0)
+    small, large = lanes.lanes
+    lanes.push(_Message(small.topic, partition=0), {})
+    lanes.push(_Message(small.topic, partition=1), {})
+    lanes.push(_Message(large.topic, partition=0), {})
+    lanes.forget([(small.topic, 0)])
+    assert [msg.partition() for msg, _ in small.pending] == [1]
+    assert len(large.pending) == 1
+    assert lanes.pending() == 2
@@ -0,0 +1,64 @@
+from app.offsets import OffsetTracker
+
+P0 = ("video.submitted", 0)
+P1 = ("video.submitted", 1)
+
+
+def test_commits_wait_for_earlier_offsets():
+    tracker = OffsetTracker()
+    for offset in (10, 11, 12):
+        tracker.add(P0, offset)
+
+    tracker.complete(P0, 12)
+    tracker.complete(P0, 11)
+    assert tracker.take_commits() == []
+    assert tracker.inflight(P0) == 3
+
+    tracker.complete(P0, 10)
+    assert tracker.take_commits() == [(P0, 13)]
+    assert tracker.inflight(P0) == 0
+
+
+def test_commit_advances_to_first_unfinished_offset():
+    tracker = OffsetTracker()
+    for offset in (0, 1, 2, 3):
+        tracker.add(P0, offset)
+    tracker.complete(P0, 0)
+    tracker.complete(P0, 1)
+    tracker.complete(P0, 3)
+    assert tracker.take_commits() == [(P0, 2)]
+    # Nothing new to commit until offset 2 finishes
+    assert tracker.take_commits() == []
+    tracker.complete(P0, 2)
+    assert tracker.take_commits() == [(P0, 4)]
+
+
+def test_partitions_are_independent():
+    tracker = OffsetTracker()
+    tracker.add(P0, 5)
+    tracker.add(P1, 7)
+    tracker.add(P1, 8)
+    tracker.complete(P1, 7)
+    assert tracker.take_commits() == [(P1, 8)]
+    assert tracker.inflight() == 2
+    tracker.complete(P0, 5)
+    tracker.complete(P1, 8)
+    assert sorted(tracker.take_commits()) == [(P0, 6), (P1, 9)]
+
+
+def test_forget_drops_revoked_partitions():
+    tracker = OffsetTracker()
+    tracker.add(P0, 1)
+    tracker.add(P0, 2)
+    tracker.complete(P0, 1)
+    tracker.forget([P0])
+    assert tracker.take_commits() == []
+    assert tracker.inflight(P0) == 0
+    # A job of the revoked partition finishing late is ignored
+    tracker.complete(P0, 2)
+    assert tracker.take_commits() == []
+
+    # Reassigned later: tracking starts over
+    tracker.add(P0, 1)
+    tracker.complete(P0, 1)
+    assert tracker.take_commits() == [(P0, 2)]
@@ -0,0 +1,45 @@
+import imagehash
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.phash import from_hex, hamming, phash_batch, to_hex
+
+
+def _frames(count, height, width, seed=0):
+    # Blocky noise, upscaled: large smooth regions like real frames, plus
+    # edges that land between resampling taps
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, size=(count, max(1, height // 7), max(1, width // 7), 3), dtype=np.uint8)
+    return np.stack([np.asarray(Image.fromarray(f).resize((width, height), Image.NEAREST)) for f in coarse])
+
+
+@pytest.mark.parametrize("shape", [(32, 32), (224, 224), (90, 160), (480, 640), (17, 301)])
+def test_matches_imagehash_rgb(shape):
+    frames = _frames(8, *shape, seed=shape[0])
+    expected = [str(imagehash.phash(Image.fromarray(f))) for f in frames]
+    assert to_hex(phash_batch(frames)) == expected
+
+
+def test_matches_imagehash_grayscale():
+    frames = _frames(8, 120, 200, seed=3)[..., 0]
+    expected = [str(imagehash.phash(Image.fromarray(f))) for f in frames]
+    assert to_hex(phash_batch(frames)) == expected
+
+
+def test_batch_larger_than_resize_chunk():
+    frames = _frames(21, 64, 96, seed=5)
+    singles = [int(phash_batch(f[None])[0]) for f in frames]
+    assert phash_batch(frames).tolist() == singles
+
+
+def test_empty_batch():
+    assert phash_batch(np.empty((0, 32, 32, 3), dtype=np.uint8)).shape == (0,)
+
+
+def test_hex_round_trip_and_hamming():
+    hashes = phash_batch(_frames(4, 64, 64, seed=7))
+    assert from_hex(to_hex(hashes)).tolist() == hashes.tolist()
+    a = from_hex(["0000000000000000", "ffffffffffffffff", "00000000000000ff"])
+    b = from_hex(["0000000000000000", "0000000000000000", "000000000000000f"])
+    assert hamming(a, b).tolist() == [0, 64, 4]
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.models import Base
+from app.phash_index import insert_hashes, query
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+def _videos(count, frames, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 2**63, size=(count, frames), dtype=np.int64).view(np.uint64) | np.uint64(1 << 63)
+
+
+def _flip(hashes, bits):
+    out = hashes.copy()
+    for b in bits:
+        out ^= np.uint64(1 << b)
+    return out
+
+
+# Six bits spread over all four 16-bit chunks: no chunk matches exactly
+SPREAD = [1, 2, 17, 18, 33, 49]
+
+
+def test_finds_the_perturbed_video(db):
+    videos = _videos(30, 40)
+    for i, v in enumerate(videos):
+        insert_hashes(db, "user:1", f"job-{i}", v)
+    db.commit()
+
+    matches = query(db, "user:1", _flip(videos[7], [3, 20, 40, 60]), radius=6)
+    assert matches[0]["job_id"] == "job-7"
+    assert matches[0]["matched_frames"] == 40
+    assert matches[0]["ratio"] == 1.0
+
+
+def test_short_query_without_exact_chunk_hits(db, monkeypatch):
+    # Found only through the near probes of the sampled frames
+    videos = _videos(10, 5, seed=1)
+    for i, v in enumerate(videos):
+        insert_hashes(db, "user:1", f"job-{i}", v)
+    db.commit()
+    q = _flip(videos[4], SPREAD)
+
+    assert query(db, "user:1", q, radius=6)[0]["job_id"] == "job-4"
+    monkeypatch.setattr(settings, "near_dup_probe_frames", 0)
+    assert query(db, "user:1", q, radius=6) == []
+
+
+def test_radius_is_exact(db):
+    videos = _videos(2, 10, seed=2)
+    insert_hashes(db, "user:1", "job-0", videos[0])
+    db.commit()
+    assert query(db, "user:1", _flip(videos[0], SPREAD + [50]), radius=6) == []
+    assert query(db, "user:1", _flip(videos[0], SPREAD + [50]), radius=7)[0]["job_id"] == "job-0"
+
+
+def test_coverage_both_ways(db):
+    videos = _videos(1, 40, seed=3)
+    insert_hashes(db, "user:1", "long", videos[0])
+    db.commit()
+    match = query(db, "user:1", videos[0][:10], radius=6)[0]
+    assert match["query_coverage"] == 1.0
+    assert match["candidate_coverage"] == 0.25
+    assert match["ratio"] == 0.25
+
+
+def test_excludes_own_job_and_blank_frames(db):
+    videos = _videos(1, 10, seed=4)
+    insert_hashes(db, "user:1", "job-0", videos[0])
+    blank = np.zeros(10, dtype=np.uint64)
+    assert insert_hashes(db, "user:1", "blank", blank) == 0
+    db.commit()
+    assert query(db, "user:1", videos[0], radius=6, exclude_job_id="job-0") == []
+    assert query(db, "user:1", blank, radius=6) == []
+
+
+def test_other_scopes_are_invisible(db):
+    videos = _videos(2, 10, seed=5)
+    insert_hashes(db, "user:1", "mine", videos[0])
+    insert_hashes(db, "user:2", "theirs", videos[1])
+    db.commit()
+    assert [m["job_id"] for m in query(db, "user:1", videos[0], radius=6)] == ["mine"]
+    assert query(db, "user:1", videos[1], radius=6) == []
+    assert query(db, "user:3", videos[0], radius=6) == []
@@ -0,0 +1,42 @@
+import pytest
+
+from app.config import settings
+from app.processor import should_remux
+
+STANDARD = {"video_codec": "h264", "pix_fmt": "yuv420p", "width": 1280, "height": 720, "fps": 30.0}
+
+
+@pytest.fixture(autouse=True)
+def remux_settings(monkeypatch):
+    monkeypatch.setattr(settings, "standardize_remux", True)
+    monkeypatch.setattr(settings, "remux_max_fps", 30.0)
+
+
+def test_standard_profile_is_remuxed():
+    assert should_remux(STANDARD)
+    assert should_remux(dict(STANDARD, width=640, fps=24.0))
+    assert should_remux(dict(STANDARD, fps=29.97))
+    assert should_remux(dict(STANDARD, fps=30.005))  # rounding in the probed rate
+
+
+@pytest.mark.parametrize("change", [
+    {"video_codec": "hevc"},
+    {"pix_fmt": "yuv444p"},
+    {"pix_fmt": "yuv420p10le"},
+    {"width": 1920},
+    {"width": 0},
+    {"fps": 60.0},
+    {"fps": 0},
+])
+def test_other_sources_are_transcoded(change):
+    assert not should_remux(dict(STANDARD, **change))
+
+
+def test_missing_probe_fields_are_transcoded():
+    assert not should_remux({"video_codec": "h264", "pix_fmt": "yuv420p"})
+    assert not should_remux({})
+
+
+def test_remux_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "standardize_remux", False)
+    assert not should_remux(STANDARD)
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from app.config import settings
+from app.scratch import ScratchManager, _Tier
+
+
+def _manager(tmpfs_budget=100, tmpfs_max_job=50, disk_budget=1000):
+    manager = ScratchManager()
+    manager._tiers = [
+        _Tier("tmpfs", "/dev/shm/preproc", tmpfs_budget, tmpfs_max_job),
+        _Tier("disk", "/work", disk_budget, 0),
+    ]
+    return manager
+
+
+def _reserve(tier, need):
+    tier.reserved += need
+    tier.jobs += 1
+
+
+def test_small_jobs_go_to_tmpfs():
+    manager = _manager()
+    assert manager._fit(40).name == "tmpfs"
+    assert manager._fit(50).name == "tmpfs"
+
+
+def test_jobs_over_the_tmpfs_job_limit_go_to_disk():
+    assert _manager()._fit(51).name == "disk"
+
+
+def test_full_tmpfs_spills_to_disk():
+    manager = _manager()
+    tmpfs, disk = manager._tiers
+    _reserve(tmpfs, 80)
+    assert manager._fit(20).name == "tmpfs"
+    assert manager._fit(21).name == "disk"
+
+
+def test_full_disk_waits():
+    manager = _manager()
+    tmpfs, disk = manager._tiers
+    _reserve(tmpfs, 100)
+    _reserve(disk, 900)
+    assert manager._fit(100).name == "disk"
+    assert manager._fit(101) is None
+    assert manager._fit(10).name == "disk"  # tmpfs is full
+
+
+def test_oversized_job_runs_alone_on_disk():
+    manager = _manager()
+    assert manager._fit(5000).name == "disk"
+    _reserve(manager._tiers[1], 5000)
+    assert manager._fit(5000) is None
+
+
+def test_disk_only_without_tmpfs():
+    manager = ScratchManager()
+    manager._tiers = [_Tier("disk", "/work", 1000, 0)]
+    assert manager._fit(10).name == "disk"
+
+
+def test_job_dir_reserves_and_cleans_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "work_dir", str(tmp_path / "work"))
+    monkeypatch.setattr(settings, "scratch_tmpfs_dir", "")
+    monkeypatch.setattr(settings, "scratch_budget_mb", 1024)
+    monkeypatch.setattr(settings, "scratch_size_factor", 3.0)
+    monkeypatch.setattr(settings, "scratch_job_overhead_mb", 128)
+    manager = ScratchManager()
+    manager.start()
+    disk = manager._tiers[-1]
+
+    with manager.job_dir("job-1", 10 * 1024 * 1024) as path:
+        assert path == os.path.join(settings.work_dir, "job-1")
+        os.makedirs(path)
+        (tmp_path / "work" / "job-1" / "source.mp4").write_bytes(b"x")
+        assert disk.jobs == 1
+        assert disk.reserved == manager.estimate(10 * 1024 * 1024) == (30 + 128) * 1024 * 1024
+    assert not os.path.exists(path)
+    assert (disk.jobs, disk.reserved) == (0, 0)
+
+    with pytest.raises(RuntimeError):
+        with manager.job_dir("job-2", 0):
+            raise RuntimeError("job failed")
+    assert (disk.jobs, disk.reserved) == (0, 0)
+
+
+def test_start_purges_stale_job_dirs(tmp_path, monkeypatch):
+    work = tmp_path / "work"
+    (work / "crashed-job").mkdir(parents=True)
+    (work / "crashed-job" / "standard.mp4").write_bytes(b"x")
+    (work / "stray.tmp").write_bytes(b"x")
+    monkeypatch.setattr(settings, "work_dir", str(work))
+    monkeypatch.setattr(settings, "scratch_tmpfs_dir", "")
+    monkeypatch.setattr(settings, "scratch_budget_mb", 1024)
+    ScratchManager().start()
+    assert os.listdir(work) == []
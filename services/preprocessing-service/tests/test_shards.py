@@ -0,0 +1,101 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.shards import (
+    FORMAT_JPEG,
+    FORMAT_RAW,
+    RAW_HEADER_BYTES,
+    check_artifact_format,
+    fetch_frame,
+    frame_range,
+    open_raw_shard,
+    read_frame,
+    write_jpeg_shard,
+    write_raw_shard,
+)
+
+
+def _pixels(count=5, height=12, width=20):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, size=(count, height, width, 3), dtype=np.uint8)
+
+
+def _local_range(path):
+    def get_range(s3_url, start, end):
+        with open(path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+    return get_range
+
+
+def test_raw_header_and_offsets(tmp_path):
+    pixels = _pixels()
+    path = str(tmp_path / "frames.raw")
+    index = write_raw_shard(path, [f"{i}.jpg" for i in range(5)], pixels)
+
+    assert index["format"] == FORMAT_RAW
+    assert index["count"] == 5 and index["shape"] == [12, 20, 3]
+    assert index["stride"] == 12 * 20 * 3
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data[:4] == b"DGFR"
+    assert len(data) == RAW_HEADER_BYTES + 5 * index["stride"]
+    start, end = frame_range(index, 3)
+    assert start == RAW_HEADER_BYTES + 3 * index["stride"]
+    assert data[start:end + 1] == pixels[3].tobytes()
+
+
+def test_raw_round_trip(tmp_path):
+    pixels = _pixels()
+    path = str(tmp_path / "frames.raw")
+    index = write_raw_shard(path, [f"{i}.jpg" for i in range(5)], pixels)
+
+    np.testing.assert_array_equal(open_raw_shard(path), pixels)
+    for i in range(5):
+        np.testing.assert_array_equal(read_frame(path, index, i), pixels[i])
+        np.testing.assert_array_equal(fetch_frame("s3://b/k", index, i, get_range=_local_range(path)), pixels[i])
+
+
+def test_raw_rejects_other_files(tmp_path):
+    path = tmp_path / "frames.raw"
+    path.write_bytes(b"\0" * (RAW_HEADER_BYTES + 16))
+    with pytest.raises(ValueError):
+        open_raw_shard(str(path))
+
+
+def test_jpeg_round_trip(tmp_path):
+    pixels = _pixels(count=4)
+    encoded = []
+    for frame in pixels:
+        buf = io.BytesIO()
+        Image.fromarray(frame).save(buf, format="JPEG", quality=90)
+        encoded.append(buf.getvalue())
+    path = str(tmp_path / "frames.jpgs")
+    index = write_jpeg_shard(path, [f"{i}.jpg" for i in range(4)], [lambda d=d: d for d in encoded])
+
+    assert index["format"] == FORMAT_JPEG
+    assert index["lengths"] == [len(d) for d in encoded]
+    assert index["offsets"] == [sum(len(d) for d in encoded[:i]) for i in range(4)]
+    for i, data in enumerate(encoded):
+        expected = np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+        np.testing.assert_array_equal(read_frame(path, index, i), expected)
+        np.testing.assert_array_equal(fetch_frame("s3://b/k", index, i, get_range=_local_range(path)), expected)
+
+
+def test_frame_range_bounds(tmp_path):
+    index = write_raw_shard(str(tmp_path / "frames.raw"), ["0.jpg"], _pixels(count=1))
+    with pytest.raises(IndexError):
+        frame_range(index, 1)
+    with pytest.raises(IndexError):
+        frame_range(index, -1)
+
+
+def test_artifact_format_is_validated():
+    for fmt in ("objects", "raw", "jpeg"):
+        assert check_artifact_format(fmt) == fmt
+    for fmt in ("shard", "RAW", ""):
+        with pytest.raises(ValueError, match="FRAME_ARTIFACT_FORMAT"):
+            check_artifact_format(fmt)
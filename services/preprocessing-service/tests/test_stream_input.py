@@ -0,0 +1,82 @@
+import struct
+
+import pytest
+
+from app import stream_input
+from app.config import settings
+
+_MB = 1024 * 1024
+
+
+def _box(kind: bytes, payload_len: int, largesize: bool = False) -> bytes:
+    if largesize:
+        return struct.pack(">I4sQ", 1, kind, 16 + payload_len) + b"\0" * payload_len
+    return struct.pack(">I4s", 8 + payload_len, kind) + b"\0" * payload_len
+
+
+FTYP = _box(b"ftyp", 16)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    # One fake object; records the ranged GETs made against it
+    obj = {"data": b"", "ranges": []}
+
+    def head_object(s3_url):
+        return len(obj["data"]), '"etag"'
+
+    def get_range(s3_url, start, end):
+        obj["ranges"].append((start, end))
+        return obj["data"][start:end + 1]
+
+    monkeypatch.setattr(stream_input, "head_object", head_object)
+    monkeypatch.setattr(stream_input, "get_range", get_range)
+    monkeypatch.setattr(settings, "stream_input_min_mb", 1)
+    monkeypatch.setattr(settings, "stream_probe_mb", 1)
+    return obj
+
+
+def test_faststart_is_streamed(s3):
+    s3["data"] = FTYP + _box(b"moov", 1000) + _box(b"mdat", 2 * _MB)
+    plan = stream_input.plan_stream("s3://b/k")
+    assert plan is not None
+    assert plan.size == len(s3["data"]) and plan.etag == '"etag"'
+    assert plan.head == s3["data"][:_MB]
+
+
+def test_moov_after_mdat_is_downloaded(s3):
+    s3["data"] = FTYP + _box(b"mdat", 2 * _MB) + _box(b"moov", 1000)
+    assert stream_input.plan_stream("s3://b/k") is None
+
+
+def test_boxes_past_the_head_are_fetched(s3):
+    # moov starts beyond the probed head: its header comes from a ranged GET
+    # and the head is extended to the end of moov for ffprobe
+    s3["data"] = FTYP + _box(b"free", _MB + 100) + _box(b"moov", 5000) + _box(b"mdat", _MB)
+    moov_end = len(FTYP) + 8 + _MB + 100 + 8 + 5000
+    plan = stream_input.plan_stream("s3://b/k")
+    assert plan is not None
+    assert plan.head == s3["data"][:moov_end]
+
+
+def test_largesize_box_is_skipped(s3):
+    s3["data"] = FTYP + _box(b"free", 64, largesize=True) + _box(b"moov", 1000) + _box(b"mdat", 2 * _MB)
+    assert stream_input.plan_stream("s3://b/k") is not None
+
+
+def test_truncated_box_table_is_downloaded(s3):
+    s3["data"] = FTYP + struct.pack(">I4s", 4, b"moov") + b"\0" * (2 * _MB)
+    assert stream_input.plan_stream("s3://b/k") is None
+
+
+def test_other_containers_only_stream_without_duration(s3):
+    s3["data"] = b"\x47" * (2 * _MB)  # MPEG-TS sync bytes
+    assert stream_input.plan_stream("s3://b/k") is None
+    plan = stream_input.plan_stream("s3://b/k", needs_duration=False)
+    assert plan is not None and plan.head == s3["data"][:_MB]
+
+
+def test_small_objects_are_downloaded(s3):
+    s3["data"] = FTYP + _box(b"moov", 1000) + _box(b"mdat", 1000)
+    assert stream_input.plan_stream("s3://b/k") is None
+    assert s3["ranges"] == []
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import httpx
+
+from .config import settings
+
+_MISSING = object()
+
+_http: Optional[httpx.AsyncClient] = None
+
+
+def http_client() -> httpx.AsyncClient:
+    # One pooled client for all calls to the auth service
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=settings.auth_http_timeout_s,
+            limits=httpx.Limits(
+                max_connections=settings.auth_http_max_connections,
+                max_keepalive_connections=settings.auth_http_max_connections,
+            ),
+        )
+    return _http
+
+
+async def close_http_client() -> None:
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+
+class TTLCache:
+    # Bounded LRU whose entries also expire; each entry carries its own TTL so
+    # positive and negative results can live for different times
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class SingleFlight:
+    # Concurrent misses for the same key share one in-flight call
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: one cancelled waiter must not cancel the call for the others
+        return await asyncio.shield(fut)
+
+
+class JwksCache:
+    # Public keys by kid. Keys older than JWKS_TTL_S are still served while a
+    # background refresh runs; an unknown kid (rotation) triggers a refresh
+    # right away, at most once per JWKS_MIN_REFRESH_INTERVAL_S so tokens with
+    # made-up kids cannot hammer the auth service.
+    def __init__(self, fetch: Callable[[], Awaitable[dict]], construct: Callable[[dict], Any]):
+        self._fetch = fetch
+        self._construct = construct
+        self._keys: Dict[str, Any] = {}
+        self._fetched_at = 0.0
+        self._attempted_at = float("-inf")
+        self._flight = SingleFlight()
+        self._background: Optional[asyncio.Task] = None
+
+    async def _refresh(self) -> None:
+        async def run():
+            self._attempted_at = time.monotonic()
+            jwks = await self._fetch()
+            self._keys = {k["kid"]: self._construct(k) for k in jwks.get("keys", []) if k.get("kid")}
+            self._fetched_at = time.monotonic()
+        await self._flight.do("jwks", run)
+
+    def _refresh_in_background(self) -> None:
+        if self._background is None or self._background.done():
+            self._background = asyncio.ensure_future(self._refresh())
+            # a failed background refresh keeps the stale keys
+            self._background.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def get(self, kid: Optional[str]) -> Any:
+        now = time.monotonic()
+        if not self._keys:
+            await self._refresh()
+        elif kid not in self._keys:
+            if now - self._attempted_at >= settings.jwks_min_refresh_interval_s:
+                await self._refresh()
+        elif now - self._fetched_at >= settings.jwks_ttl_s:
+            self._refresh_in_background()
+        return self._keys.get(kid)
+
+
+async def cached(cache: TTLCache, flight: SingleFlight, key: Hashable, load: Callable[[], Awaitable[tuple[Any, float]]]) -> Any:
+    # Read-through helper: load() returns (value, ttl); ttl <= 0 skips caching
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    async def run():
+        value, ttl = await load()
+        if ttl > 0:
+            cache.put(key, value, ttl)
+        return value
+
+    return await flight.do(key, run)
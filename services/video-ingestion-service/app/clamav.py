@@ -0,0 +1,72 @@
+import asyncio
+import struct
+
+from .config import settings
+
+# clamd INSTREAM: length-prefixed chunks terminated by a zero-length chunk;
+# the verdict ("stream: OK", "stream: <name> FOUND", "... ERROR") follows.
+# Anything but OK or FOUND means the upload was not scanned: callers must
+# reject it (fail closed).
+_MAX_CHUNK = 1024 * 1024
+_SIZE_LIMIT_REPLY = "INSTREAM size limit exceeded"
+
+
+class ClamdStream:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._closed_by_server = False
+        self._failed = False
+
+    @classmethod
+    async def open(cls, host: str, port: int) -> "ClamdStream":
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), settings.clamav_timeout_s)
+        writer.write(b"zINSTREAM\0")
+        return cls(reader, writer)
+
+    async def send(self, data: bytes) -> None:
+        if self._closed_by_server or self._failed:
+            return
+        view = memoryview(data)
+        try:
+            for i in range(0, len(view), _MAX_CHUNK):
+                piece = view[i:i + _MAX_CHUNK]
+                self._writer.write(struct.pack("!L", len(piece)))
+                self._writer.write(piece)
+                await asyncio.wait_for(self._writer.drain(), settings.clamav_timeout_s)
+        except (BrokenPipeError, ConnectionResetError):
+            # clamd hangs up once StreamMaxLength is exceeded; its reply
+            # is still readable in finish()
+            self._closed_by_server = True
+        except (asyncio.TimeoutError, OSError):
+            self._failed = True  # reported by finish()
+
+    async def finish(self) -> str:
+        # Returns "OK", "FOUND", "LIMIT" (StreamMaxLength exceeded) or "ERROR"
+        # (no or unexpected reply: connection reset, timeout, clamd error)
+        if self._failed:
+            self.close()
+            return "ERROR"
+        try:
+            if not self._closed_by_server:
+                self._writer.write(struct.pack("!L", 0))
+                await self._writer.drain()
+            reply = await asyncio.wait_for(self._reader.readuntil(b"\0"), settings.clamav_timeout_s)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, OSError):
+            return "ERROR"
+        finally:
+            self.close()
+        text = reply.rstrip(b"\0").decode("utf-8", "replace").strip()
+        status = text.rsplit(" ", 1)[-1]
+        if status in ("OK", "FOUND"):
+            return status
+        return "LIMIT" if _SIZE_LIMIT_REPLY in text else "ERROR"
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+async def open_stream() -> ClamdStream | None:
+    if not settings.clamav_host:
+        return None
+    return await ClamdStream.open(settings.clamav_host, settings.clamav_port)
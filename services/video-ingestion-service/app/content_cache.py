@@ -0,0 +1,52 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from .config import settings
+from .models import ContentCache
+
+
+def cache_scope(user_id: Optional[int]) -> Optional[str]:
+    # Same rule as the preprocessing worker: entries are shared only between
+    # jobs of the same submitter unless CONTENT_CACHE_SCOPE=global.
+    # None: anonymous submissions neither read nor write the cache.
+    if settings.content_cache_scope == "global":
+        return "global"
+    return f"user:{user_id}" if user_id else None
+
+
+async def lookup_source(db, scope: str, content_sha256: str) -> Optional[str]:
+    # Returns the stored S3 object for identical content and bumps its recency
+    url = (await db.execute(
+        select(ContentCache.source_s3_url).where(
+            ContentCache.scope == scope, ContentCache.content_sha256 == content_sha256
+        )
+    )).scalar_one_or_none()
+    if url is not None:
+        await db.execute(
+            update(ContentCache)
+            .where(ContentCache.scope == scope, ContentCache.content_sha256 == content_sha256)
+            .values(last_used_at=datetime.utcnow(), hit_count=ContentCache.hit_count + 1)
+        )
+    return url
+
+
+async def register_source(db, scope: str, content_sha256: str, s3_url: str, size_bytes: int) -> None:
+    # Two identical uploads may race past lookup_source and both store their
+    # object; the first insert wins and the other job keeps using its own copy.
+    now = datetime.utcnow()
+    await db.execute(
+        insert(ContentCache)
+        .values(
+            scope=scope,
+            content_sha256=content_sha256,
+            source_s3_url=s3_url,
+            size_bytes=size_bytes,
+            hit_count=0,
+            created_at=now,
+            last_used_at=now,
+        )
+        .on_conflict_do_nothing(index_elements=[ContentCache.scope, ContentCache.content_sha256])
+    )
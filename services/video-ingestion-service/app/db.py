@@ -0,0 +1,27 @@
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from .config import settings
+from .models import Base, upgrade_schema
+
+
+def _async_url(url: str) -> str:
+    # DATABASE_URL is shared with the sync services; pick the async driver
+    if url.startswith("postgresql://"):
+        return "postgresql+psycopg://" + url[len("postgresql://"):]
+    return url
+
+
+engine = create_async_engine(
+    _async_url(settings.db_url),
+    pool_pre_ping=True,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout_s,
+)
+SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
+async def init_models() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
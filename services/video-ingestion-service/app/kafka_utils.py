@@ -1,6 +1,8 @@
 from confluent_kafka import Producer
 from typing import Any
 import json
+import threading
+import time
 
 class KafkaProducer:
     def __init__(self, bootstrap: str):
@@ -17,5 +19,42 @@ class KafkaProducer:
         self._producer.produce(topic=topic, key=key, value=payload)
         self._producer.poll(0)
 
+    def publish_many(self, messages: list[tuple[str, str | None, dict[str, Any]]], timeout: float = 30.0) -> list[str | None]:
+        # Queues every (topic, key, value), then waits for this batch's own
+        # delivery reports; flush() would also wait on other requests' messages.
+        # Returns one error string (or None) per message, in order.
+        errors: list[str | None] = [None] * len(messages)
+        pending = set(range(len(messages)))
+        delivered = threading.Event()
+
+        def on_delivery(i):
+            # Runs on whichever thread polls the shared producer
+            def cb(err, msg):
+                if err is not None:
+                    errors[i] = str(err)
+                pending.discard(i)
+                if not pending:
+                    delivered.set()
+            return cb
+
+        for i, (topic, key, value) in enumerate(messages):
+            payload = json.dumps(value).encode('utf-8')
+            while True:
+                try:
+                    self._producer.produce(topic=topic, key=key, value=payload, on_delivery=on_delivery(i))
+                    break
+                except BufferError:
+                    # local queue full: serve delivery reports to make room
+                    self._producer.poll(0.1)
+        deadline = time.monotonic() + timeout
+        while pending and not delivered.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._producer.poll(min(remaining, 0.1))
+        for i in list(pending):
+            errors[i] = "delivery_timeout"
+        return errors
+
     def flush(self):
         self._producer.flush()
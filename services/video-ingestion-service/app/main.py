@@ -1,28 +1,24 @@
-from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Request
-from fastapi.responses import ORJSONResponse
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response
 from starlette.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from tempfile import SpooledTemporaryFile
-import io
-import os
-import json
+import asyncio
+import orjson
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import insert, update
 from typing import Optional
 
 from .config import settings
-from .models import Base, Job
-from .s3_utils import put_object, make_key
+from .db import SessionLocal, init_models
+from .models import Job
+from .s3_utils import make_key
 from .kafka_utils import KafkaProducer
 from .security import validate_jwt, verify_api_key, AuthError
-
-try:
-    import clamd
-except Exception:  # pragma: no cover
-    clamd = None  # type: ignore
-
-engine = create_engine(settings.db_url, pool_pre_ping=True)
-SessionLocal = sessionmaker(bind=engine)
-Base.metadata.create_all(bind=engine)
+from .auth_cache import close_http_client
+from .content_cache import cache_scope, lookup_source, register_source
+from .upload_stream import receive_upload
+from . import metrics
 
 producer = KafkaProducer(settings.kafka_bootstrap)
 
@@ -34,10 +30,33 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# Caps streaming uploads per process; each holds up to a few part buffers
+upload_slots = asyncio.Semaphore(settings.max_concurrent_uploads)
+
+@app.on_event("startup")
+async def startup():
+    await init_models()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_http_client()
+
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.REQUESTS.labels(getattr(route, "path", "unmatched"), str(response.status_code)).inc()
+    return response
+
 @app.get("/healthz")
 async def healthz():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 async def authorize(authorization: Optional[str], x_api_key: Optional[str]) -> dict:
     # Prefer JWT if present, otherwise API key
     if authorization:
@@ -48,66 +67,132 @@ async def authorize(authorization: Optional[str], x_api_key: Optional[str]) -> d
         return {"user_id": int(verified.get("user_id", 0)), "role": verified.get("role", "user")}
     raise HTTPException(status_code=401, detail="Unauthorized")
 
-async def scan_for_viruses(tmp: SpooledTemporaryFile) -> None:
-    if not clamd or not settings.clamav_host:
-        return
-    tmp.seek(0)
-    cd = clamd.ClamdNetworkSocket(settings.clamav_host, settings.clamav_port)
-    res = cd.instream(tmp)
-    status = res.get('stream', [None, None])[0]
-    if status == 'FOUND':
-        raise HTTPException(status_code=400, detail="malware_detected")
-    tmp.seek(0)
+def _json_job_fields(data: dict, defaults: Optional[dict] = None) -> dict:
+    # Job columns for a JSON submission; raises ValueError(<error code>)
+    defaults = defaults or {}
+    # Support both s3_url and file_url (must be s3://)
+    s3_url = data.get("s3_url") or data.get("file_url")
+    ct = data.get("content_type", defaults.get("content_type"))
+    md = data.get("metadata") or defaults.get("metadata") or {}
+    if not s3_url or not isinstance(s3_url, str) or not s3_url.startswith("s3://"):
+        raise ValueError("s3_url_required")
+    if ct and ct not in ("video", "image", "audio"):
+        raise ValueError("invalid_content_type")
+    file_name = md.get("file_name") if isinstance(md, dict) else None
+    file_size = md.get("file_size_bytes") if isinstance(md, dict) else None
+    # Checked against the column types here, so one bad item cannot fail a
+    # batch's multi-row INSERT
+    if file_name is not None and (not isinstance(file_name, str) or len(file_name) > 255):
+        raise ValueError("invalid_metadata")
+    if file_size is not None and (
+        not isinstance(file_size, int) or isinstance(file_size, bool) or not 0 <= file_size < 2**63
+    ):
+        raise ValueError("invalid_metadata")
+    return {
+        "s3_url": s3_url,
+        "content_type": ct,
+        "file_name": file_name,
+        "file_size_bytes": file_size,
+    }
+
+def _lane(content_type: Optional[str], file_size_bytes) -> str:
+    # Large videos queue apart so they never hold up small jobs; images, audio
+    # and sources of unknown size go to the small lane. As in the worker,
+    # anything but image/audio is a video (multipart uploads record the MIME
+    # major type, e.g. "application" for application/octet-stream).
+    if (
+        settings.lane_large_min_mb > 0
+        and content_type not in ("image", "audio")
+        and isinstance(file_size_bytes, (int, float))
+        and file_size_bytes >= settings.lane_large_min_mb * 1024 * 1024
+    ):
+        return "large"
+    return "small"
+
+def _lane_topic(lane: str) -> str:
+    return settings.topic_video_submitted_large if lane == "large" else settings.topic_video_submitted
+
+def _submitted_message(row: dict) -> dict:
+    msg = {"job_id": row["job_id"], "s3_url": row["s3_url"]}
+    if row.get("content_type"):
+        msg["content_type"] = row["content_type"]
+    return msg
 
 @app.post("/api/v1/detect")
 async def detect(
     request: Request,
-    file: UploadFile | None = File(default=None),
-    metadata: Optional[str] = Form(default=None),
-    content_type: Optional[str] = Form(default=None),
     authorization: Optional[str] = Header(default=None),
     x_api_key: Optional[str] = Header(default=None),
 ):
     # Auth
     try:
-        identity = await authorize(authorization, x_api_key)
+        with metrics.timed("detect", "auth"):
+            identity = await authorize(authorization, x_api_key)
     except AuthError:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     db = SessionLocal()
+    slot_held = False
     try:
         # Prepare job record
-        job = Job(status="submitted")
+        job = Job(job_id=str(uuid.uuid4()), status="submitted")
         job.user_id = identity.get("user_id")
 
-        # If multipart upload with file
+        # Multipart upload: streamed to S3 while it is received
         s3_url: Optional[str] = None
-        if file is not None:
-            # Enforce size limit by spooling to disk after 100MB
-            spooled: SpooledTemporaryFile = SpooledTemporaryFile(max_size=100 * 1024 * 1024)
-            total = 0
-            while True:
-                chunk = await file.read(1024 * 1024)
-                if not chunk:
-                    break
-                total += len(chunk)
-                if total > settings.max_upload_bytes:
-                    raise HTTPException(status_code=413, detail="file_too_large")
-                spooled.write(chunk)
-            spooled.seek(0)
-
-            # Optional AV scan
-            await scan_for_viruses(spooled)
-
-            # Upload to S3
-            filename = os.path.basename(file.filename or "upload.bin")
-            key = make_key(f"user-{job.user_id or 'anon'}", job.job_id, filename)
-            content_type_hdr = file.content_type or "application/octet-stream"
-            s3_url = put_object(spooled, settings.s3_bucket, key, content_type_hdr)
-
-            job.file_name = filename
-            job.file_size_bytes = total
-            job.content_type = (content_type or (file.content_type.split("/")[0] if file.content_type else None))
+        received = None
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            try:
+                await asyncio.wait_for(upload_slots.acquire(), settings.upload_queue_timeout_s)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail="upload_capacity_exhausted")
+            slot_held = True
+            metrics.INFLIGHT_UPLOADS.inc()
+            user_prefix = f"user-{job.user_id or 'anon'}"
+            with metrics.timed("detect", "receive"):
+                received = await receive_upload(request, lambda filename: make_key(user_prefix, job.job_id, filename))
+            if received.scan_status is not None:
+                metrics.observe("detect", "scan", received.scan_s)
+
+        if received is not None and received.upload is not None:
+            try:
+                if received.scan_status == "FOUND":
+                    raise HTTPException(status_code=400, detail="malware_detected")
+                # Not scanned: clamd's StreamMaxLength was exceeded, or clamd
+                # failed mid-stream. Rejected like a positive scan.
+                if received.scan_status == "LIMIT":
+                    raise HTTPException(status_code=400, detail="scan_size_limit_exceeded")
+                if received.scan_status == "ERROR":
+                    raise HTTPException(status_code=503, detail="scan_unavailable")
+                job.content_sha256 = received.content_sha256
+
+                # Keep the streamed object, unless the submitter already stored
+                # identical content. Every part has been sent by now: a hit
+                # saves the stored copy (and the worker's preprocessing), not
+                # the upload itself.
+                scope = cache_scope(job.user_id) if settings.content_cache_enabled else None
+                with metrics.timed("detect", "db"):
+                    s3_url = await lookup_source(db, scope, job.content_sha256) if scope else None
+                t0 = time.perf_counter()
+                if s3_url is None:
+                    s3_url = await received.upload.complete()
+                    metrics.observe("detect", "s3", received.s3_wait_s + time.perf_counter() - t0)
+                    metrics.UPLOAD_BYTES.labels("true").inc(received.size)
+                    if scope:
+                        with metrics.timed("detect", "db"):
+                            await register_source(db, scope, job.content_sha256, s3_url, received.size)
+                else:
+                    await received.upload.abort()
+                    metrics.observe("detect", "s3", received.s3_wait_s + time.perf_counter() - t0)
+                    metrics.UPLOAD_BYTES.labels("false").inc(received.size)
+            except BaseException:
+                await received.upload.abort()
+                raise
+
+            content_type = received.fields.get("content_type")
+            job.file_name = received.file_name
+            job.file_size_bytes = received.size
+            job.content_type = (content_type or (received.file_content_type.split("/")[0] if received.file_content_type else None))
             job.s3_url = s3_url
 
         else:
@@ -117,36 +202,158 @@ async def detect(
                     data = await request.json()
                 except Exception:
                     raise HTTPException(status_code=400, detail="invalid_json")
-                # Support both s3_url and file_url (must be s3://)
-                s3_url = data.get("s3_url") or data.get("file_url")
-                ct = data.get("content_type")
-                md = data.get("metadata") or {}
-                if not s3_url or not isinstance(s3_url, str) or not s3_url.startswith("s3://"):
-                    raise HTTPException(status_code=400, detail="s3_url_required")
-                if ct and ct not in ("video", "image", "audio"):
-                    raise HTTPException(status_code=400, detail="invalid_content_type")
-                job.content_type = ct
-                job.file_name = (md.get("file_name") if isinstance(md, dict) else None)
-                job.file_size_bytes = (md.get("file_size_bytes") if isinstance(md, dict) else None)
-                job.s3_url = s3_url
+                if not isinstance(data, dict):
+                    raise HTTPException(status_code=400, detail="invalid_json")
+                try:
+                    fields = _json_job_fields(data)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                for name, value in fields.items():
+                    setattr(job, name, value)
             else:
                 raise HTTPException(status_code=415, detail="multipart_or_json_required")
 
         # Persist job
-        db.add(job)
-        db.commit()
-        db.refresh(job)
+        with metrics.timed("detect", "db"):
+            db.add(job)
+            await db.commit()
 
         # Publish to Kafka
         payload = {"job_id": job.job_id, "s3_url": job.s3_url}
-        producer.publish(settings.topic_video_submitted, payload, key=job.job_id)
+        if job.content_type:
+            payload["content_type"] = job.content_type
+        if job.content_sha256:
+            payload["content_sha256"] = job.content_sha256
+        if received is not None:
+            # Measured while streaming; JSON metadata sizes are client-supplied
+            payload["file_size_bytes"] = received.size
+        lane = _lane(job.content_type, job.file_size_bytes)
+        with metrics.timed("detect", "kafka"):
+            producer.publish(_lane_topic(lane), payload, key=job.job_id)
+        metrics.JOBS.labels("detect", lane).inc()
 
         return {"job_id": job.job_id}
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        db.close()
\ No newline at end of file
+        if slot_held:
+            upload_slots.release()
+            metrics.INFLIGHT_UPLOADS.dec()
+        await db.close()
+
+@app.post("/api/v1/detect/batch")
+async def detect_batch(
+    request: Request,
+    authorization: Optional[str] = Header(default=None),
+    x_api_key: Optional[str] = Header(default=None),
+):
+    # Body: {"items": [<s3 url> | {"s3_url", "content_type", "metadata"}, ...],
+    #        "content_type": <default>, "metadata": <default>}
+    # Request-level problems (auth, body, size limits) fail the whole batch.
+    # An invalid item is rejected on its own and the rest are still submitted.
+    # Results come back in request order, each with a job_id or an error;
+    # a publish_failed item keeps its job row, in status "publish_failed".
+    try:
+        with metrics.timed("detect_batch", "auth"):
+            identity = await authorize(authorization, x_api_key)
+    except AuthError:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if not request.headers.get("content-type", "").startswith("application/json"):
+        raise HTTPException(status_code=415, detail="json_required")
+    if int(request.headers.get("content-length") or 0) > settings.batch_max_body_bytes:
+        raise HTTPException(status_code=413, detail="batch_too_large")
+    with metrics.timed("detect_batch", "receive"):
+        body = await request.body()
+    if len(body) > settings.batch_max_body_bytes:
+        raise HTTPException(status_code=413, detail="batch_too_large")
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="invalid_json")
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="items_required")
+    if len(items) > settings.batch_max_items:
+        raise HTTPException(status_code=413, detail="too_many_items")
+
+    defaults = {"content_type": data.get("content_type"), "metadata": data.get("metadata")}
+    results: list[dict] = []
+    rows: list[dict] = []
+    seen: set[str] = set()
+    now = datetime.utcnow()
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"s3_url": item}
+        if not isinstance(item, dict):
+            results.append({"index": index, "error": "invalid_item"})
+            continue
+        try:
+            fields = _json_job_fields(item, defaults)
+        except ValueError as e:
+            results.append({"index": index, "error": str(e)})
+            continue
+        if fields["s3_url"] in seen:
+            results.append({"index": index, "error": "duplicate_s3_url"})
+            continue
+        seen.add(fields["s3_url"])
+        job_id = str(uuid.uuid4())
+        rows.append({
+            **fields,
+            "job_id": job_id,
+            "status": "submitted",
+            "user_id": identity.get("user_id"),
+            "created_at": now,
+            "updated_at": now,
+        })
+        results.append({"index": index, "job_id": job_id})
+
+    if rows:
+        # One multi-row INSERT for the whole batch
+        async with SessionLocal() as db:
+            try:
+                with metrics.timed("detect_batch", "db"):
+                    await db.execute(insert(Job), rows)
+                    await db.commit()
+            except Exception as e:
+                await db.rollback()
+                raise HTTPException(status_code=500, detail=str(e))
+
+        # All messages queued, then their delivery reports awaited (off the event loop).
+        # Sizes here come from client metadata; they only pick the lane.
+        lanes = [_lane(r["content_type"], r["file_size_bytes"]) for r in rows]
+        with metrics.timed("detect_batch", "kafka"):
+            errors = await asyncio.to_thread(
+                producer.publish_many,
+                [(_lane_topic(lane), r["job_id"], _submitted_message(r)) for r, lane in zip(rows, lanes)],
+                settings.batch_publish_timeout_s,
+            )
+        failed = {r["job_id"] for r, err in zip(rows, errors) if err}
+        if failed:
+            # Workers do not claim publish_failed jobs, so a message that is still
+            # delivered late is skipped. A job a worker already claimed went through.
+            async with SessionLocal() as db:
+                try:
+                    marked = set((await db.execute(
+                        update(Job)
+                        .where(Job.job_id.in_(list(failed)), Job.status == "submitted")
+                        .values(status="publish_failed", updated_at=datetime.utcnow())
+                        .returning(Job.job_id)
+                    )).scalars())
+                    await db.commit()
+                    failed &= marked
+                except Exception:
+                    await db.rollback()  # rows stay "submitted"
+        for res in results:
+            if res.get("job_id") in failed:
+                res["error"] = "publish_failed"
+        for r, lane in zip(rows, lanes):
+            if r["job_id"] not in failed:
+                metrics.JOBS.labels("detect_batch", lane).inc()
+
+    accepted = sum(1 for r in results if "error" not in r)
+    return {"accepted": accepted, "rejected": len(results) - accepted, "items": results}
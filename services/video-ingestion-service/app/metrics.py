@@ -0,0 +1,36 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Per-process registry; with several uvicorn workers each one is scraped
+# separately (or PROMETHEUS_MULTIPROC_DIR is set for prometheus_client's
+# multiprocess mode).
+
+PHASE_SECONDS = Histogram(
+    "ingest_phase_seconds",
+    "Time spent per phase of a submission request",
+    ["endpoint", "phase"],  # auth | receive | scan | s3 | db | kafka
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+REQUESTS = Counter("ingest_requests_total", "HTTP requests by route and status", ["endpoint", "status"])
+JOBS = Counter("ingest_jobs_total", "Jobs submitted", ["endpoint", "lane"])
+UPLOAD_BYTES = Counter("ingest_upload_bytes_total", "Upload bytes received", ["stored"])  # stored=false on dedup hits
+INFLIGHT_UPLOADS = Gauge("ingest_inflight_uploads", "Streaming uploads in progress")
+
+
+@contextmanager
+def timed(endpoint: str, phase: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_SECONDS.labels(endpoint, phase).observe(time.perf_counter() - t0)
+
+
+def observe(endpoint: str, phase: str, seconds: float) -> None:
+    PHASE_SECONDS.labels(endpoint, phase).observe(seconds)
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,4 +1,4 @@
-from sqlalchemy import String, Integer, Text, DateTime, BigInteger
+from sqlalchemy import String, Integer, Text, DateTime, BigInteger, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from datetime import datetime
 import uuid
@@ -18,7 +18,41 @@ class Job(Base):
     s3_url: Mapped[str | None] = mapped_column(Text, nullable=True)
     file_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
     file_size_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    content_sha256: Mapped[str | None] = mapped_column(String(64), index=True, nullable=True)
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+# create_all only creates missing tables. Columns added to an existing table are
+# applied here, idempotently, on every startup (PostgreSQL DDL).
+SCHEMA_UPGRADES = (
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_content_sha256 ON jobs (content_sha256)",
+    "ALTER TABLE content_cache ADD COLUMN IF NOT EXISTS artifacts_version VARCHAR(16)",
+)
+
+
+def upgrade_schema(conn) -> None:
+    for statement in SCHEMA_UPGRADES:
+        conn.execute(text(statement))
+
+
+class ContentCache(Base):
+    # Content-addressed cache shared by ingestion and preprocessing: the stored
+    # source object for a SHA-256 and, once preprocessed, its artifacts, per
+    # scope (submitter)
+    __tablename__ = "content_cache"
+
+    scope: Mapped[str] = mapped_column(String(64), primary_key=True)  # content_cache.cache_scope: "user:<id>" or "global"
+    content_sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    source_s3_url: Mapped[str] = mapped_column(Text, nullable=False)
+    size_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    job_id: Mapped[str | None] = mapped_column(String(64), nullable=True)  # job whose artifacts are cached
+    artifacts_json: Mapped[str | None] = mapped_column(Text, nullable=True)
+    artifacts_version: Mapped[str | None] = mapped_column(String(16), nullable=True)  # settings the artifacts were made with (preprocessing content_cache.artifacts_version)
+    hit_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True, nullable=False)
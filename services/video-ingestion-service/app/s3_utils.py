@@ -1,11 +1,21 @@
+import asyncio
 import boto3
 from botocore.client import Config
+from concurrent.futures import ThreadPoolExecutor
 from .config import settings
 from datetime import datetime
 from urllib.parse import urljoin
 
 _session = boto3.session.Session(region_name=settings.aws_region)
-s3 = _session.client('s3', config=Config(s3={'addressing_style': 'path'}))
+s3 = _session.client('s3', endpoint_url=settings.s3_endpoint_url, config=Config(s3={'addressing_style': 'path'}, max_pool_connections=settings.s3_max_pool_connections))
+
+# boto3 is blocking; request handlers run its calls here rather than on the
+# event loop or the default executor shared with everything else
+_executor = ThreadPoolExecutor(max_workers=settings.s3_io_threads, thread_name_prefix="s3-io")
+
+
+async def run_s3(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
 
 
 def put_object(fileobj, bucket: str, key: str, content_type: str | None = None) -> str:
@@ -14,6 +24,34 @@ def put_object(fileobj, bucket: str, key: str, content_type: str | None = None)
     return f"s3://{bucket}/{key}"
 
 
+def put_bytes(body: bytes, bucket: str, key: str, content_type: str | None = None) -> str:
+    extra = {'ContentType': content_type} if content_type else {}
+    s3.put_object(Bucket=bucket, Key=key, Body=body, **extra)
+    return f"s3://{bucket}/{key}"
+
+
+def create_multipart_upload(bucket: str, key: str, content_type: str | None = None) -> str:
+    extra = {'ContentType': content_type} if content_type else {}
+    return s3.create_multipart_upload(Bucket=bucket, Key=key, **extra)['UploadId']
+
+
+def upload_part(bucket: str, key: str, upload_id: str, part_number: int, body: bytes) -> dict:
+    r = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body)
+    return {'PartNumber': part_number, 'ETag': r['ETag']}
+
+
+def complete_multipart_upload(bucket: str, key: str, upload_id: str, parts: list[dict]) -> str:
+    s3.complete_multipart_upload(
+        Bucket=bucket, Key=key, UploadId=upload_id,
+        MultipartUpload={'Parts': sorted(parts, key=lambda p: p['PartNumber'])},
+    )
+    return f"s3://{bucket}/{key}"
+
+
+def abort_multipart_upload(bucket: str, key: str, upload_id: str) -> None:
+    s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+
+
 def make_key(user_or_org: str, job_id: str, filename: str) -> str:
     ts = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
     return f"{settings.s3_prefix}/{user_or_org}/{job_id}/{ts}/{filename}"
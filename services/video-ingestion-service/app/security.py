@@ -1,34 +1,37 @@
 from jose import jwk, jwt
 from jose.utils import base64url_decode
-import httpx
+import hashlib
 from datetime import datetime, timezone
-from functools import lru_cache
 from typing import Any, Dict
 from .config import settings
+from .auth_cache import JwksCache, SingleFlight, TTLCache, cached, http_client
 
 class AuthError(Exception):
     pass
 
-@lru_cache(maxsize=1)
-def _jwks() -> Dict[str, Any]:
-    import requests
-    r = requests.get(settings.jwks_url, timeout=5)
+async def _fetch_jwks() -> Dict[str, Any]:
+    r = await http_client().get(settings.jwks_url)
     r.raise_for_status()
     return r.json()
 
+_jwks = JwksCache(_fetch_jwks, jwk.construct)
+
+# Verified API keys by SHA-256 of the key; rejected keys are cached briefly
+# too so a bad key in a retry loop does not reach the auth service each time
+_api_keys = TTLCache(settings.api_key_cache_max_entries)
+_api_key_flight = SingleFlight()
+
 async def validate_jwt(auth_header: str) -> dict:
     if not auth_header or not auth_header.startswith("Bearer "):
         raise AuthError("missing_token")
     token = auth_header.split(" ", 1)[1]
     header = jwt.get_unverified_header(token)
     kid = header.get("kid")
-    keys = _jwks().get("keys", [])
-    key = next((k for k in keys if k.get("kid") == kid), None)
-    if not key:
+    public_key = await _jwks.get(kid)
+    if public_key is None:
         raise AuthError("unknown_kid")
     message, encoded_sig = token.rsplit(".", 1)
     decoded_sig = base64url_decode(encoded_sig.encode())
-    public_key = jwk.construct(key)
     if not public_key.verify(message.encode(), decoded_sig):
         raise AuthError("bad_signature")
     claims = jwt.get_unverified_claims(token)
@@ -39,12 +42,20 @@ async def validate_jwt(auth_header: str) -> dict:
         raise AuthError("bad_issuer")
     return claims
 
-async def verify_api_key(api_key: str) -> dict:
-    import httpx
+async def _verify_api_key_remote(api_key: str) -> tuple[dict | None, float]:
     headers = {"X-Internal-Secret": settings.internal_secret}
     url = f"{settings.auth_service_base_url}/v1/api-keys/verify"
-    async with httpx.AsyncClient(timeout=5) as client:
-        r = await client.post(url, headers=headers, json={"api_key": api_key})
-        if r.status_code != 200:
-            raise AuthError("invalid_api_key")
-        return r.json()
+    r = await http_client().post(url, headers=headers, json={"api_key": api_key})
+    if r.status_code == 200:
+        return r.json(), settings.api_key_cache_ttl_s
+    if r.status_code in (401, 403, 404):
+        return None, settings.api_key_negative_ttl_s
+    # auth service trouble: fail this request, cache nothing
+    return None, 0
+
+async def verify_api_key(api_key: str) -> dict:
+    digest = hashlib.sha256(api_key.encode()).hexdigest()
+    verified = await cached(_api_keys, _api_key_flight, digest, lambda: _verify_api_key_remote(api_key))
+    if verified is None:
+        raise AuthError("invalid_api_key")
+    return verified
@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException, Request
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from .clamav import ClamdStream, open_stream
+from .config import settings
+from .s3_utils import (
+    abort_multipart_upload,
+    complete_multipart_upload,
+    create_multipart_upload,
+    put_bytes,
+    run_s3,
+    upload_part,
+)
+
+# Multipart form bodies are parsed straight off the request stream: file
+# bytes are hashed, streamed to clamd and cut into S3 multipart parts as they
+# arrive, so nothing is spooled to local disk and the object is complete
+# shortly after the last byte is received.
+
+
+class MultipartUpload:
+    # Parts go out on the S3 threads while the request keeps streaming; at most
+    # upload_max_inflight_parts are in flight. Uploads smaller than one part
+    # never start a multipart upload and are stored with a single PUT.
+    def __init__(self, bucket: str, key: str, content_type: Optional[str]):
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self._part_size = settings.upload_part_mb * 1024 * 1024
+        self._buf = bytearray()
+        self._upload_id: Optional[str] = None
+        self._next_part = 1
+        self._inflight: set = set()
+        self._parts: list[dict] = []
+        self._closed = False
+
+    async def write(self, data: bytes) -> None:
+        self._buf += data
+        while len(self._buf) >= self._part_size:
+            body = bytes(self._buf[:self._part_size])
+            del self._buf[:self._part_size]
+            await self._send_part(body)
+
+    async def _send_part(self, body: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = await run_s3(
+                create_multipart_upload, self.bucket, self.key, self.content_type
+            )
+        while len(self._inflight) >= settings.upload_max_inflight_parts:
+            await self._wait(asyncio.FIRST_COMPLETED)
+        task = asyncio.ensure_future(run_s3(
+            upload_part, self.bucket, self.key, self._upload_id, self._next_part, body
+        ))
+        self._next_part += 1
+        self._inflight.add(task)
+
+    async def _wait(self, return_when) -> None:
+        done, self._inflight = await asyncio.wait(self._inflight, return_when=return_when)
+        for task in done:
+            self._parts.append(task.result())
+
+    async def complete(self) -> str:
+        self._closed = True
+        if self._upload_id is None:
+            return await run_s3(put_bytes, bytes(self._buf), self.bucket, self.key, self.content_type)
+        if self._buf:
+            await self._send_part(bytes(self._buf))
+            self._buf.clear()
+        if self._inflight:
+            await self._wait(asyncio.ALL_COMPLETED)
+        url = await run_s3(
+            complete_multipart_upload, self.bucket, self.key, self._upload_id, self._parts
+        )
+        self._upload_id = None
+        return url
+
+    async def abort(self) -> None:
+        # Parts still uploading would outlive an early abort, so let them
+        # settle first
+        if self._closed and self._upload_id is None:
+            return
+        self._closed = True
+        self._buf.clear()
+        if self._inflight:
+            await asyncio.wait(self._inflight)
+            self._inflight = set()
+        if self._upload_id is not None:
+            upload_id, self._upload_id = self._upload_id, None
+            await run_s3(abort_multipart_upload, self.bucket, self.key, upload_id)
+
+
+@dataclass
+class ReceivedUpload:
+    fields: Dict[str, str] = field(default_factory=dict)
+    file_name: Optional[str] = None
+    file_content_type: Optional[str] = None
+    size: int = 0
+    content_sha256: Optional[str] = None
+    scan_status: Optional[str] = None  # OK | FOUND | LIMIT | ERROR, None when not scanned
+    scan_s: float = 0.0  # time spent waiting on clamd while receiving
+    s3_wait_s: float = 0.0  # time spent waiting on S3 part uploads while receiving
+    upload: Optional[MultipartUpload] = None
+
+
+class _FormStream:
+    # Parser callbacks only record what arrived; the async work happens in
+    # receive_upload after each request chunk is fed to the parser
+    def __init__(self):
+        self.headers: Dict[bytes, bytes] = {}
+        self.header_name = b""
+        self.header_value = b""
+        self.field_name: Optional[str] = None
+        self.is_file = False
+        self.field_data = bytearray()
+        self.file_chunks: list[bytes] = []
+        self.file_headers: Optional[Dict[bytes, bytes]] = None
+        self.fields: Dict[str, str] = {}
+        self.streaming = False  # current part is the upload being stored
+
+    def on_part_begin(self):
+        self.headers = {}
+        self.field_name = None
+        self.is_file = False
+        self.field_data = bytearray()
+        self.streaming = False
+
+    def on_header_field(self, data, start, end):
+        self.header_name += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_name.lower()] = self.header_value
+        self.header_name = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise HTTPException(status_code=400, detail="invalid_multipart")
+        self.field_name = options[b"name"].decode("utf-8", "replace")
+        self.is_file = b"filename" in options
+        # Only the first "file" part is stored; any other file part is dropped
+        if self.is_file and self.field_name == "file" and self.file_headers is None:
+            self.file_headers = dict(self.headers)
+            self.file_headers[b"filename"] = options[b"filename"]
+            self.streaming = True
+
+    def on_part_data(self, data, start, end):
+        if self.streaming:
+            self.file_chunks.append(data[start:end])
+        elif not self.is_file:
+            self.field_data += data[start:end]
+            if len(self.field_data) > 64 * 1024:
+                raise HTTPException(status_code=413, detail="field_too_large")
+
+    def on_part_end(self):
+        if not self.is_file and self.field_name is not None:
+            self.fields[self.field_name] = self.field_data.decode("utf-8", "replace")
+        self.streaming = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+
+async def receive_upload(request: Request, key_for: Callable[[str], str]) -> ReceivedUpload:
+    # Streams a multipart/form-data body. The returned upload is not yet
+    # committed: the caller completes it, or aborts it on a dedup hit or a
+    # positive scan. Failures while receiving abort it here.
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="invalid_multipart")
+
+    form = _FormStream()
+    parser = MultipartParser(boundary, form.callbacks())
+    out = ReceivedUpload()
+    hasher = hashlib.sha256()
+    scanner: Optional[ClamdStream] = None
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except MultipartParseError:
+                raise HTTPException(status_code=400, detail="invalid_multipart")
+            if out.upload is None and form.file_headers is not None:
+                filename = os.path.basename(form.file_headers[b"filename"].decode("utf-8", "replace") or "upload.bin")
+                ctype = form.file_headers.get(b"content-type")
+                out.file_name = filename
+                out.file_content_type = ctype.decode("latin-1") if ctype else None
+                out.upload = MultipartUpload(
+                    settings.s3_bucket, key_for(filename), out.file_content_type or "application/octet-stream"
+                )
+                try:
+                    scanner = await open_stream()
+                except (asyncio.TimeoutError, OSError):
+                    # CLAMAV_HOST is set but unreachable: nothing is accepted unscanned
+                    raise HTTPException(status_code=503, detail="scan_unavailable")
+            if not form.file_chunks:
+                continue
+            data = b"".join(form.file_chunks)
+            form.file_chunks.clear()
+            out.size += len(data)
+            if out.size > settings.max_upload_bytes:
+                raise HTTPException(status_code=413, detail="file_too_large")
+            hasher.update(data)
+            t0 = time.perf_counter()
+            if scanner is not None:
+                await scanner.send(data)
+            t1 = time.perf_counter()
+            await out.upload.write(data)
+            out.scan_s += t1 - t0
+            out.s3_wait_s += time.perf_counter() - t1
+        try:
+            parser.finalize()
+        except MultipartParseError:
+            raise HTTPException(status_code=400, detail="invalid_multipart")
+        out.fields = form.fields
+        if out.upload is not None:
+            out.content_sha256 = hasher.hexdigest()
+            if scanner is not None:
+                t0 = time.perf_counter()
+                out.scan_status = await scanner.finish()
+                out.scan_s += time.perf_counter() - t0
+                scanner = None
+        return out
+    except BaseException:
+        if scanner is not None:
+            scanner.close()
+        if out.upload is not None:
+            await out.upload.abort()
+        raise
@@ -0,0 +1,196 @@
+"""Request latency of /healthz and small uploads while large uploads stream.
+
+Runs two phases of equal length: probes alone, then probes alongside
+--large-clients clients that keep posting --large-mb uploads back to back.
+If no blocking I/O runs on the event loop, probe p99 stays flat between the
+two phases.
+
+By default it targets a running service (--url, --api-key). --local starts
+the app in a child process instead, against a moto S3 server, a SQLite
+database and a no-op Kafka producer and auth check, so only the request
+path is measured. Client, app and S3 each get their own process.
+
+    python -m benchmarks.load_ingest --local --large-mb 256 --large-clients 4
+    python -m benchmarks.load_ingest --url http://localhost:9000 --api-key $KEY
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+
+def _pct(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def _summary(values: list) -> dict:
+    return {"n": len(values), "p50_ms": _pct(values, 0.5), "p99_ms": _pct(values, 0.99), "max_ms": max(values, default=float("nan"))}
+
+
+def _serve_local(port: int, s3_port: int, tmp: str) -> None:
+    os.environ.update(
+        DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/ingest.db",
+        CONTENT_CACHE_ENABLED="false",
+        S3_ENDPOINT_URL=f"http://127.0.0.1:{s3_port}",
+        AWS_ACCESS_KEY_ID="bench",
+        AWS_SECRET_ACCESS_KEY="bench",
+    )
+    os.environ.pop("CLAMAV_HOST", None)
+    import uvicorn
+    from app import main
+    from app.s3_utils import s3
+
+    s3.create_bucket(Bucket=main.settings.s3_bucket)
+    main.producer.publish = lambda topic, value, key=None: None
+
+    async def _authorize(authorization, x_api_key):
+        return {"user_id": 1, "role": "user"}
+
+    main.authorize = _authorize
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _start_local(port: int) -> list:
+    tmp = tempfile.mkdtemp(prefix="load-ingest-")
+    s3_port = port + 1
+    procs = [subprocess.Popen(["moto_server", "-p", str(s3_port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+    _wait_http(f"http://127.0.0.1:{s3_port}/moto-api/")
+    procs.append(subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load_ingest", "--serve", str(port), str(s3_port), tmp],
+        stderr=subprocess.DEVNULL,
+    ))
+    _wait_http(f"http://127.0.0.1:{port}/healthz")
+    return procs
+
+
+def _wait_http(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def _multipart(size: int, mbps: float, chunk: int = 1024 * 1024):
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"large.mp4\"\r\n"
+        "Content-Type: video/mp4\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    block = os.urandom(chunk)
+
+    async def body():
+        # Paced like a remote client when mbps > 0
+        yield head
+        sent = 0
+        t0 = time.perf_counter()
+        while sent < size:
+            n = min(chunk, size - sent)
+            yield block[:n]
+            sent += n
+            if mbps > 0:
+                ahead = sent / (mbps * 1024 * 1024) - (time.perf_counter() - t0)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        yield tail
+
+    return f"multipart/form-data; boundary={boundary}", body
+
+
+async def _probe(client: httpx.AsyncClient, url: str, headers: dict, stop: asyncio.Event, interval: float, out: dict) -> None:
+    small = os.urandom(64 * 1024)
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        r = await client.get(f"{url}/healthz")
+        r.raise_for_status()
+        out["healthz"].append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        r = await client.post(f"{url}/api/v1/detect", headers=headers, files={"file": ("small.mp4", small, "video/mp4")})
+        r.raise_for_status()
+        out["small_upload"].append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def _large(client: httpx.AsyncClient, url: str, headers: dict, stop: asyncio.Event, size: int, mbps: float, out: list) -> None:
+    while not stop.is_set():
+        ctype, body = _multipart(size, mbps)
+        t0 = time.perf_counter()
+        r = await client.post(f"{url}/api/v1/detect", headers={**headers, "content-type": ctype}, content=body())
+        r.raise_for_status()
+        out.append((time.perf_counter() - t0) * 1000)
+
+
+async def _phase(url: str, headers: dict, seconds: float, probes: int, large_clients: int, large_mb: int, large_mbps: float) -> dict:
+    stop = asyncio.Event()
+    samples = {"healthz": [], "small_upload": []}
+    large: list = []
+    timeout = httpx.Timeout(600.0)
+    async with httpx.AsyncClient(timeout=timeout) as probe_client, httpx.AsyncClient(timeout=timeout) as large_client:
+        tasks = [asyncio.create_task(_probe(probe_client, url, headers, stop, 0.05, samples)) for _ in range(probes)]
+        tasks += [
+            asyncio.create_task(_large(large_client, url, headers, stop, large_mb * 1024 * 1024, large_mbps, large))
+            for _ in range(large_clients)
+        ]
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+    out = {name: _summary(v) for name, v in samples.items()}
+    if large_clients:
+        out["large_upload"] = _summary(large)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:9000")
+    ap.add_argument("--api-key", default=os.getenv("API_KEY", ""))
+    ap.add_argument("--local", action="store_true", help="serve the app against moto and SQLite in child processes")
+    ap.add_argument("--port", type=int, default=9100, help="port for --local")
+    ap.add_argument("--seconds", type=float, default=20.0, help="length of each phase")
+    ap.add_argument("--probes", type=int, default=2, help="concurrent probe clients")
+    ap.add_argument("--large-clients", type=int, default=4)
+    ap.add_argument("--large-mb", type=int, default=256)
+    ap.add_argument("--large-mbps", type=float, default=16.0, help="per-client send rate, 0 for unpaced")
+    ap.add_argument("--serve", nargs=3, help=argparse.SUPPRESS)  # child process of --local
+    args = ap.parse_args()
+
+    if args.serve:
+        _serve_local(int(args.serve[0]), int(args.serve[1]), args.serve[2])
+        return
+
+    url = args.url
+    procs = []
+    if args.local:
+        procs = _start_local(args.port)
+        url = f"http://127.0.0.1:{args.port}"
+    headers = {"x-api-key": args.api_key} if args.api_key else {}
+
+    try:
+        result = {
+            "idle": asyncio.run(_phase(url, headers, args.seconds, args.probes, 0, args.large_mb, args.large_mbps)),
+            "loaded": asyncio.run(_phase(url, headers, args.seconds, args.probes, args.large_clients, args.large_mb, args.large_mbps)),
+        }
+    finally:
+        for p in procs:
+            p.terminate()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+from app.clamav import ClamdStream
+from app.config import settings
+
+DATA = b"x" * (3 * 1024 * 1024 + 17)  # several INSTREAM chunks
+
+
+async def _read_chunk(reader):
+    (size,) = struct.unpack("!L", await reader.readexactly(4))
+    if size:
+        await reader.readexactly(size)
+    return size
+
+
+def _fake_clamd(mode):
+    # ok | found | limit: read the whole stream, then reply
+    # reset: hang up with a TCP reset after the first chunk
+    # silent: read the whole stream, close without a reply
+    async def handle(reader, writer):
+        assert await reader.readexactly(10) == b"zINSTREAM\0"
+        if mode == "reset":
+            await _read_chunk(reader)
+            sock = writer.get_extra_info("socket")
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            writer.transport.abort()
+            return
+        while await _read_chunk(reader):
+            pass
+        reply = {
+            "ok": b"stream: OK\0",
+            "found": b"stream: Eicar-Signature FOUND\0",
+            "limit": b"INSTREAM size limit exceeded. ERROR\0",
+            "silent": b"",
+        }[mode]
+        writer.write(reply)
+        await writer.drain()
+        writer.close()
+    return handle
+
+
+async def _scan(mode, data=DATA):
+    server = await asyncio.start_server(_fake_clamd(mode), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        stream = await ClamdStream.open("127.0.0.1", port)
+        await stream.send(data)
+        return await stream.finish()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.fixture(autouse=True)
+def short_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "clamav_timeout_s", 5.0)
+
+
+@pytest.mark.parametrize("mode, status", [
+    ("ok", "OK"),
+    ("found", "FOUND"),
+    ("limit", "LIMIT"),
+    ("silent", "ERROR"),
+])
+def test_verdicts(mode, status):
+    assert asyncio.run(_scan(mode)) == status
+
+
+def test_connection_reset_is_an_error():
+    # clamd going away mid-stream must not read as a clean scan
+    assert asyncio.run(_scan("reset")) == "ERROR"
+
+
+def test_unreachable_clamd_raises():
+    async def connect():
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        await ClamdStream.open("127.0.0.1", port)
+
+    with pytest.raises(OSError):
+        asyncio.run(connect())
@@ -0,0 +1,68 @@
+import pytest
+
+from app.config import settings
+from app.main import _json_job_fields, _lane
+
+
+def test_json_job_fields():
+    fields = _json_job_fields(
+        {"s3_url": "s3://bkt/a.mp4", "content_type": "video", "metadata": {"file_name": "a.mp4", "file_size_bytes": 123}}
+    )
+    assert fields == {"s3_url": "s3://bkt/a.mp4", "content_type": "video", "file_name": "a.mp4", "file_size_bytes": 123}
+
+
+def test_json_job_fields_defaults():
+    fields = _json_job_fields({"file_url": "s3://bkt/a.mp4"}, {"content_type": "audio", "metadata": {"file_name": "a"}})
+    assert fields["content_type"] == "audio"
+    assert fields["file_name"] == "a"
+    assert fields["file_size_bytes"] is None
+
+
+@pytest.mark.parametrize("data, error", [
+    ({}, "s3_url_required"),
+    ({"s3_url": "https://bkt/a.mp4"}, "s3_url_required"),
+    ({"s3_url": ["s3://bkt/a.mp4"]}, "s3_url_required"),
+    ({"s3_url": "s3://bkt/a", "content_type": "text"}, "invalid_content_type"),
+])
+def test_json_job_fields_rejects(data, error):
+    with pytest.raises(ValueError, match=error):
+        _json_job_fields(data)
+
+
+@pytest.mark.parametrize("metadata", [
+    {"file_name": "x" * 256},
+    {"file_name": {"a": 1}},
+    {"file_name": 12},
+    {"file_size_bytes": "123"},
+    {"file_size_bytes": 1.5},
+    {"file_size_bytes": True},
+    {"file_size_bytes": -1},
+    {"file_size_bytes": 2**63},
+])
+def test_metadata_must_fit_the_job_columns(metadata):
+    with pytest.raises(ValueError, match="invalid_metadata"):
+        _json_job_fields({"s3_url": "s3://bkt/a", "metadata": metadata})
+
+
+def test_metadata_at_the_column_limits():
+    fields = _json_job_fields({"s3_url": "s3://bkt/a", "metadata": {"file_name": "x" * 255, "file_size_bytes": 0}})
+    assert len(fields["file_name"]) == 255 and fields["file_size_bytes"] == 0
+
+
+@pytest.mark.parametrize("content_type, size, lane", [
+    ("video", 600 * 1024 * 1024, "large"),
+    (None, 600 * 1024 * 1024, "large"),
+    ("application", 2 * 1024**3, "large"),  # multipart upload sent as application/octet-stream
+    ("video", 1024, "small"),
+    ("video", None, "small"),
+    ("image", 600 * 1024 * 1024, "small"),
+    ("audio", 600 * 1024 * 1024, "small"),
+])
+def test_lane(monkeypatch, content_type, size, lane):
+    monkeypatch.setattr(settings, "lane_large_min_mb", 512)
+    assert _lane(content_type, size) == lane
+
+
+def test_single_lane_when_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "lane_large_min_mb", 0)
+    assert _lane("video", 2 * 1024**3) == "small"